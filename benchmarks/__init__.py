@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""benchmarks for :mod:`graypy`
+
+Each benchmark is a runnable module, e.g.::
+
+    python -m benchmarks.encoders
+"""
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare the GELF JSON encoders on representative log records"""
+
+import argparse
+import json
+import logging
+import sys
+import timeit
+
+from graypy.encoder import JSON_ENCODERS, get_json_encoder
+from graypy.handler import BaseGELFHandler
+
+
+def _make_record(msg, extra=None, exc_info=None):
+    record = logging.LogRecord(
+        "benchmark", logging.WARNING, __file__, 42, msg, (), exc_info, "func"
+    )
+    record.__dict__.update(extra or {})
+    return record
+
+
+def _exc_info():
+    try:
+        raise ValueError("benchmark")
+    except ValueError:
+        return sys.exc_info()
+
+
+RECORDS = {
+    "simple": _make_record("warning"),
+    "unicode": _make_record("Mensaje de registro espa\xf1ol €" * 4),
+    "extras": _make_record(
+        "request handled",
+        extra=dict(("field_%d" % i, "value %d" % i) for i in range(20)),
+    ),
+    "large": _make_record("x" * 8192),
+    "exception": _make_record("failed", exc_info=_exc_info()),
+}
+
+
+def run(number):
+    """Time the serialization of every representative record with every
+    available GELF JSON encoder
+
+    :return: Mapping of record kind to encoder name to mean microseconds
+        per serialization.
+    :rtype: dict
+    """
+    handler = BaseGELFHandler()
+    results = {}
+    for kind, record in sorted(RECORDS.items()):
+        gelf_dict = handler._make_gelf_dict(record)
+        results[kind] = {}
+        for name in sorted(JSON_ENCODERS):
+            json_encoder = get_json_encoder(name)
+            seconds = min(
+                timeit.repeat(
+                    lambda: handler._pack_gelf_dict(gelf_dict, json_encoder),
+                    number=number,
+                    repeat=3,
+                )
+            )
+            results[kind][name] = seconds / number * 1e6
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.encoders")
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+    names = sorted(JSON_ENCODERS)
+    print("%-10s" % "record" + "".join("%12s" % name for name in names))
+    for kind, timings in sorted(results.items()):
+        print("%-10s" % kind + "".join("%10.2fus" % timings[name] for name in names))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measure the memory allocated to convert log records into GELF logs"""
+
+import argparse
+import json
+import tracemalloc
+
+from graypy.handler import BaseGELFHandler
+
+from benchmarks.encoders import RECORDS
+
+
+def measure(handler, record):
+    """Measure the peak memory allocated by ``handler.makePickle(record)``
+
+    :return: Peak number of bytes allocated above the memory in use before
+        the conversion.
+    :rtype: int
+    """
+    handler.makePickle(record)  # warm up caches
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        handler.makePickle(record)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.memory")
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args(argv)
+
+    handler = BaseGELFHandler(compress=False)
+    results = dict(
+        (kind, {"peak_bytes": measure(handler, record)})
+        for kind, record in RECORDS.items()
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+    print("%-10s%14s" % ("record", "peak bytes"))
+    for kind, result in sorted(results.items()):
+        print("%-10s%14d" % (kind, result["peak_bytes"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Local GELF receivers counting the GELF logs and bytes sent to them
+
+Every sink listens on an ephemeral port of ``127.0.0.1`` from a background
+thread once entered as a context manager.
+"""
+
+import socket
+import ssl
+import struct
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import StreamRequestHandler, TCPServer, ThreadingMixIn
+
+try:
+    from amqp.serialization import decode_properties_basic, dumps
+except ImportError:
+    decode_properties_basic = dumps = None  # the amqp package is not installed
+
+from graypy.compression import decompress
+from graypy.handler import GELF_CHUNK_HEADER, GELF_CHUNK_MAGIC
+
+
+class BaseSink(object):
+    """Base of the local GELF receivers
+
+    :ivar messages: Number of complete GELF logs received.
+    :ivar bytes: Number of bytes received, including the transport framing.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.port = None
+        self._lock = threading.Lock()
+
+    def _received(self, messages, nbytes):
+        with self._lock:
+            self.messages += messages
+            self.bytes += nbytes
+
+    def reset(self):
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
+
+    def wait(self, messages, timeout=10.0):
+        """Wait until at least ``messages`` GELF logs were received
+
+        :return: :obj:`True` if they were received before the timeout
+            expired.
+        :rtype: bool
+        """
+        deadline = time.time() + timeout
+        while self.messages < messages:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class UDPSink(BaseSink):
+    """GELF UDP receiver reassembling chunked GELF logs"""
+
+    def __init__(self):
+        BaseSink.__init__(self)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # avoid losing datagrams to bursts of logs
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        header_size = GELF_CHUNK_HEADER.size
+        # number of chunks received by chunked GELF log id
+        chunks = {}
+        while not self._stopped.is_set():
+            try:
+                datagram = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            if datagram[:2] != GELF_CHUNK_MAGIC:
+                self._received(1, len(datagram))
+                continue
+            _, message_id, _, total = GELF_CHUNK_HEADER.unpack(datagram[:header_size])
+            received = chunks.get(message_id, 0) + 1
+            if received == total:
+                chunks.pop(message_id, None)
+                self._received(1, len(datagram))
+            else:
+                chunks[message_id] = received
+                self._received(0, len(datagram))
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.sock.close()
+
+
+class _ThreadingTCPServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TCPSink(BaseSink):
+    """GELF TCP receiver of null byte delimited GELF logs
+
+    :param ssl_context: If given, the connections are wrapped in TLS with
+        this server side context.
+    :type ssl_context: ssl.SSLContext or None
+    """
+
+    def __init__(self, ssl_context=None):
+        BaseSink.__init__(self)
+        sink = self
+
+        class RequestHandler(StreamRequestHandler):
+            def handle(self):
+                while True:
+                    data = self.connection.recv(65536)
+                    if not data:
+                        return
+                    sink._received(data.count(b"\x00"), len(data))
+
+        self.server = _ThreadingTCPServer(("127.0.0.1", 0), RequestHandler)
+        if ssl_context is not None:
+            self.server.socket = ssl_context.wrap_socket(
+                self.server.socket, server_side=True
+            )
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TLSSink(TCPSink):
+    """GELF TLS receiver
+
+    :param certfile: Path to the server certificate, e.g. generated with
+        ``tests/config/create_ssl_certs.sh``.
+    :type certfile: str
+
+    :param keyfile: Path to the server private key, if not stored with the
+        certificate.
+    :type keyfile: str or None
+    """
+
+    def __init__(self, certfile, keyfile=None):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        TCPSink.__init__(self, ssl_context=context)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class HTTPSink(BaseSink):
+    """GELF HTTP receiver answering every POST with ``202 Accepted``
+
+    Newline delimited batches of GELF logs are counted as several GELF logs.
+    """
+
+    def __init__(self):
+        BaseSink.__init__(self)
+        sink = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                # request line, headers and the blank line ending them
+                header_bytes = len(self.requestline) + len(str(self.headers)) + 4
+                # batches are newline delimited GELF logs
+                messages = decompress(body).count(b"\n") + 1
+                sink._received(messages, header_bytes + length)
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# type, channel and size of an AMQP frame
+_AMQP_FRAME = struct.Struct(">BHI")
+_AMQP_FRAME_END = b"\xce"
+_AMQP_METHOD_FRAME = 1
+_AMQP_HEADER_FRAME = 2
+_AMQP_BODY_FRAME = 3
+
+
+class AMQPSink(BaseSink):
+    """Minimal in-process AMQP 0-9-1 broker accepting every publish
+
+    It speaks just enough of the protocol for a publisher: the connection
+    handshake, channels, exchange declarations, publisher confirms and
+    publishes. Confirmed channels get one ``Basic.Ack`` with ``multiple`` set
+    for all the messages received at once.
+    """
+
+    def __init__(self):
+        if dumps is None:
+            raise RuntimeError("AMQPSink requires the amqp package")
+        BaseSink.__init__(self)
+        sink = self
+
+        class RequestHandler(StreamRequestHandler):
+            def send_method(self, channel, method, argsig="", args=()):
+                payload = struct.pack(">HH", *method) + dumps(argsig, args)
+                self.connection.sendall(
+                    _AMQP_FRAME.pack(_AMQP_METHOD_FRAME, channel, len(payload))
+                    + payload
+                    + _AMQP_FRAME_END
+                )
+
+            def handle(self):
+                # like RabbitMQ, do not delay the small confirm frames
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if self.rfile.read(8) != b"AMQP\x00\x00\x09\x01":
+                    return
+                self.send_method(
+                    0, (10, 10), "ooFSS", (0, 9, {}, "PLAIN AMQPLAIN", "en_US")
+                )
+                buffer = b""
+                # next delivery tag of the confirmed channels
+                confirmed = {}
+                # header and body parts of the message being published
+                content = {}
+                while True:
+                    data = self.connection.recv(65536)
+                    if not data:
+                        return
+                    buffer += data
+                    offset = 0
+                    acks = {}
+                    while len(buffer) - offset >= _AMQP_FRAME.size:
+                        kind, channel, size = _AMQP_FRAME.unpack_from(buffer, offset)
+                        end = offset + _AMQP_FRAME.size + size
+                        if len(buffer) <= end:
+                            break
+                        payload = buffer[offset + _AMQP_FRAME.size : end]
+                        offset = end + 1
+                        if kind == _AMQP_METHOD_FRAME:
+                            method = struct.unpack(">HH", payload[:4])
+                            if not self.on_method(channel, method, confirmed):
+                                return
+                            if method == (60, 40):
+                                content[channel] = [None, 0, []]
+                        elif kind == _AMQP_HEADER_FRAME:
+                            size = struct.unpack(">Q", payload[4:12])[0]
+                            properties = decode_properties_basic(payload, 12)[0]
+                            content[channel][:2] = [properties, size]
+                        elif kind == _AMQP_BODY_FRAME:
+                            content[channel][2].append(payload)
+                        message = content.get(channel)
+                        if message is None or message[0] is None:
+                            continue
+                        body = b"".join(message[2])
+                        if len(body) < message[1]:
+                            continue
+                        del content[channel]
+                        sink._received(1, len(body))
+                        if channel in confirmed:
+                            confirmed[channel] += 1
+                            acks[channel] = confirmed[channel]
+                    buffer = buffer[offset:]
+                    for channel, tag in acks.items():
+                        self.send_method(channel, (60, 80), "Lb", (tag, True))
+
+            def on_method(self, channel, method, confirmed):
+                """Answer a method, return :obj:`False` to close the
+                connection"""
+                if method == (10, 11):  # Connection.StartOk
+                    self.send_method(0, (10, 30), "BlB", (0, 131072, 0))
+                elif method == (10, 40):  # Connection.Open
+                    self.send_method(0, (10, 41), "s", ("",))
+                elif method == (10, 50):  # Connection.Close
+                    self.send_method(0, (10, 51))
+                    return False
+                elif method == (20, 10):  # Channel.Open
+                    self.send_method(channel, (20, 11), "S", ("",))
+                elif method == (20, 40):  # Channel.Close
+                    self.send_method(channel, (20, 41))
+                elif method == (40, 10):  # Exchange.Declare
+                    self.send_method(channel, (40, 11))
+                elif method == (85, 10):  # Confirm.Select
+                    confirmed[channel] = 0
+                    self.send_method(channel, (85, 11))
+                return True
+
+        self.server = _ThreadingTCPServer(("127.0.0.1", 0), RequestHandler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
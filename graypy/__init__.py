@@ -9,8 +9,19 @@ Graylog Extended Log Format (GELF).
 Modules:
  + :mod:`.handler` - Basic GELF Logging Handlers
  + :mod:`.rabbitmq` - RabbitMQ GELF Logging Handler
+ + :mod:`.sender` - Background Sending of GELF Logs
+ + :mod:`.encoder` - JSON Encoders of GELF Logs
+ + :mod:`.compression` - Compression Policies of GELF Logs
+ + :mod:`.reconnect` - Reconnection Backoff of the Stream Handlers
+ + :mod:`.spool` - On-disk Spooling of Unsent GELF Logs
+ + :mod:`.metrics` - Counters and Latency Histograms of the GELF Handlers
+ + :mod:`.aio` - asyncio GELF Logging Handlers
+ + :mod:`.balancer` - Load Balancing across Graylog Inputs
+ + :mod:`.resolver` - Cached DNS Resolution of the Graylog Inputs
 """
 
+import sys
+
 from graypy.handler import (
     GELFUDPHandler,
     GELFTCPHandler,
@@ -19,11 +30,26 @@ from graypy.handler import (
     WAN_CHUNK,
     LAN_CHUNK,
 )
+from graypy.sender import OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+from graypy.compression import CompressionPolicy
+from graypy.reconnect import Backoff, OUTAGE_DROP, OUTAGE_BUFFER
+from graypy.spool import DiskSpool
+from graypy.metrics import Metrics
+from graypy.balancer import GELFBalancingHandler
+from graypy.resolver import CachedResolver
+
+if sys.version_info >= (3, 7):
+    from graypy.aio import (
+        AsyncGELFUDPHandler,
+        AsyncGELFTCPHandler,
+        AsyncGELFTLSHandler,
+        AsyncGELFHTTPHandler,
+    )
 
 try:
     from graypy.rabbitmq import GELFRabbitHandler, ExcludeFilter
 except ImportError:
-    pass  # amqplib is probably not installed
+    pass  # amqp is probably not installed
 
 
 __version__ = (2, 1, 0)
@@ -0,0 +1,765 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""asyncio GELF handlers, for applications logging from an event loop
+
+The handlers of :mod:`.handler` write to their socket from the thread
+calling the logger, which stalls an event loop logging from coroutines.
+The handlers of this module only convert the log records into GELF logs and
+queue them: a task of the event loop writes them in batches through
+non-blocking asyncio transports.
+
+.. note::
+
+    This module requires python 3.7+.
+"""
+
+import abc
+import asyncio
+import collections
+import ssl
+import threading
+import time
+
+from graypy.handler import (
+    BATCH_MODES,
+    BATCH_NDJSON,
+    BATCH_SEQUENTIAL,
+    GELF_MAX_CHUNK_NUMBER,
+    BaseGELFHandler,
+    GELFHTTPError,
+    GELFTLSHandler,
+    GELFTruncatingChunker,
+    GELFUDPHandler,
+    GELFWarningChunker,
+)
+from graypy.metrics import clock
+from graypy.reconnect import Backoff
+from graypy.sender import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+
+#: Overflow policies of the queue of the asyncio handlers, which never block
+#: the logging caller
+ASYNC_OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+# errors of a broken connection, after which the handlers reconnect
+_CONNECTION_ERRORS = (OSError, EOFError, asyncio.TimeoutError)
+
+
+class BaseAsyncGELFHandler(BaseGELFHandler):
+    """Base of the asyncio GELF handlers
+
+    Log records are converted into GELF logs by the logging caller, like by
+    the other GELF handlers, then put in a queue of ``queue_size`` items.
+    A writer task, started on the event loop the first log record is
+    handled from (or by :meth:`start`), writes them by batches of up to
+    ``batch_size``. Log records can also be handled from other threads.
+
+    A lost connection is retried once right away, then with the delays of
+    the ``backoff`` policy while the queue fills up. When it is full the
+    ``overflow_policy`` drops the oldest or the newest GELF logs. The
+    writer task never gives up a batch until the handler is closed.
+
+    Await :meth:`aclose` (or :meth:`aflush`) before the event loop stops to
+    write the queued GELF logs: :meth:`close`, called by
+    :func:`logging.shutdown`, cannot wait for the event loop and drops them.
+
+    :ivar dropped: Number of GELF logs dropped because the queue was full or
+        the handler was closed.
+    """
+
+    def __init__(
+        self,
+        queue_size=10000,
+        overflow_policy=OVERFLOW_DROP_NEWEST,
+        batch_size=100,
+        backoff=None,
+        **kwargs
+    ):
+        """Initialize the BaseAsyncGELFHandler
+
+        :param queue_size: Maximum number of GELF logs waiting for the writer
+            task.
+        :type queue_size: int
+
+        :param overflow_policy: What to do with GELF logs when the queue is
+            full. ``"drop_oldest"`` or ``"drop_newest"``.
+        :type overflow_policy: str
+
+        :param batch_size: Maximum number of GELF logs written at once.
+        :type batch_size: int
+
+        :param backoff: :class:`.reconnect.Backoff` policy of the
+            reconnection attempts. Defaults to ``Backoff()``.
+        :type backoff: Backoff or None
+        """
+        if overflow_policy not in ASYNC_OVERFLOW_POLICIES:
+            raise ValueError(
+                "invalid overflow_policy (expected one of {}): {}".format(
+                    ASYNC_OVERFLOW_POLICIES, overflow_policy
+                )
+            )
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        BaseGELFHandler.__init__(self, **kwargs)
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.batch_size = batch_size
+        self.backoff = Backoff() if backoff is None else backoff
+        self.dropped = 0
+
+        self._queue = collections.deque()
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+        self._wakeup = None
+        self._idle = None
+        self._closing = False
+        # log records and GELF logs of the batch being written
+        self._batch = []
+        # whether the current connection was written to successfully
+        self._written = False
+        # GELF logs of the batch being written rejected by the server
+        self._rejected = 0
+
+    def start(self):
+        """Start the writer task on the running event loop
+
+        It is started on the first log record handled from an event loop
+        otherwise.
+
+        :raises RuntimeError: If no event loop is running in this thread or
+            the writer task is already started.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is not None:
+            raise RuntimeError("the writer task is already started")
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._task = loop.create_task(self._run())
+        self._loop_thread = threading.get_ident()
+        # set last, the other threads wake the writer task once it is set
+        self._loop = loop
+
+    def emit(self, record):
+        """Convert a :class:`logging.LogRecord` into a GELF log and queue it
+        for the writer task
+
+        :param record: :class:`logging.LogRecord` to convert into a GELF log
+            and queue.
+        :type record: logging.LogRecord
+        """
+        try:
+            item = self._make_item(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if item is not None:
+            self._put((record, item))
+
+    def _make_item(self, record):
+        """Convert a :class:`logging.LogRecord` into what the writer task
+        writes
+
+        :return: The queued GELF log, :obj:`None` to drop it.
+        """
+        return self.makePickle(record)
+
+    def _put(self, item):
+        queue = self._queue
+        if self._closing:
+            self.dropped += 1
+            return
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                return
+            try:
+                queue.popleft()
+            except IndexError:
+                pass  # drained meanwhile
+        queue.append(item)
+
+        loop = self._loop
+        if loop is None:
+            try:
+                self.start()
+            except RuntimeError:
+                # no running event loop, the GELF log waits for one
+                pass
+            return
+        wakeup = self._wakeup
+        if wakeup.is_set():
+            return
+        if threading.get_ident() == self._loop_thread:
+            wakeup.set()
+        else:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # the event loop is closed
+
+    async def _run(self):
+        queue = self._queue
+        wakeup = self._wakeup
+        try:
+            while True:
+                if not queue:
+                    self._idle.set()
+                    if self._closing:
+                        return
+                    wakeup.clear()
+                    # a GELF log may have been queued before clearing
+                    if not queue:
+                        await wakeup.wait()
+                    continue
+                self._idle.clear()
+                self._rejected = 0
+                self._batch = [
+                    queue.popleft() for _ in range(min(len(queue), self.batch_size))
+                ]
+                await self._write_batch(self._batch)
+        finally:
+            self.metrics.count("unsent", len(self._batch))
+            self.dropped += len(self._batch) + len(queue)
+            self._batch = []
+            queue.clear()
+            self._idle.set()
+            self._disconnect()
+
+    async def _write_batch(self, batch):
+        """Write a batch of GELF logs, reconnecting until it succeeds
+
+        :param batch: Log records and their GELF logs, removed by
+            :meth:`_write` once written when they are written one by one.
+        :type batch: list[tuple[logging.LogRecord, object]]
+        """
+        metrics = self.metrics
+        count = len(batch)
+        attempt = 0
+        while True:
+            start = clock()
+            try:
+                if not self._connected():
+                    self._disconnect()
+                    await self._connect()
+                    self._written = False
+                await self._write(batch)
+            except _CONNECTION_ERRORS:
+                written = self._written
+                self._disconnect()
+                if not written:
+                    await asyncio.sleep(self.backoff.delay(attempt))
+                    attempt += 1
+                # otherwise a connection which worked is retried right away,
+                # e.g. closed by the server while idle
+                continue
+            except asyncio.CancelledError:
+                # an Exception before python 3.8
+                raise
+            except Exception:
+                # e.g. a malformed response: the rest of the batch is
+                # dropped rather than written again, and the writer task
+                # keeps running
+                self._disconnect()
+                metrics.count("sent", count - len(batch) - self._rejected)
+                metrics.count("unsent", len(batch))
+                self._batch = []
+                self._handle_batch_error(batch)
+                return
+            # batches are always timed
+            metrics.timed("send", start)
+            metrics.count("sent", count - self._rejected)
+            self._written = True
+            self._batch = []
+            return
+
+    @abc.abstractmethod
+    def _connected(self):
+        """:obj:`True` if the connection can be written to"""
+        pass
+
+    @abc.abstractmethod
+    async def _connect(self):
+        pass
+
+    @abc.abstractmethod
+    async def _write(self, batch):
+        """Write a batch of log records and their GELF logs and count their
+        bytes in the ``metrics``, and the GELF logs rejected by the server
+        in ``_rejected``"""
+        pass
+
+    @abc.abstractmethod
+    def _disconnect(self):
+        pass
+
+    async def aflush(self):
+        """Wait for the queued GELF logs to be written
+
+        Must be awaited from the event loop of the writer task.
+        """
+        if self._task is None:
+            if not self._queue:
+                return
+            self.start()
+        if self._queue or self._batch:
+            self._idle.clear()
+            self._wakeup.set()
+        await self._idle.wait()
+
+    async def aclose(self, timeout=5):
+        """Write the queued GELF logs, then close the handler
+
+        Must be awaited from the event loop of the writer task.
+
+        :param timeout: Maximum number of seconds to wait for the queued
+            GELF logs to be written, the others are dropped. If :obj:`None`
+            wait until they are all written.
+        :type timeout: float or None
+        """
+        if self._task is None and self._queue and not self._closing:
+            self.start()
+        task = self._task
+        if task is not None and not task.done():
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(task, timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.close()
+
+    def close(self):
+        """Stop the writer task and close the connection
+
+        The GELF logs still queued are dropped, await :meth:`aclose` to
+        write them first.
+        """
+        self._closing = True
+        task = self._task
+        if task is not None and not task.done():
+            try:
+                if threading.get_ident() == self._loop_thread:
+                    task.cancel()
+                else:
+                    self._loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # the event loop is closed
+        elif self._queue:
+            self.dropped += len(self._queue)
+            self._queue.clear()
+        BaseGELFHandler.close(self)
+
+
+class AsyncGELFUDPHandler(BaseAsyncGELFHandler):
+    """asyncio GELF UDP handler
+
+    GELF logs are chunked by the logging caller, like by
+    :class:`.handler.GELFUDPHandler`, and the chunks are sent through an
+    :class:`asyncio.DatagramTransport`.
+    """
+
+    def __init__(self, host, port=12202, gelf_chunker=GELFWarningChunker(), **kwargs):
+        """Initialize the AsyncGELFUDPHandler
+
+        :param host: GELF UDP input host.
+        :type host: str
+
+        :param port: GELF UDP input port.
+        :type port: int
+
+        :param gelf_chunker: :class:`.handler.BaseGELFChunker` instance to
+            handle chunking larger GELF messages.
+        :type gelf_chunker: GELFWarningChunker
+        """
+        BaseAsyncGELFHandler.__init__(self, **kwargs)
+        self.host = host
+        self.port = port
+        self.gelf_chunker = gelf_chunker
+        self.transport = None
+
+    # GELF logs are chunked like by the GELFUDPHandler
+    _chunk = GELFUDPHandler._chunk
+
+    def _make_item(self, record):
+        """Convert a log record into the datagrams of its GELF log"""
+        s = self.makePickle(record)
+        chunker = self.gelf_chunker
+        if len(s) < chunker.chunk_size:
+            return [s]
+        gelf_dict = None
+        if (
+            isinstance(chunker, GELFTruncatingChunker)
+            and chunker._message_chunk_number(s) > GELF_MAX_CHUNK_NUMBER
+        ):
+            gelf_dict = self._make_gelf_dict(record)
+        return self._chunk(s, gelf_dict) or None
+
+    def _connected(self):
+        return self.transport is not None and not self.transport.is_closing()
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.host, self.port)
+        )
+
+    async def _write(self, batch):
+        transport = self.transport
+        sent_bytes = 0
+        for _, datagrams in batch:
+            for datagram in datagrams:
+                transport.sendto(datagram)
+                sent_bytes += len(datagram)
+        self.metrics.count("bytes", sent_bytes)
+
+    def _disconnect(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class AsyncGELFTCPHandler(BaseAsyncGELFHandler):
+    """asyncio GELF TCP handler
+
+    Every batch of null byte terminated GELF logs is written at once to an
+    :class:`asyncio.StreamWriter`.
+    """
+
+    def __init__(self, host, port=12201, timeout=5, **kwargs):
+        """Initialize the AsyncGELFTCPHandler
+
+        :param host: GELF TCP input host.
+        :type host: str
+
+        :param port: GELF TCP input port.
+        :type port: int
+
+        :param timeout: Maximum number of seconds to wait for a connection.
+        :type timeout: float
+        """
+        # GELF TCP does not support compression
+        kwargs["compress"] = False
+        BaseAsyncGELFHandler.__init__(self, **kwargs)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    def makePickle(self, record):
+        """Add a null terminator to generated pickles as TCP frame objects
+        need to be null terminated
+
+        :param record: :class:`logging.LogRecord` to create a null
+            terminated GELF log.
+        :type record: logging.LogRecord
+
+        :return: Null terminated bytes representing a GELF log.
+        :rtype: bytes
+        """
+        return super(AsyncGELFTCPHandler, self).makePickle(record) + b"\x00"
+
+    def _connected(self):
+        # the GELF input closing the connection is seen as the end of the
+        # stream
+        return (
+            self.writer is not None
+            and not self.writer.is_closing()
+            and not self.reader.at_eof()
+        )
+
+    def _open_connection(self):
+        return asyncio.open_connection(self.host, self.port)
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            self._open_connection(), self.timeout
+        )
+
+    async def _write(self, batch):
+        data = b"".join(frame for _, frame in batch)
+        self.writer.write(data)
+        await self.writer.drain()
+        self.metrics.count("bytes", len(data))
+
+    def _disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class AsyncGELFTLSHandler(AsyncGELFTCPHandler):
+    """asyncio GELF TCP handler with TLS support
+
+    .. note::
+
+        Unlike :class:`.handler.GELFTLSHandler` it does not resume the TLS
+        session of the previous connection, asyncio does not support it.
+    """
+
+    def __init__(
+        self,
+        host,
+        port=12204,
+        validate=False,
+        ca_certs=None,
+        certfile=None,
+        keyfile=None,
+        ssl_context=None,
+        **kwargs
+    ):
+        """Initialize the AsyncGELFTLSHandler
+
+        :param host: GELF TLS input host.
+        :type host: str
+
+        :param port: GELF TLS input port.
+        :type port: int
+
+        :param validate: If :obj:`True`, validate the Graylog server's
+            certificate. In this case specifying ``ca_certs`` is also
+            required.
+        :type validate: bool
+
+        :param ca_certs: Path to CA bundle file.
+        :type ca_certs: str
+
+        :param certfile: Path to the client certificate file.
+        :type certfile: str
+
+        :param keyfile: Path to the client private key. If the private key is
+            stored with the certificate, this parameter can be ignored.
+        :type keyfile: str
+
+        :param ssl_context: TLS configuration of the connections. If
+            specified, ``validate``, ``ca_certs``, ``certfile`` and
+            ``keyfile`` are ignored.
+        :type ssl_context: ssl.SSLContext or None
+        """
+        if validate and ca_certs is None:
+            raise ValueError("CA bundle file path must be specified")
+
+        if keyfile is not None and certfile is None:
+            raise ValueError("certfile must be specified")
+
+        AsyncGELFTCPHandler.__init__(self, host=host, port=port, **kwargs)
+
+        self.ca_certs = ca_certs
+        self.reqs = ssl.CERT_REQUIRED if validate else ssl.CERT_NONE
+        self.certfile = certfile
+        self.keyfile = keyfile if keyfile else certfile
+        self._ssl_context = ssl_context
+
+    @property
+    def ssl_context(self):
+        """TLS configuration shared by every connection, built like by
+        :class:`.handler.GELFTLSHandler` unless given to the constructor"""
+        if self._ssl_context is None:
+            self._ssl_context = GELFTLSHandler._make_ssl_context(self)
+        return self._ssl_context
+
+    def _open_connection(self):
+        return asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, server_hostname=self.host
+        )
+
+
+class AsyncGELFHTTPHandler(BaseAsyncGELFHandler):
+    """asyncio GELF HTTP handler
+
+    GELF logs are POSTed over a persistent HTTP/1.1 connection, by a
+    minimal HTTP client built on asyncio streams.
+    """
+
+    def __init__(
+        self,
+        host,
+        port=12203,
+        compress=True,
+        path="/gelf",
+        timeout=5,
+        idle_timeout=30,
+        batch_mode=BATCH_SEQUENTIAL,
+        batch_path=None,
+        **kwargs
+    ):
+        """Initialize the AsyncGELFHTTPHandler
+
+        :param host: GELF HTTP input host.
+        :type host: str
+
+        :param port: GELF HTTP input port.
+        :type port: int
+
+        :param compress: If :obj:`True` compress the GELF message before
+            sending it to the Graylog server. A
+            :class:`.compression.CompressionPolicy` can be given to tune
+            the compression.
+        :type compress: bool or CompressionPolicy
+
+        :param path: Path of the HTTP input.
+        :type path: str
+
+        :param timeout: Maximum number of seconds to wait for a connection
+            or a response.
+        :type timeout: float
+
+        :param idle_timeout: Number of seconds an unused persistent HTTP
+            connection is kept open before being replaced.
+        :type idle_timeout: float or None
+
+        :param batch_mode: ``"sequential"`` to send every GELF log in its own
+            request, back to back over the persistent HTTP connection, or
+            ``"ndjson"`` to send every batch in a single request of newline
+            delimited GELF logs.
+        :type batch_mode: str
+
+        :param batch_path: Path of the HTTP input accepting newline
+            delimited GELF logs. Defaults to ``path``.
+        :type batch_path: str or None
+        """
+        if batch_mode not in BATCH_MODES:
+            raise ValueError(
+                "invalid batch_mode (expected one of {}): {}".format(
+                    BATCH_MODES, batch_mode
+                )
+            )
+        BaseAsyncGELFHandler.__init__(self, compress=compress, **kwargs)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.headers = {}
+        self.batch_mode = batch_mode
+        self.batch_path = path if batch_path is None else batch_path
+        self.reader = None
+        self.writer = None
+        self._last_used = None
+        if ":" in host:
+            self._host_header = "[{}]:{}".format(host, port)
+        else:
+            self._host_header = "{}:{}".format(host, port)
+
+    def _make_item(self, record):
+        """Convert a log record into its ``(pickle, content_encoding)``, or
+        its uncompressed GELF log in ``"ndjson"`` mode as the whole batch is
+        compressed at once"""
+        if self.batch_mode == BATCH_NDJSON:
+            return self._pack_record(record)
+        return self._make_pickle(record)
+
+    def _connected(self):
+        if self.writer is None or self.writer.is_closing() or self.reader.at_eof():
+            return False
+        return (
+            self.idle_timeout is None
+            or time.time() - self._last_used < self.idle_timeout
+        )
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+
+    async def _write(self, batch):
+        if self.batch_mode == BATCH_NDJSON:
+            body = b"\n".join(packed for _, packed in batch)
+            content_encoding = None
+            if self.compression is not None:
+                metrics = self.metrics
+                start = clock()
+                body, content_encoding = self.compression.compress(body)
+                metrics.timed("compress", start)
+                if content_encoding is not None:
+                    metrics.count("compressed")
+            await self._request(self.batch_path, body, content_encoding)
+            return
+        written = 0
+        try:
+            for record, (body, content_encoding) in batch:
+                try:
+                    await self._request(self.path, body, content_encoding)
+                except GELFHTTPError:
+                    # dropped, the rest of the batch is still written
+                    self._rejected += 1
+                    self.metrics.count("unsent")
+                    self.handleError(record)
+                written += 1
+        finally:
+            # only the rest of the batch is written again after reconnecting
+            del batch[:written]
+
+    async def _request(self, path, body, content_encoding):
+        """POST a GELF log (or a NDJSON batch) and read the response"""
+        lines = [
+            "POST {} HTTP/1.1".format(path),
+            "Host: {}".format(self._host_header),
+            "Content-Length: {}".format(len(body)),
+        ]
+        if content_encoding is not None:
+            lines.append("Content-Encoding: {}".format(content_encoding))
+        lines.extend(
+            "{}: {}".format(name, value) for name, value in self.headers.items()
+        )
+        lines.append("\r\n")
+        self.writer.write("\r\n".join(lines).encode("latin-1"))
+        self.writer.write(body)
+        status, reason = await asyncio.wait_for(self._read_response(), self.timeout)
+        self._last_used = time.time()
+        self._written = True
+        if not 200 <= status < 300:
+            raise GELFHTTPError(status, reason)
+        self.metrics.count("bytes", len(body))
+
+    async def _read_response(self):
+        """Read a HTTP response
+
+        :return: The status code and reason phrase of the response.
+        :rtype: tuple[int, str]
+        """
+        reader = self.reader
+        await self.writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise EOFError("connection closed by the server")
+        version, status, reason = (
+            status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""]
+        )[:3]
+        will_close = version == "HTTP/1.0"
+        content_length = 0
+        chunked = False
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip().lower()
+            if name == "content-length":
+                content_length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                will_close = value == "close"
+        # the response must be fully read before the connection can be reused
+        if chunked:
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                # chunk data and CRLF, no trailers expected
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif content_length:
+            await reader.readexactly(content_length)
+        if will_close:
+            self._disconnect()
+        return int(status), reason
+
+    def _disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Load balancing and failover of GELF logs across several Graylog inputs"""
+
+import bisect
+import logging
+import socket
+import threading
+import zlib
+
+#: Send the log records to the endpoints in turn
+STRATEGY_ROUND_ROBIN = "round_robin"
+#: Send every log record to the endpoint with the fewest log records being
+#: sent or queued
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+#: Send the log records of a facility to the same endpoint, most facilities
+#: keeping their endpoint when one is added, removed or unhealthy
+STRATEGY_CONSISTENT_HASH = "consistent_hash"
+
+STRATEGIES = (
+    STRATEGY_ROUND_ROBIN,
+    STRATEGY_LEAST_OUTSTANDING,
+    STRATEGY_CONSISTENT_HASH,
+)
+
+
+def probe_endpoint(handler, timeout):
+    """Check that the Graylog input of a GELF handler can be reached
+
+    A TCP connection is opened to the stream based inputs. UDP being
+    connectionless, a UDP socket is only connected to the UDP inputs, which
+    checks that their host resolves and can be routed to, not that they
+    listen: an unhealthy UDP handler is marked healthy again as soon as its
+    host can be reached.
+
+    :param handler: GELF handler of the endpoint.
+    :type handler: BaseGELFHandler
+
+    :param timeout: Maximum number of seconds to wait.
+    :type timeout: float
+
+    :return: :obj:`True` if the Graylog input can be reached.
+    :rtype: bool
+    """
+    try:
+        # the UDP handlers
+        if hasattr(handler, "gelf_chunker"):
+            family, type_, proto, _, address = socket.getaddrinfo(
+                handler.host, handler.port, 0, socket.SOCK_DGRAM
+            )[0]
+            sock = socket.socket(family, type_, proto)
+            try:
+                sock.connect(address)
+            finally:
+                sock.close()
+        else:
+            socket.create_connection((handler.host, handler.port), timeout).close()
+    except (socket.error, socket.gaierror):
+        return False
+    return True
+
+
+class Endpoint(object):
+    """GELF handler of one Graylog input and its state
+
+    :ivar handler: GELF handler sending to the Graylog input.
+    :ivar healthy: :obj:`False` after a failed send, until a probe succeeds.
+    :ivar outstanding: Number of log records being handled.
+    :ivar failures: Number of failed sends.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+
+    @property
+    def pending(self):
+        """Number of log records being handled or queued in the
+        asynchronous mode of the handler"""
+        sender = getattr(self.handler, "sender", None)
+        queued = sender.queued if sender is not None else 0
+        return self.outstanding + queued
+
+    def __repr__(self):
+        return "<{}({}:{}, healthy={})>".format(
+            self.__class__.__name__,
+            getattr(self.handler, "host", None),
+            getattr(self.handler, "port", None),
+            self.healthy,
+        )
+
+
+class GELFBalancingHandler(logging.Handler):
+    """Handler spreading log records across the GELF handlers of several
+    Graylog inputs, e.g. the nodes of a Graylog cluster
+
+    Any GELF handler can be balanced, see :meth:`from_endpoints`. Every log
+    record is handled by one of them, picked by the ``strategy``:
+
+    * ``"round_robin"`` - in turn
+    * ``"least_outstanding"`` - the one with the fewest log records being
+      sent, or queued in asynchronous mode
+    * ``"consistent_hash"`` - the one the GELF ``facility`` of the log
+      record (its logger name unless the handlers set a ``facility``) is
+      mapped to, so the logs of a facility go to the same Graylog input
+
+    A handler whose log record could not be written to its transport
+    (counted as unsent in its ``metrics`` by the thread handling it, see
+    :attr:`.metrics.Metrics.failed`) is marked unhealthy and the log record is
+    handled by the next healthy one. Errors of the log record itself, e.g. a
+    message failing to be formatted, are handled by the handler and the log
+    record is not handled again. A probe thread checks every
+    ``probe_interval`` seconds whether the unhealthy ones can reach their
+    Graylog input again. While none is healthy, the log records are handled
+    by the one the ``strategy`` picks, e.g. to be spooled.
+
+    .. note::
+
+        Failures are only detected when the log records are sent from the
+        logging call, not when they are sent later from a queue or a batch,
+        e.g. by the asyncio handlers. Handlers buffering or spooling unsent
+        GELF logs still send them once reconnected, in addition to the
+        handler the log record failed over to.
+
+    :ivar endpoints: :class:`Endpoint` of every balanced handler.
+    """
+
+    def __init__(
+        self,
+        handlers,
+        strategy=STRATEGY_ROUND_ROBIN,
+        probe_interval=5.0,
+        probe_timeout=1.0,
+        probe=probe_endpoint,
+        virtual_nodes=100,
+    ):
+        """Initialize the GELFBalancingHandler
+
+        :param handlers: GELF handlers of the Graylog inputs.
+        :type handlers: list[logging.Handler]
+
+        :param strategy: ``"round_robin"``, ``"least_outstanding"`` or
+            ``"consistent_hash"``.
+        :type strategy: str
+
+        :param probe_interval: Number of seconds between two probes of an
+            unhealthy handler.
+        :type probe_interval: float
+
+        :param probe_timeout: Maximum number of seconds a probe waits.
+        :type probe_timeout: float
+
+        :param probe: Callable invoked with a handler and ``probe_timeout``
+            from the probe thread, returning :obj:`True` if the handler
+            can send again.
+        :type probe: Callable[logging.Handler, float]
+
+        :param virtual_nodes: Number of points of every handler on the hash
+            ring of the ``"consistent_hash"`` strategy.
+        :type virtual_nodes: int
+        """
+        if not handlers:
+            raise ValueError("at least one handler must be specified")
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                "invalid strategy (expected one of {}): {}".format(STRATEGIES, strategy)
+            )
+        if virtual_nodes < 1:
+            raise ValueError("virtual_nodes must be at least 1")
+        logging.Handler.__init__(self)
+        self.endpoints = [Endpoint(handler) for handler in handlers]
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.probe = probe
+
+        self._next = 0
+        # guards the round robin index, the outstanding counts and starting
+        # the probe thread
+        self._state_lock = threading.Lock()
+        self._probe_thread = None
+        self._stopped = threading.Event()
+
+        self._ring = []
+        self._ring_endpoints = []
+        if strategy == STRATEGY_CONSISTENT_HASH:
+            points = sorted(
+                (self._hash("{}#{}".format(self._endpoint_key(endpoint), node)), index)
+                for index, endpoint in enumerate(self.endpoints)
+                for node in range(virtual_nodes)
+            )
+            self._ring = [point for point, _ in points]
+            self._ring_endpoints = [self.endpoints[index] for _, index in points]
+
+    @classmethod
+    def from_endpoints(cls, handler_class, endpoints, balancer_kwargs=None, **kwargs):
+        """Balance GELF handlers of the same class and arguments across
+        several Graylog inputs
+
+        :param handler_class: Class of the GELF handlers, e.g.
+            :class:`.handler.GELFTCPHandler`.
+        :type handler_class: type
+
+        :param endpoints: ``(host, port)`` of every Graylog input.
+        :type endpoints: list[tuple[str, int]]
+
+        :param balancer_kwargs: Arguments of the GELFBalancingHandler.
+        :type balancer_kwargs: dict or None
+
+        :param kwargs: Arguments of every GELF handler.
+
+        :rtype: GELFBalancingHandler
+        """
+        handlers = [handler_class(host, port, **kwargs) for host, port in endpoints]
+        return cls(handlers, **(balancer_kwargs or {}))
+
+    @property
+    def handlers(self):
+        """The balanced GELF handlers"""
+        return [endpoint.handler for endpoint in self.endpoints]
+
+    @staticmethod
+    def _hash(key):
+        return zlib.crc32(key.encode("utf-8")) & 0xFFFFFFFF
+
+    @staticmethod
+    def _endpoint_key(endpoint):
+        handler = endpoint.handler
+        return "{}:{}".format(
+            getattr(handler, "host", id(handler)), getattr(handler, "port", "")
+        )
+
+    def _facility(self, record):
+        facility = getattr(self.endpoints[0].handler, "facility", None)
+        return record.name if facility is None else facility
+
+    def _candidates(self, record):
+        """Order the endpoints to try for a log record
+
+        :return: The healthy endpoints, the one picked by the ``strategy``
+            first, or only the one it picks among all the endpoints if none
+            is healthy.
+        :rtype: list[Endpoint]
+        """
+        endpoints = self.endpoints
+        if self.strategy == STRATEGY_CONSISTENT_HASH:
+            start = bisect.bisect(self._ring, self._hash(self._facility(record)))
+            ordered = []
+            for offset in range(len(self._ring)):
+                endpoint = self._ring_endpoints[(start + offset) % len(self._ring)]
+                if endpoint not in ordered:
+                    ordered.append(endpoint)
+                    if len(ordered) == len(endpoints):
+                        break
+        elif self.strategy == STRATEGY_LEAST_OUTSTANDING:
+            ordered = sorted(endpoints, key=lambda endpoint: endpoint.pending)
+        else:
+            with self._state_lock:
+                start = self._next
+                self._next = (start + 1) % len(endpoints)
+            ordered = endpoints[start:] + endpoints[:start]
+        healthy = [endpoint for endpoint in ordered if endpoint.healthy]
+        return healthy or ordered[:1]
+
+    def handle(self, record):
+        """Conditionally emit the specified :class:`logging.LogRecord`
+
+        Unlike :meth:`logging.Handler.handle` the balancer is not locked,
+        the log records are handled concurrently by the balanced handlers.
+        """
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        """Handle a log record by the first balanced handler able to send it
+
+        :param record: :class:`logging.LogRecord` to send.
+        :type record: logging.LogRecord
+        """
+        for endpoint in self._candidates(record):
+            if self._handle(endpoint, record):
+                return
+
+    def _handle(self, endpoint, record):
+        """Handle a log record by one balanced handler
+
+        :return: :obj:`False` if it failed to send it.
+        :rtype: bool
+        """
+        handler = endpoint.handler
+        metrics = getattr(handler, "metrics", None)
+        if metrics is not None:
+            metrics.clear_failed()
+        with self._state_lock:
+            endpoint.outstanding += 1
+        try:
+            handler.handle(record)
+        finally:
+            with self._state_lock:
+                endpoint.outstanding -= 1
+        if metrics is None or not metrics.failed:
+            return True
+        endpoint.failures += 1
+        self._mark_unhealthy(endpoint)
+        return False
+
+    def _mark_unhealthy(self, endpoint):
+        endpoint.healthy = False
+        with self._state_lock:
+            if self._probe_thread is not None or self._stopped.is_set():
+                return
+            self._probe_thread = threading.Thread(
+                target=self._run_probes, name="graypy-probe"
+            )
+            self._probe_thread.daemon = True
+            self._probe_thread.start()
+
+    def _run_probes(self):
+        while not self._stopped.wait(self.probe_interval):
+            for endpoint in self.endpoints:
+                if not endpoint.healthy and self.probe(
+                    endpoint.handler, self.probe_timeout
+                ):
+                    endpoint.healthy = True
+            with self._state_lock:
+                if all(endpoint.healthy for endpoint in self.endpoints):
+                    self._probe_thread = None
+                    return
+        with self._state_lock:
+            self._probe_thread = None
+
+    def flush(self):
+        """Flush every balanced handler"""
+        for endpoint in self.endpoints:
+            endpoint.handler.flush()
+
+    def close(self):
+        """Stop the probe thread and close every balanced handler"""
+        self._stopped.set()
+        thread = self._probe_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        for endpoint in self.endpoints:
+            endpoint.handler.close()
+        logging.Handler.close(self)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compression policies deciding how GELF logs are compressed"""
+
+import threading
+import time
+import zlib
+
+#: zlib framing, sent as the ``deflate`` HTTP content encoding
+FRAMING_ZLIB = "zlib"
+#: gzip framing, sent as the ``gzip`` HTTP content encoding
+FRAMING_GZIP = "gzip"
+
+FRAMINGS = (FRAMING_ZLIB, FRAMING_GZIP)
+
+#: HTTP ``Content-Encoding`` of every framing
+CONTENT_ENCODINGS = {FRAMING_ZLIB: "deflate", FRAMING_GZIP: "gzip"}
+
+# zlib window bits producing a gzip header and trailer
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+if hasattr(time, "thread_time"):  # python 3.7+
+    _cpu_time = time.thread_time
+else:
+    _cpu_time = time.time
+
+
+def detect_framing(data):
+    """Detect the compression framing of a GELF log from its magic bytes
+
+    :param data: Possibly compressed GELF log.
+    :type data: bytes
+
+    :return: ``"zlib"``, ``"gzip"`` or :obj:`None` if the GELF log is not
+        compressed.
+    :rtype: str or None
+    """
+    if data[:2] == b"\x1f\x8b":
+        return FRAMING_GZIP
+    if data[:1] == b"\x78":
+        return FRAMING_ZLIB
+    return None
+
+
+def decompress(data):
+    """Decompress a GELF log compressed with any framing
+
+    The framing is detected from the magic bytes of ``data``. Uncompressed
+    GELF logs are returned as is.
+
+    :param data: Possibly compressed GELF log.
+    :type data: bytes
+
+    :return: Uncompressed GELF log.
+    :rtype: bytes
+    """
+    framing = detect_framing(data)
+    if framing == FRAMING_GZIP:
+        return zlib.decompress(data, _GZIP_WBITS)
+    if framing == FRAMING_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+class CompressionPolicy(object):
+    """Policy deciding whether and how GELF logs are compressed
+
+    GELF logs smaller than ``min_size`` are sent uncompressed: for them
+    compression costs CPU time and often makes them larger.
+
+    With ``adaptive`` set, the compression ratio is tracked as a moving
+    average. While compressing saves less than ``1 - max_ratio`` of the
+    bytes, GELF logs are sent uncompressed and only every
+    ``probe_interval``-th one is compressed to measure the ratio again.
+
+    :ivar compressed: Number of compressed GELF logs.
+    :ivar uncompressed: Number of GELF logs sent uncompressed.
+    :ivar bytes_in: Bytes of the compressed GELF logs before compression.
+    :ivar bytes_out: Bytes of the compressed GELF logs after compression.
+    :ivar cpu_time: Seconds of CPU time spent compressing.
+    """
+
+    def __init__(
+        self,
+        min_size=0,
+        level=zlib.Z_DEFAULT_COMPRESSION,
+        framing=FRAMING_ZLIB,
+        adaptive=False,
+        max_ratio=0.9,
+        probe_interval=100,
+    ):
+        """Initialize the CompressionPolicy
+
+        :param min_size: Size in bytes below which GELF logs are not
+            compressed.
+        :type min_size: int
+
+        :param level: zlib compression level, from ``0`` to ``9`` or ``-1``
+            for the zlib default.
+        :type level: int
+
+        :param framing: ``"zlib"`` or ``"gzip"``. Graylog accepts both.
+        :type framing: str
+
+        :param adaptive: If :obj:`True` stop compressing while the measured
+            compression ratio is above ``max_ratio``.
+        :type adaptive: bool
+
+        :param max_ratio: Compressed to uncompressed size ratio above which
+            adaptive compression is skipped.
+        :type max_ratio: float
+
+        :param probe_interval: While adaptive compression is skipped,
+            compress one GELF log out of ``probe_interval``.
+        :type probe_interval: int
+        """
+        if framing not in FRAMINGS:
+            raise ValueError(
+                "invalid framing (expected one of {}): {}".format(FRAMINGS, framing)
+            )
+        if not -1 <= level <= 9:
+            raise ValueError("level must be between -1 and 9")
+        self.min_size = min_size
+        self.level = level
+        self.framing = framing
+        self.content_encoding = CONTENT_ENCODINGS[framing]
+        self.adaptive = adaptive
+        self.max_ratio = max_ratio
+        self.probe_interval = probe_interval
+
+        self.compressed = 0
+        self.uncompressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+        #: moving average of the compression ratio, if ``adaptive``
+        self.ratio = None
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_saved(self):
+        """Bytes saved by compression, negative if it enlarged GELF logs"""
+        return self.bytes_in - self.bytes_out
+
+    def _should_compress(self, size):
+        if size < self.min_size:
+            return False
+        if not self.adaptive or self.ratio is None or self.ratio <= self.max_ratio:
+            return True
+        # racing threads may only shift the next probe
+        self._skipped += 1
+        if self._skipped >= self.probe_interval:
+            self._skipped = 0
+            return True
+        return False
+
+    def _compress(self, data):
+        if self.framing == FRAMING_GZIP:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, _GZIP_WBITS)
+            return compressor.compress(data) + compressor.flush()
+        return zlib.compress(data, self.level)
+
+    def compress(self, data):
+        """Compress a packed GELF log if the policy decides to
+
+        :param data: Uncompressed GELF log.
+        :type data: bytes
+
+        :return: The GELF log and its HTTP content encoding, :obj:`None` if
+            it was left uncompressed.
+        :rtype: tuple[bytes, str or None]
+        """
+        if not self._should_compress(len(data)):
+            with self._lock:
+                self.uncompressed += 1
+            return data, None
+        start = _cpu_time()
+        compressed = self._compress(data)
+        elapsed = _cpu_time() - start
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+            self.cpu_time += elapsed
+            if self.adaptive:
+                ratio = float(len(compressed)) / max(len(data), 1)
+                if self.ratio is not None:
+                    ratio = 0.9 * self.ratio + 0.1 * ratio
+                self.ratio = ratio
+        return compressed, self.content_encoding
+
+    def __repr__(self):
+        return "<{}(min_size={}, level={}, framing={!r}, adaptive={})>".format(
+            self.__class__.__name__,
+            self.min_size,
+            self.level,
+            self.framing,
+            self.adaptive,
+        )
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""JSON encoders used to serialize GELF logs
+
+graypy picks the fastest JSON library installed among orjson, rapidjson and
+ujson, falling back to the python standard library :mod:`json` module.
+"""
+
+import abc
+import json
+import sys
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson  # pylint: disable=import-error
+except ImportError:
+    orjson = None
+
+try:
+    import rapidjson  # pylint: disable=import-error
+except ImportError:
+    rapidjson = None
+
+try:
+    import ujson  # pylint: disable=import-error
+
+    # the default argument was only added in ujson 2.0
+    ujson.dumps(None, default=repr)
+except (ImportError, TypeError):
+    ujson = None
+
+# fixes for using ABC
+if sys.version_info >= (3, 4):  # check if python3.4+
+    ABC = abc.ABC
+else:
+    ABC = abc.ABCMeta(str("ABC"), (), {})
+
+
+class JSONEncoder(object):
+    """GELF JSON encoder using the python standard library :mod:`json`
+    module
+
+    Also used as the interface of all the GELF JSON encoders.
+    """
+
+    name = "json"
+
+    def encode(self, obj, default=None):
+        """Serialize an object into JSON-encoded UTF-8 bytes
+
+        :param obj: Object to serialize.
+        :type obj: object
+
+        :param default: Function called on objects that cannot be natively
+            serialized into JSON. It should return a serializable version of
+            the object.
+        :type default: Callable[object] or None
+
+        :return: Bytes representing the JSON serialized object.
+        :rtype: bytes
+        """
+        return json.dumps(obj, separators=(",", ":"), default=default).encode("utf-8")
+
+    def encode_string(self, string):
+        """Serialize a unicode string into JSON-encoded UTF-8 bytes
+
+        :param string: Unicode string to serialize.
+        :type string: str
+
+        :return: Bytes representing the JSON serialized string.
+        :rtype: bytes
+        """
+        return encode_basestring_ascii(string).encode("utf-8")
+
+    def __repr__(self):
+        return "<{}>".format(self.__class__.__name__)
+
+
+class _FallbackJSONEncoder(JSONEncoder, ABC):
+    """Base of the GELF JSON encoders using a third party JSON library
+
+    Objects the third party library rejects (e.g. non string dictionary keys
+    or integers larger than 64 bits) are serialized by the python standard
+    library :mod:`json` module instead.
+    """
+
+    @abc.abstractmethod
+    def _dumps(self, obj, default):
+        """Serialize an object with the third party JSON library
+
+        :return: Bytes representing the JSON serialized object.
+        :rtype: bytes
+        """
+        pass
+
+    def encode(self, obj, default=None):
+        try:
+            return self._dumps(obj, default)
+        except (TypeError, ValueError, OverflowError):
+            return JSONEncoder.encode(self, obj, default)
+
+
+if orjson is not None:
+    # datetime objects and dataclass instances (the latter since orjson 3.0)
+    # are left to default to match the json module
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | getattr(
+        orjson, "OPT_PASSTHROUGH_DATACLASS", 0
+    )
+
+
+class OrjsonEncoder(_FallbackJSONEncoder):
+    """GELF JSON encoder using `orjson <https://github.com/ijl/orjson>`_
+
+    Datetime objects and dataclass instances are left to ``default`` like
+    by the :mod:`json` module. orjson serializes some types natively which
+    the :mod:`json` module leaves to ``default``, and these cannot be left
+    to it: :class:`uuid.UUID` objects are serialized as their string,
+    :class:`enum.Enum` members as their value, and NaN and infinite floats
+    as ``null`` (instead of the ``NaN`` and ``Infinity`` literals the
+    :mod:`json` module writes, which are not valid JSON).
+    """
+
+    name = "orjson"
+
+    def _dumps(self, obj, default):
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+
+class RapidjsonEncoder(_FallbackJSONEncoder):
+    """GELF JSON encoder using
+    `python-rapidjson <https://github.com/python-rapidjson/python-rapidjson>`_
+    """
+
+    name = "rapidjson"
+
+    def _dumps(self, obj, default):
+        return rapidjson.dumps(obj, default=default, ensure_ascii=False).encode("utf-8")
+
+
+class UjsonEncoder(_FallbackJSONEncoder):
+    """GELF JSON encoder using `ujson <https://github.com/ultrajson/ultrajson>`_"""
+
+    name = "ujson"
+
+    def _dumps(self, obj, default):
+        return ujson.dumps(
+            obj, default=default, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+
+
+#: Available GELF JSON encoders by name
+JSON_ENCODERS = dict(
+    (encoder.name, encoder)
+    for encoder, library in [
+        (OrjsonEncoder, orjson),
+        (RapidjsonEncoder, rapidjson),
+        (UjsonEncoder, ujson),
+        (JSONEncoder, json),
+    ]
+    if library is not None
+)
+
+_PREFERENCE = ("orjson", "rapidjson", "ujson", "json")
+
+
+def get_json_encoder(json_encoder=None):
+    """Get a GELF JSON encoder
+
+    :param json_encoder: Name of a GELF JSON encoder (``"orjson"``,
+        ``"rapidjson"``, ``"ujson"`` or ``"json"``) or an encoder instance.
+        If :obj:`None` the fastest available encoder is used.
+    :type json_encoder: str or JSONEncoder or None
+
+    :return: GELF JSON encoder instance.
+    :rtype: JSONEncoder
+    """
+    if json_encoder is None:
+        json_encoder = next(name for name in _PREFERENCE if name in JSON_ENCODERS)
+    if isinstance(json_encoder, JSONEncoder):
+        return json_encoder
+    try:
+        return JSON_ENCODERS[json_encoder]()
+    except KeyError:
+        raise ValueError(
+            "unavailable JSON encoder (expected one of {}): {}".format(
+                sorted(JSON_ENCODERS), json_encoder
+            )
+        )
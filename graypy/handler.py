@@ -5,27 +5,48 @@
 
 import warnings
 import abc
+import collections
+import copy
 import datetime
+import errno
+import functools
+import itertools
 import json
 import logging
 import math
-import random
+import os
 import socket
 import ssl
 import struct
 import sys
+import threading
+import time
 import traceback
+import weakref
 import zlib
-from logging.handlers import DatagramHandler, SocketHandler
+from logging.handlers import DatagramHandler
+
+from graypy.compression import (
+    CONTENT_ENCODINGS,
+    CompressionPolicy,
+    decompress,
+    detect_framing,
+)
+from graypy.encoder import JSONEncoder, get_json_encoder
+from graypy.metrics import Metrics, clock
+from graypy.reconnect import OUTAGE_DROP, ReconnectingSocketHandler
+from graypy.resolver import DEFAULT_RESOLVER, create_connection
+from graypy.sender import BackgroundSender, BatchBuffer, OVERFLOW_BLOCK
 
 
 WAN_CHUNK = 1420
 LAN_CHUNK = 8154
 
 if sys.version_info[0] == 3:  # check if python3+
-    data, text = bytes, str
+    data, text, data_view = bytes, str, memoryview
 else:
     data, text = str, unicode  # pylint: disable=undefined-variable
+    data_view = buffer  # pylint: disable=undefined-variable
 
 # fixes for using ABC
 if sys.version_info >= (3, 4):  # check if python3.4+
@@ -48,12 +69,110 @@ SYSLOG_LEVELS = {
 
 GELF_MAX_CHUNK_NUMBER = 128
 
+# maximum number of buffers written at once by a scatter/gather write
+_IOV_MAX = 1024
+
+# writes of a TLS connection after which its TLS 1.3 session ticket is no
+# longer polled for
+_TLS_TICKET_POLLS = 16
+
+#: Maximum number of truncated GELF messages packed to fix a chunk overflow
+GELF_TRUNCATION_ATTEMPTS = 8
+
+#: GELF chunk header: magic bytes, message id, sequence number and count
+GELF_CHUNK_HEADER = struct.Struct("=2sQBB")
+GELF_CHUNK_MAGIC = b"\x1e\x0f"
+_GELF_MESSAGE_ID_MASK = 0xFFFFFFFFFFFFFFFF
+# without os.register_at_fork (python < 3.7) a fork is detected from the
+# process id when generating a GELF message id
+_REGISTER_AT_FORK = getattr(os, "register_at_fork", None)
+
+#: Methods building the GELF dictionary of a log record, bypassed by the
+#: compiled GELF log template unless overridden
+_GELF_DICT_METHODS = (
+    "_make_gelf_dict",
+    "_add_level_names",
+    "_add_debugging_fields",
+    "_add_extra_fields",
+    "_iter_extra_fields",
+    "_set_custom_facility",
+)
+
+# bytes do not support %-formatting from python 3.0 to 3.4
+_BYTES_FORMATTING = sys.version_info[0] == 2 or sys.version_info >= (3, 5)
+
+#: :class:`logging.LogRecord` attributes that are never added as extra fields
+SKIP_EXTRA_FIELDS = frozenset(
+    [
+        "args",
+        "asctime",
+        "created",
+        "exc_info",
+        "exc_text",
+        "filename",
+        "funcName",
+        "id",
+        "levelname",
+        "levelno",
+        "lineno",
+        "module",
+        "msecs",
+        "message",
+        "msg",
+        "name",
+        "pathname",
+        "process",
+        "processName",
+        "relativeCreated",
+        "thread",
+        "threadName",
+    ]
+)
+
+_JSON_ENCODER = JSONEncoder()
+
+
+def _gelf_template_option(name):
+    """Create a property for a :class:`.handler.BaseGELFHandler` option that
+    recompiles the handler's GELF log template when changed
+
+    :param name: Name of the option.
+    :type name: str
+
+    :return: Property getting and setting the option.
+    :rtype: property
+    """
+    attr = "_" + name
+
+    def getter(self):
+        return getattr(self, attr)
+
+    def setter(self, value):
+        setattr(self, attr, value)
+        self._compile_gelf_template()
+
+    return property(getter, setter)
+
+
+def _method_function(method):
+    """Get the function of a method, whether a class, static, bound or
+    python 2 unbound one"""
+    return getattr(method, "__func__", method)
+
 
 class BaseGELFHandler(logging.Handler, ABC):
     """Abstract class defining the basic functionality of converting a
     :obj:`logging.LogRecord` into a GELF log. Provides the boilerplate for
     all GELF handlers defined within graypy."""
 
+    debugging_fields = _gelf_template_option("debugging_fields")
+    extra_fields = _gelf_template_option("extra_fields")
+    facility = _gelf_template_option("facility")
+    level_names = _gelf_template_option("level_names")
+    extra_fields_allowlist = _gelf_template_option("extra_fields_allowlist")
+    extra_fields_denylist = _gelf_template_option("extra_fields_denylist")
+    extra_fields_rename = _gelf_template_option("extra_fields_rename")
+
     def __init__(
         self,
         debugging_fields=True,
@@ -63,6 +182,15 @@ class BaseGELFHandler(logging.Handler, ABC):
         facility=None,
         level_names=False,
         compress=True,
+        queue_size=None,
+        overflow_policy=OVERFLOW_BLOCK,
+        shutdown_timeout=5,
+        host_refresh_interval=None,
+        json_encoder=None,
+        extra_fields_allowlist=None,
+        extra_fields_denylist=None,
+        extra_fields_rename=None,
+        metrics=None,
     ):
         """Initialize the BaseGELFHandler
 
@@ -92,12 +220,62 @@ class BaseGELFHandler(logging.Handler, ABC):
         :type level_names: bool
 
         :param compress: If :obj:`True` compress the GELF message before
-            sending it to the Graylog server.
-        :type compress: bool
+            sending it to the Graylog server. A
+            :class:`.compression.CompressionPolicy` can be given to tune
+            the compression.
+        :type compress: bool or CompressionPolicy
+
+        :param queue_size: If specified, enable the asynchronous mode: log
+            records are put in a queue of this size and converted and sent
+            to Graylog from a dedicated sender thread.
+        :type queue_size: int or None
+
+        :param overflow_policy: What to do with log records when the queue
+            of the asynchronous mode is full. One of ``"block"``,
+            ``"drop_oldest"`` or ``"drop_newest"``.
+        :type overflow_policy: str
+
+        :param shutdown_timeout: Maximum number of seconds closing the
+            handler waits for the queue of the asynchronous mode to drain.
+        :type shutdown_timeout: float or None
+
+        :param host_refresh_interval: Number of seconds after which the
+            cached ``host`` GELF field is resolved again, from a background
+            thread while the cached one is still used. If :obj:`None` it is
+            only resolved on construction and by :meth:`refresh_host`.
+        :type host_refresh_interval: float or None
+
+        :param json_encoder: Name of the JSON encoder used to serialize GELF
+            logs (``"orjson"``, ``"rapidjson"``, ``"ujson"`` or ``"json"``)
+            or a :class:`.encoder.JSONEncoder` instance. If :obj:`None` the
+            fastest installed JSON encoder is used.
+        :type json_encoder: str or JSONEncoder or None
+
+        :param extra_fields_allowlist: If specified, only add the extra
+            fields with these names into the GELF logs.
+        :type extra_fields_allowlist: Iterable[str] or None
+
+        :param extra_fields_denylist: Names of extra fields to never add into
+            the GELF logs.
+        :type extra_fields_denylist: Iterable[str] or None
+
+        :param extra_fields_rename: Mapping of extra field names to the names
+            to add them into the GELF logs as, e.g. ``{"user_id": "uid"}``
+            adds the ``user_id`` extra field as the ``_uid`` GELF field.
+        :type extra_fields_rename: dict or None
+
+        :param metrics: :class:`.metrics.Metrics` to record the counters and
+            stage latencies of the handler into, e.g. to set a callback. If
+            :obj:`None` the handler gets its own.
+        :type metrics: Metrics or None
         """
         logging.Handler.__init__(self)
+        self.metrics = Metrics() if metrics is None else metrics
         self.debugging_fields = debugging_fields
         self.extra_fields = extra_fields
+        self.extra_fields_allowlist = extra_fields_allowlist
+        self.extra_fields_denylist = extra_fields_denylist
+        self.extra_fields_rename = extra_fields_rename
 
         if fqdn and localname:
             raise ValueError("cannot specify 'fqdn' and 'localname' arguments together")
@@ -107,6 +285,175 @@ class BaseGELFHandler(logging.Handler, ABC):
         self.facility = facility
         self.level_names = level_names
         self.compress = compress
+        self.json_encoder = json_encoder
+
+        self.host_refresh_interval = host_refresh_interval
+        self.host_cache_hits = 0
+        self.host_cache_misses = 0
+        self._host_refreshing = False
+        self._host_refresh_lock = threading.Lock()
+        self.refresh_host()
+
+        self.shutdown_timeout = shutdown_timeout
+        self._spool = None
+        self.sender = None
+        if queue_size is not None:
+            self.sender = BackgroundSender(
+                self._emit_queued,
+                queue_size=queue_size,
+                overflow_policy=overflow_policy,
+            )
+
+    def handle(self, record):
+        """Conditionally emit the specified :class:`logging.LogRecord`
+
+        In asynchronous mode the record is only queued, it is emitted later
+        from the sender thread.
+
+        :param record: :class:`logging.LogRecord` to emit.
+        :type record: logging.LogRecord
+        """
+        if self.sender is None:
+            return logging.Handler.handle(self, record)
+        rv = self.filter(record)
+        if rv:
+            try:
+                queued = self._prepare_queued_record(record)
+            except Exception:
+                # e.g. arguments not matching the message, reported like
+                # by the synchronous mode instead of raised to the caller
+                self.handleError(record)
+            else:
+                self.sender.put(queued)
+        return rv
+
+    @staticmethod
+    def _prepare_queued_record(record):
+        """Copy a :class:`logging.LogRecord` with its message merged, so that
+        it does not depend on arguments mutated after the logging call
+
+        :param record: :class:`logging.LogRecord` to prepare for queuing.
+        :type record: logging.LogRecord
+
+        :return: Copy of the record safe to emit from another thread.
+        :rtype: logging.LogRecord
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def _emit_queued(self, record):
+        """Emit a queued :class:`logging.LogRecord` from the sender thread"""
+        self.acquire()
+        try:
+            self.emit(record)
+        except Exception:
+            self.handleError(record)
+        finally:
+            self.release()
+
+    def _handle_batch_error(self, batch):
+        """Handle the error being raised for a batch of GELF logs being
+        dropped, reporting how many with the first log record of the batch
+
+        :param batch: Tuples of the log records of the batch and their GELF
+            logs.
+        :type batch: list[tuple]
+        """
+        record = copy.copy(batch[0][0])
+        record.msg = "%d GELF logs of a batch dropped, the first one logging %r"
+        record.args = (len(batch), batch[0][0].msg)
+        self.handleError(record)
+
+    def handleError(self, record):
+        """Count the error in the ``metrics``, then handle it like the base
+        class"""
+        self.metrics.count("errors")
+        super(BaseGELFHandler, self).handleError(record)
+
+    def flush(self, timeout=None):
+        """Wait for the log records queued in asynchronous mode to be sent
+
+        :param timeout: Maximum number of seconds to wait. If :obj:`None`
+            wait for ``shutdown_timeout`` at most.
+        :type timeout: float or None
+
+        :return: :obj:`False` if queued log records remain unsent after
+            ``timeout``, otherwise :obj:`True`.
+        :rtype: bool
+        """
+        flushed = True
+        if self.sender is not None:
+            flushed = self.sender.flush(
+                self.shutdown_timeout if timeout is None else timeout
+            )
+        super(BaseGELFHandler, self).flush()
+        return flushed
+
+    def close(self):
+        """Stop the sender thread of the asynchronous mode after sending the
+        queued log records (waiting for ``shutdown_timeout`` at most), then
+        close the handler"""
+        if self.sender is not None:
+            self.sender.close(self.shutdown_timeout)
+        if self._spool is not None:
+            self._spool.close()
+        super(BaseGELFHandler, self).close()
+
+    @property
+    def spool(self):
+        """If set to a :class:`.spool.DiskSpool`, the GELF logs that cannot
+        be sent are spooled to disk and sent again, in order, once the
+        Graylog server is reachable
+
+        While GELF logs wait in the spool, new GELF logs are spooled behind
+        them. Only handlers with a ``_send_spooled`` method support spooling.
+        """
+        return self._spool
+
+    @spool.setter
+    def spool(self, spool):
+        if spool is not None and not hasattr(self, "_send_spooled"):
+            raise ValueError(
+                "{} does not support spooling".format(self.__class__.__name__)
+            )
+        if self._spool is not None:
+            self._spool.close()
+        self._spool = spool
+        if spool is not None:
+            spool.start(self._send_spooled)
+
+    def _spooling(self):
+        """Return :obj:`True` if GELF logs wait in the spool, in which case
+        new GELF logs must be spooled behind them"""
+        return self._spool is not None and self._spool.pending > 0
+
+    @property
+    def compress(self):
+        """If :obj:`True` or a :class:`.compression.CompressionPolicy`,
+        compress the GELF logs"""
+        return self._compress
+
+    @compress.setter
+    def compress(self, compress):
+        self._compress = compress
+        if isinstance(compress, CompressionPolicy):
+            self.compression = compress
+        elif compress:
+            self.compression = CompressionPolicy()
+        else:
+            self.compression = None
+
+    @property
+    def json_encoder(self):
+        """JSON encoder used to serialize GELF logs"""
+        return self._json_encoder
+
+    @json_encoder.setter
+    def json_encoder(self, json_encoder):
+        self._json_encoder = get_json_encoder(json_encoder)
+        self._compile_gelf_template()
 
     def makePickle(self, record):
         """Convert a :class:`logging.LogRecord` into bytes representing
@@ -118,10 +465,86 @@ class BaseGELFHandler(logging.Handler, ABC):
         :return: bytes representing a GELF log.
         :rtype: bytes
         """
+        return self._make_pickle(record)[0]
+
+    def _make_pickle(self, record):
+        """Convert a :class:`logging.LogRecord` into bytes representing
+        a GELF log, compressed according to the compression policy
+
+        :return: Bytes representing a GELF log and their HTTP content
+            encoding, :obj:`None` if they are uncompressed.
+        :rtype: tuple[bytes, str or None]
+        """
+        packed = self._pack_record(record)
+        if self.compression is None:
+            return packed, None
+        metrics = self.metrics
+        sampled = metrics.sampled
+        if sampled:
+            start = clock()
+        pickle, content_encoding = self.compression.compress(packed)
+        if sampled:
+            metrics.timed("compress", start)
+        if content_encoding is not None:
+            metrics.count("compressed")
+        return pickle, content_encoding
+
+    def _pack_record(self, record):
+        """Convert a :class:`logging.LogRecord` into bytes representing an
+        uncompressed GELF log
+
+        Log records without exception information are serialized by the
+        handler's compiled GELF log template, which only serializes the GELF
+        fields varying between log records, unless a subclass overrides how
+        the dictionary representing the GELF log is built (e.g.
+        :meth:`_make_gelf_dict`).
+
+        :param record: :class:`logging.LogRecord` to convert into a GELF log.
+        :type record: logging.LogRecord
+
+        :return: Bytes representing a uncompressed GELF log.
+        :rtype: bytes
+        """
+        metrics = self.metrics
+        sampled = metrics.sample()
+        if sampled:
+            start = clock()
+        packer = self._gelf_template_packer
+        if (
+            packer is not None
+            and not (record.exc_info or record.exc_text)
+            and isinstance(record.name, text)
+        ):
+            short_message = self._format_short_message(record)
+            if isinstance(short_message, text):
+                self._get_host()
+                if not sampled:
+                    return packer(record, short_message)
+                start = metrics.timed("format", start)
+                packed = packer(record, short_message)
+                metrics.timed("serialize", start)
+                return packed
         gelf_dict = self._make_gelf_dict(record)
-        packed = self._pack_gelf_dict(gelf_dict)
-        pickle = zlib.compress(packed) if self.compress else packed
-        return pickle
+        if not sampled:
+            return self._pack_gelf_dict(gelf_dict, self.json_encoder)
+        start = metrics.timed("format", start)
+        packed = self._pack_gelf_dict(gelf_dict, self.json_encoder)
+        metrics.timed("serialize", start)
+        return packed
+
+    def _format_short_message(self, record):
+        """Get the ``short_message`` GELF field of a log record
+
+        :param record: :class:`logging.LogRecord` to format.
+        :type record: logging.LogRecord
+
+        :return: The log record formatted by the handler's formatter, or its
+            plain message if no formatter is set.
+        :rtype: str
+        """
+        if self.formatter:
+            return self.formatter.format(record)
+        return record.getMessage()
 
     def _make_gelf_dict(self, record):
         """Create a dictionary representing a GELF log from a
@@ -133,29 +556,146 @@ class BaseGELFHandler(logging.Handler, ABC):
         :return: Dictionary representing a GELF log.
         :rtype: dict
         """
+        self._get_host()
         # construct the base GELF format
-        gelf_dict = {
-            "version": "1.0",
-            "host": self._resolve_host(self.fqdn, self.localname),
-            "short_message": self.formatter.format(record)
-            if self.formatter
-            else record.getMessage(),
-            "timestamp": record.created,
-            "level": SYSLOG_LEVELS.get(record.levelno, record.levelno),
-            "facility": self.facility or record.name,
-        }
+        gelf_dict = dict(self._gelf_static_fields)
+        gelf_dict["short_message"] = self._format_short_message(record)
+        gelf_dict["timestamp"] = record.created
+        gelf_dict["level"] = SYSLOG_LEVELS.get(record.levelno, record.levelno)
+        if self.facility is None:
+            gelf_dict["facility"] = record.name
+        else:
+            self._set_custom_facility(gelf_dict, self.facility, record)
 
         # add in specified optional extras
         self._add_full_message(gelf_dict, record)
-        if self.level_names:
-            self._add_level_names(gelf_dict, record)
+        for add_fields in self._gelf_field_adders:
+            add_fields(gelf_dict, record)
+        return gelf_dict
+
+    def _compile_gelf_template(self):
+        """Compile the GELF log template of the handler
+
+        The template holds the GELF fields that are the same for every log
+        record, the functions adding the optional GELF fields enabled by the
+        handler's options and a function serializing log records straight
+        into GELF logs. It is compiled on construction and recompiled
+        whenever an option it depends on changes.
+        """
+        if "_gelf_host" not in self.__dict__:
+            return  # still initializing
+
+        static_fields = {"version": "1.0", "host": self._gelf_host}
         if self.facility is not None:
-            self._set_custom_facility(gelf_dict, self.facility, record)
+            static_fields["facility"] = self.facility
+        self._gelf_static_fields = static_fields
+
+        # the log record name is either the facility or the _logger field
+        self._gelf_name_field = "facility" if self.facility is None else "_logger"
+
+        field_adders = []
+        if self.level_names:
+            field_adders.append(self._add_level_names)
         if self.debugging_fields:
-            self._add_debugging_fields(gelf_dict, record)
+            field_adders.append(self._add_debugging_fields)
         if self.extra_fields:
-            self._add_extra_fields(gelf_dict, record)
-        return gelf_dict
+            allowed_fields = None
+            if self.extra_fields_allowlist is not None:
+                allowed_fields = frozenset(self.extra_fields_allowlist)
+            renamed_fields = dict(
+                (key, "_" + name)
+                for key, name in (self.extra_fields_rename or {}).items()
+            )
+            field_adders.append(
+                functools.partial(
+                    self._add_extra_fields,
+                    skip_fields=SKIP_EXTRA_FIELDS.union(
+                        self.extra_fields_denylist or ()
+                    ),
+                    allowed_fields=allowed_fields,
+                    renamed_fields=renamed_fields,
+                )
+            )
+        self._gelf_field_adders = field_adders
+
+        self._gelf_template_packer = None
+        # the template bypasses the methods building the GELF dictionary
+        if not any(
+            _method_function(getattr(type(self), name))
+            is not _method_function(getattr(BaseGELFHandler, name))
+            for name in _GELF_DICT_METHODS
+        ):
+            self._gelf_template_packer = self._compile_gelf_template_packer()
+
+    def _compile_gelf_template_packer(self):
+        """Compile a function serializing a log record without exception
+        information straight into an uncompressed GELF log
+
+        The GELF fields that are the same for every log record are serialized
+        once, only the other GELF fields are serialized for each log record:
+        from a dictionary of those fields if debugging or extra fields are
+        enabled (one call of a C JSON encoder being faster than serializing
+        them one by one), otherwise filled into a bytes template, unless
+        bytes cannot be %-formatted (python 3.0 to 3.4).
+
+        :return: Function of the form ``packer(record, short_message)``.
+        :rtype: Callable[logging.LogRecord, str]
+        """
+        json_encoder = self.json_encoder
+        encode_string = json_encoder.encode_string
+        pack_gelf_dict = self._pack_gelf_dict
+        field_adders = self._gelf_field_adders
+        name_field = self._gelf_name_field
+        # serialized static GELF fields without the closing brace
+        prefix = pack_gelf_dict(self._gelf_static_fields, json_encoder)[:-1]
+
+        if self.debugging_fields or self.extra_fields or not _BYTES_FORMATTING:
+
+            def packer(record, short_message):
+                gelf_dict = {
+                    "short_message": short_message,
+                    "timestamp": record.created,
+                    "level": SYSLOG_LEVELS.get(record.levelno, record.levelno),
+                    name_field: record.name,
+                }
+                for add_fields in field_adders:
+                    add_fields(gelf_dict, record)
+                return prefix + b"," + pack_gelf_dict(gelf_dict, json_encoder)[1:]
+
+            return packer
+
+        template = (
+            prefix
+            + b',"short_message":%s,"timestamp":%r,"level":%r,"'
+            + name_field.encode("ascii")
+            + b'":%s'
+        )
+
+        if self.level_names:
+            template += b',"level_name":%s}'
+
+            def packer(record, short_message):
+                return template % (
+                    encode_string(short_message),
+                    record.created,
+                    SYSLOG_LEVELS.get(record.levelno, record.levelno),
+                    encode_string(record.name),
+                    encode_string(logging.getLevelName(record.levelno)),
+                )
+
+            return packer
+
+        template += b"}"
+
+        def packer(record, short_message):
+            return template % (
+                encode_string(short_message),
+                record.created,
+                SYSLOG_LEVELS.get(record.levelno, record.levelno),
+                encode_string(record.name),
+            )
+
+        return packer
 
     @staticmethod
     def _add_level_names(gelf_dict, record):
@@ -217,6 +757,55 @@ class BaseGELFHandler(logging.Handler, ABC):
         if full_message:
             gelf_dict["full_message"] = full_message
 
+    def refresh_host(self):
+        """Resolve the ``host`` GELF field and cache it
+
+        Must be called for changes of :attr:`fqdn` or :attr:`localname` to
+        take effect.
+
+        :return: String representing the ``host`` GELF field.
+        :rtype: str
+        """
+        self._gelf_host = self._resolve_host(self.fqdn, self.localname)
+        self._gelf_host_resolved_at = time.time()
+        self.host_cache_misses += 1
+        self._compile_gelf_template()
+        return self._gelf_host
+
+    def _get_host(self):
+        """Get the cached ``host`` GELF field, resolving it again in the
+        background if it is older than ``host_refresh_interval``
+
+        The cached ``host`` GELF field is returned until resolved again, so
+        a slow resolver never stalls the logging call.
+
+        :return: String representing the ``host`` GELF field.
+        :rtype: str
+        """
+        if (
+            self.host_refresh_interval is not None
+            and time.time() - self._gelf_host_resolved_at >= self.host_refresh_interval
+        ):
+            self._refresh_host_in_background()
+        self.host_cache_hits += 1
+        return self._gelf_host
+
+    def _refresh_host_in_background(self):
+        with self._host_refresh_lock:
+            if self._host_refreshing:
+                return
+            self._host_refreshing = True
+        thread = threading.Thread(target=self._run_host_refresh, name="graypy-host")
+        thread.daemon = True
+        thread.start()
+
+    def _run_host_refresh(self):
+        try:
+            self.refresh_host()
+        finally:
+            with self._host_refresh_lock:
+                self._host_refreshing = False
+
     @staticmethod
     def _resolve_host(fqdn, localname):
         """Resolve the ``host`` GELF field
@@ -262,8 +851,15 @@ class BaseGELFHandler(logging.Handler, ABC):
         if pn is not None:
             gelf_dict["_process_name"] = pn
 
-    @staticmethod
-    def _add_extra_fields(gelf_dict, record):
+    @classmethod
+    def _add_extra_fields(
+        cls,
+        gelf_dict,
+        record,
+        skip_fields=SKIP_EXTRA_FIELDS,
+        allowed_fields=None,
+        renamed_fields=None,
+    ):
         """Add extra fields to the given ``gelf_dict``
 
         However, this does not add additional fields in to ``message_dict``
@@ -284,39 +880,50 @@ class BaseGELFHandler(logging.Handler, ABC):
         :param record: :class:`logging.LogRecord` to extract extra fields
             from to insert into the given ``gelf_dict``.
         :type record: logging.LogRecord
+
+        :param skip_fields: Log record attributes never added as extra
+            fields.
+        :type skip_fields: frozenset
+
+        :param allowed_fields: If specified, only add the log record
+            attributes within it as extra fields.
+        :type allowed_fields: frozenset or None
+
+        :param renamed_fields: Mapping of log record attributes to the GELF
+            field names to add them as.
+        :type renamed_fields: dict or None
         """
-        # skip_list is used to filter additional fields in a log message.
-        skip_list = (
-            "args",
-            "asctime",
-            "created",
-            "exc_info",
-            "exc_text",
-            "filename",
-            "funcName",
-            "id",
-            "levelname",
-            "levelno",
-            "lineno",
-            "module",
-            "msecs",
-            "message",
-            "msg",
-            "name",
-            "pathname",
-            "process",
-            "processName",
-            "relativeCreated",
-            "thread",
-            "threadName",
+        gelf_dict.update(
+            cls._iter_extra_fields(record, skip_fields, allowed_fields, renamed_fields)
         )
 
-        for key, value in record.__dict__.items():
-            if key not in skip_list and not key.startswith("_"):
-                gelf_dict["_%s" % key] = value
+    @staticmethod
+    def _iter_extra_fields(
+        record, skip_fields=SKIP_EXTRA_FIELDS, allowed_fields=None, renamed_fields=None
+    ):
+        """Iterate over the extra fields of a log record
+
+        See :meth:`_add_extra_fields` for the meaning of the arguments.
+
+        :return: Iterator of the GELF field names and values of the extra
+            fields.
+        :rtype: Iterator[tuple(str, object)]
+        """
+        fields = record.__dict__
+        if allowed_fields is not None:
+            keys = allowed_fields.intersection(fields).difference(skip_fields)
+        else:
+            keys = [
+                key
+                for key in set(fields).difference(skip_fields)
+                if not key.startswith("_")
+            ]
+        renamed_fields = renamed_fields or {}
+        for key in keys:
+            yield renamed_fields.get(key) or "_" + key, fields[key]
 
     @classmethod
-    def _pack_gelf_dict(cls, gelf_dict):
+    def _pack_gelf_dict(cls, gelf_dict, json_encoder=None):
         """Convert a given ``gelf_dict`` into JSON-encoded UTF-8 bytes, thus,
         creating an uncompressed GELF log ready for consumption by Graylog.
 
@@ -326,17 +933,32 @@ class BaseGELFHandler(logging.Handler, ABC):
         :param gelf_dict: Dictionary representing a GELF log.
         :type gelf_dict: dict
 
+        :param json_encoder: JSON encoder to serialize the ``gelf_dict``
+            with. If :obj:`None` the python standard library :mod:`json`
+            module is used.
+        :type json_encoder: JSONEncoder or None
+
         :return: Bytes representing a uncompressed GELF log.
         :rtype: bytes
         """
-        gelf_dict = cls._sanitize_to_unicode(gelf_dict)
-        packed = json.dumps(gelf_dict, separators=",:", default=cls._object_to_json)
-        return packed.encode("utf-8")
+        json_encoder = json_encoder or _JSON_ENCODER
+        try:
+            # bytes values are decoded by _object_to_json while serializing
+            return json_encoder.encode(gelf_dict, default=cls._object_to_json)
+        except (TypeError, ValueError):
+            # bytes dictionary keys (or undecodable python 2 strings) need
+            # to be sanitized beforehand
+            return json_encoder.encode(
+                cls._sanitize_to_unicode(gelf_dict), default=cls._object_to_json
+            )
 
     @classmethod
     def _sanitize_to_unicode(cls, obj):
         """Convert all strings records of the object to unicode
 
+        Containers are only copied if they contain strings requiring a
+        conversion, otherwise the given object is returned as is.
+
         :param obj: Object to sanitize to unicode.
         :type obj: object
 
@@ -344,12 +966,28 @@ class BaseGELFHandler(logging.Handler, ABC):
         :rtype: str
         """
         if isinstance(obj, dict):
-            return dict(
-                (cls._sanitize_to_unicode(k), cls._sanitize_to_unicode(v))
-                for k, v in obj.items()
-            )
+            sanitized = None
+            for key, value in obj.items():
+                sanitized_key = cls._sanitize_to_unicode(key)
+                sanitized_value = cls._sanitize_to_unicode(value)
+                if sanitized_key is key and sanitized_value is value:
+                    continue
+                if sanitized is None:
+                    sanitized = dict(obj)
+                if sanitized_key is not key:
+                    del sanitized[key]
+                sanitized[sanitized_key] = sanitized_value
+            return obj if sanitized is None else sanitized
         if isinstance(obj, (list, tuple)):
-            return obj.__class__([cls._sanitize_to_unicode(i) for i in obj])
+            sanitized = None
+            for index, item in enumerate(obj):
+                sanitized_item = cls._sanitize_to_unicode(item)
+                if sanitized_item is item:
+                    continue
+                if sanitized is None:
+                    sanitized = list(obj)
+                sanitized[index] = sanitized_item
+            return obj if sanitized is None else obj.__class__(sanitized)
         if isinstance(obj, data):
             obj = obj.decode("utf-8", errors="replace")
         return obj
@@ -360,7 +998,7 @@ class BaseGELFHandler(logging.Handler, ABC):
         into their string representation (for later JSON serialization).
 
         :class:`datetime.datetime` based objects will be converted into a
-        ISO formatted timestamp string.
+        ISO formatted timestamp string. Bytes are decoded as UTF-8.
 
         :param obj: Object to convert into a string representation.
         :type obj: object
@@ -370,9 +1008,54 @@ class BaseGELFHandler(logging.Handler, ABC):
         """
         if isinstance(obj, datetime.datetime):
             return obj.isoformat()
+        if isinstance(obj, data):
+            return obj.decode("utf-8", errors="replace")
         return repr(obj)
 
 
+class GELFMessageIdGenerator(object):
+    """Generator of the message ids of chunked GELF messages
+
+    The message ids are counted from a random 64 bit value drawn from
+    :func:`os.urandom`: its upper 32 bits are a prefix of the process and
+    its lower 32 bits count its messages. A forked process, e.g. a prefork
+    worker, draws its own value so its message ids do not collide with the
+    ones of its parent and siblings, which would make Graylog mix up their
+    chunks.
+    """
+
+    def __init__(self):
+        self._pid = None
+        self.reseed()
+        if _REGISTER_AT_FORK is not None:
+            ref = weakref.ref(self)
+
+            def reseed():
+                generator = ref()
+                if generator is not None:
+                    generator.reseed()
+
+            _REGISTER_AT_FORK(after_in_child=reseed)
+
+    def reseed(self):
+        """Draw a new random value to count the message ids from"""
+        if _REGISTER_AT_FORK is None:
+            self._pid = os.getpid()
+        self._ids = itertools.count(struct.unpack("=Q", os.urandom(8))[0])
+
+    def __call__(self):
+        """Get the next message id
+
+        :rtype: int
+        """
+        if self._pid is not None and self._pid != os.getpid():
+            self.reseed()
+        return next(self._ids) & _GELF_MESSAGE_ID_MASK
+
+
+_next_message_id = GELFMessageIdGenerator()
+
+
 class BaseGELFChunker(object):
     """Base UDP GELF message chunker
 
@@ -402,17 +1085,29 @@ class BaseGELFChunker(object):
         """
         return int(math.ceil(len(message) * 1.0 / self.chunk_size))
 
-    @staticmethod
-    def _encode(message_id, chunk_seq, total_chunks, chunk):
-        return b"".join(
-            [
-                b"\x1e\x0f",
-                struct.pack("Q", message_id),
-                struct.pack("B", chunk_seq),
-                struct.pack("B", total_chunks),
-                chunk,
-            ]
-        )
+    def _gen_gelf_chunk_parts(self, message):
+        """Generate and iter the headers and payloads of the chunks of a
+        GELF message
+
+        The payloads are views of the message, they are not copied.
+
+        :param message: GELF message to generate and iter chunks for.
+        :type message: bytes
+
+        :return: Iterator of the ``(header, payload)`` of the chunks of a
+            GELF message.
+        :rtype: Iterator[tuple[bytes, memoryview]]
+        """
+        chunk_size = self.chunk_size
+        total_chunks = self._message_chunk_number(message)
+        message_id = _next_message_id()
+        pack_header = GELF_CHUNK_HEADER.pack
+        view = data_view(message)
+        for sequence, offset in enumerate(range(0, len(message), chunk_size)):
+            yield (
+                pack_header(GELF_CHUNK_MAGIC, message_id, sequence, total_chunks),
+                view[offset : offset + chunk_size],
+            )
 
     def _gen_gelf_chunks(self, message):
         """Generate and iter chunks for a GELF message
@@ -423,15 +1118,8 @@ class BaseGELFChunker(object):
         :return: Iterator of the chunks of a GELF message.
         :rtype: Iterator[bytes]
         """
-        total_chunks = self._message_chunk_number(message)
-        message_id = random.randint(0, 0xFFFFFFFFFFFFFFFF)
-        for sequence, chunk in enumerate(
-            (
-                message[i : i + self.chunk_size]
-                for i in range(0, len(message), self.chunk_size)
-            )
-        ):
-            yield self._encode(message_id, sequence, total_chunks, chunk)
+        for header, payload in self._gen_gelf_chunk_parts(message):
+            yield header + payload
 
     def chunk_message(self, message):
         """Chunk a GELF message
@@ -511,11 +1199,33 @@ class GELFTruncatingChunker(BaseGELFChunker):
         :rtype: bytes
         """
         if self.compress:
-            message = zlib.decompress(raw_message)
+            message = decompress(raw_message)
         else:
             message = raw_message
 
-        gelf_dict = json.loads(message.decode("UTF-8"))
+        return self.truncate_gelf_dict(json.loads(message.decode("UTF-8")))
+
+    def truncate_gelf_dict(self, gelf_dict):
+        """Truncate and simplify the GELF dictionary of a chunk overflowing
+        GELF message, before it is packed
+
+        The longest ``short_message`` that does not overflow is searched
+        between the longest length known to fit and the shortest length
+        known to overflow, aiming at half a chunk under the size limit. The
+        lengths tried are extrapolated from the packed bytes per character
+        of the previous attempt until one overflows, then interpolated
+        between both lengths, or bisected after overflowing twice in a row.
+        The search stops once a message fits within a chunk of the size
+        limit, usually after one or two attempts (each packing, and
+        compressing, the message), at most after
+        ``GELF_TRUNCATION_ATTEMPTS``.
+
+        :param gelf_dict: GELF dictionary of a chunk overflowing GELF message.
+        :type gelf_dict: dict
+
+        :return: Truncated and simplified packed GELF message.
+        :rtype: bytes
+        """
         # Simplified GELF message dictionary to base the truncated
         # GELF message from
         simplified_gelf_dict = {
@@ -527,34 +1237,63 @@ class GELFTruncatingChunker(BaseGELFChunker):
             "facility": gelf_dict["facility"],
             "_chunk_overflow": True,
         }
+        short_message = gelf_dict["short_message"]
 
-        # compute a estimate of the number of message chunks left this is
-        # used to estimate the amount of truncation to apply
-        gelf_chunks_free = GELF_MAX_CHUNK_NUMBER - self._message_chunk_number(
-            zlib.compress(self.gelf_packer(simplified_gelf_dict))
-            if self.compress
-            else self.gelf_packer(simplified_gelf_dict)
-        )
-        truncated_short_message = gelf_dict["short_message"][
-            : self.chunk_size * gelf_chunks_free
-        ]
-        for clip in range(gelf_chunks_free, -1, -1):
-            simplified_gelf_dict["short_message"] = truncated_short_message
+        def pack(length):
+            simplified_gelf_dict["short_message"] = short_message[:length]
             packed_message = self.gelf_packer(simplified_gelf_dict)
             if self.compress:
                 packed_message = zlib.compress(packed_message)
-            if self._message_chunk_number(packed_message) <= GELF_MAX_CHUNK_NUMBER:
-                return packed_message
-            else:
-                truncated_short_message = truncated_short_message[: -self.chunk_size]
-        else:
+            return packed_message
+
+        max_size = self.chunk_size * GELF_MAX_CHUNK_NUMBER
+        truncated_message = pack(0)
+        base_size = len(truncated_message)
+        if base_size > max_size:
             raise GELFTruncationFailureWarning(
                 "truncation failed preventing chunk overflowing for GELF message: {}".format(
-                    raw_message
+                    gelf_dict
                 )
             )
 
-    def chunk_message(self, message):
+        # longest known fitting and shortest known chunk overflowing lengths
+        # of short_message, and their packed sizes
+        low, low_size = 0, base_size
+        high, high_size = len(short_message) + 1, None
+        # a fitting message is good enough once under a chunk from the limit
+        target = max_size - self.chunk_size // 2
+        # packed bytes per character of short_message, one unless compressed
+        # or escaped
+        bytes_per_char = 1.0
+        overflows = 0
+        for _ in range(GELF_TRUNCATION_ATTEMPTS):
+            if high - low <= 1 or low_size >= max_size - self.chunk_size:
+                break
+            if high_size is None:
+                # extrapolated from the previous attempt
+                length = low + int((target - low_size) / bytes_per_char)
+            elif overflows < 2:
+                # interpolated between the bounds
+                length = low + int(
+                    (high - low) * (target - low_size) / float(high_size - low_size)
+                )
+            else:
+                # bisected when overflowing again and again
+                length = (low + high) // 2
+            if not low < length < high:
+                length = (low + high) // 2
+            packed_message = pack(length)
+            size = len(packed_message)
+            if size <= max_size:
+                bytes_per_char = max(size - low_size, 1) / float(length - low)
+                low, low_size, truncated_message = length, size, packed_message
+                overflows = 0
+            else:
+                high, high_size = length, size
+                overflows += 1
+        return truncated_message
+
+    def chunk_message(self, message, gelf_dict=None):
         """Chunk a GELF message
 
         Issue a :class:`.handler.GELFChunkOverflowWarning` on chunk
@@ -565,6 +1304,14 @@ class GELFTruncatingChunker(BaseGELFChunker):
         If the truncation and simplification of the chunk overflowing GELF
         message fails issue a :class:`.handler.GELFTruncationFailureWarning`
         and drop the overflowing GELF message.
+
+        :param message: GELF message to chunk.
+        :type message: bytes
+
+        :param gelf_dict: GELF dictionary ``message`` was packed from. If
+            given, a chunk overflowing ``message`` is truncated from it
+            instead of being decompressed and parsed back.
+        :type gelf_dict: dict or None
         """
         if self._message_chunk_number(message) > GELF_MAX_CHUNK_NUMBER:
             warnings.warn(
@@ -572,7 +1319,10 @@ class GELFTruncatingChunker(BaseGELFChunker):
                 GELFChunkOverflowWarning,
             )
             try:
-                message = self.gen_chunk_overflow_gelf_log(message)
+                if gelf_dict is None:
+                    message = self.gen_chunk_overflow_gelf_log(message)
+                else:
+                    message = self.truncate_gelf_dict(gelf_dict)
             except GELFTruncationFailureWarning as w:
                 warnings.warn(w)
                 return
@@ -583,7 +1333,16 @@ class GELFTruncatingChunker(BaseGELFChunker):
 class GELFUDPHandler(BaseGELFHandler, DatagramHandler):
     """GELF UDP handler"""
 
-    def __init__(self, host, port=12202, gelf_chunker=GELFWarningChunker(), **kwargs):
+    def __init__(
+        self,
+        host,
+        port=12202,
+        gelf_chunker=GELFWarningChunker(),
+        resolver=None,
+        connect=False,
+        send_buffer_size=None,
+        **kwargs
+    ):
         """Initialize the GELFUDPHandler
 
         .. note::
@@ -601,23 +1360,210 @@ class GELFUDPHandler(BaseGELFHandler, DatagramHandler):
         :param gelf_chunker: :class:`.handler.BaseGELFChunker` instance to
             handle chunking larger GELF messages.
         :type gelf_chunker: GELFWarningChunker
+
+        :param resolver: :class:`.resolver.CachedResolver` of the address of
+            the GELF UDP input. Defaults to the resolver shared by the GELF
+            handlers.
+        :type resolver: CachedResolver or None
+
+        :param connect: If :obj:`True` connect the UDP socket to the GELF UDP
+            input, so the kernel looks its route up once instead of for
+            every datagram.
+        :type connect: bool
+
+        :param send_buffer_size: If specified, size in bytes of the send
+            buffer of the UDP socket (``SO_SNDBUF``), e.g. large enough for
+            the chunks of a burst of GELF logs not to be dropped locally.
+        :type send_buffer_size: int or None
         """
         BaseGELFHandler.__init__(self, **kwargs)
         DatagramHandler.__init__(self, host, port)
         self.gelf_chunker = gelf_chunker
+        self.resolver = DEFAULT_RESOLVER if resolver is None else resolver
+        self.connect = connect
+        self.send_buffer_size = send_buffer_size
+        # address the UDP socket is connected to
+        self._connected_address = None
+
+    def _resolve(self):
+        # like by DatagramHandler, the GELF UDP input is reached over IPv4
+        return self.resolver.resolve(
+            self.host, self.port, socket.SOCK_DGRAM, socket.AF_INET
+        )[1]
+
+    def makeSocket(self):
+        """Create a UDP socket for the cached address of the GELF UDP input,
+        connected to it if ``connect`` is set"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if self.send_buffer_size is not None:
+                sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size
+                )
+            if self.connect:
+                address = self._resolve()
+                sock.connect(address)
+                self._connected_address = address
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def emit(self, record):
+        """Emit a record
+
+        A chunk overflowing GELF message is truncated by a
+        :class:`.handler.GELFTruncatingChunker` from the GELF dictionary of
+        the record, rather than from the packed GELF message.
+        """
+        try:
+            s = self.makePickle(record)
+            chunker = self.gelf_chunker
+            if (
+                isinstance(chunker, GELFTruncatingChunker)
+                and chunker._message_chunk_number(s) > GELF_MAX_CHUNK_NUMBER
+            ):
+                self._send_chunked(s, self._make_gelf_dict(record))
+            else:
+                self.send(s)
+        except Exception:
+            self.handleError(record)
 
     def send(self, s):
         if len(s) < self.gelf_chunker.chunk_size:
-            super(GELFUDPHandler, self).send(s)
+            metrics = self.metrics
+            sampled = metrics.sampled
+            if sampled:
+                start = clock()
+            if not self._send_datagrams((s,)):
+                metrics.count("unsent")
+                return
+            if sampled:
+                metrics.timed("send", start)
+            metrics.count("sent")
+            metrics.count("bytes", len(s))
         else:
-            for chunk in self.gelf_chunker.chunk_message(s):
-                super(GELFUDPHandler, self).send(chunk)
+            self._send_chunked(s)
+
+    def _send_chunked(self, s, gelf_dict=None):
+        """Chunk a GELF log with the ``gelf_chunker`` and send its chunks
 
+        :param s: GELF log to chunk.
+        :type s: bytes
 
-class GELFTCPHandler(BaseGELFHandler, SocketHandler):
+        :param gelf_dict: GELF dictionary a :class:`GELFTruncatingChunker`
+            truncates a chunk overflowing ``s`` from.
+        :type gelf_dict: dict or None
+        """
+        datagrams = self._chunk(s, gelf_dict)
+        if not datagrams:
+            return
+        metrics = self.metrics
+        sampled = metrics.sampled
+        if sampled:
+            start = clock()
+        if not self._send_datagrams(datagrams):
+            metrics.count("unsent")
+            return
+        if sampled:
+            metrics.timed("send", start)
+        metrics.count("sent")
+        metrics.count("bytes", sum(len(datagram) for datagram in datagrams))
+
+    def _chunk(self, s, gelf_dict=None):
+        """Chunk a GELF log with the ``gelf_chunker``
+
+        :return: The chunks of the GELF log, none if it was dropped.
+        :rtype: list[bytes]
+        """
+        metrics = self.metrics
+        chunker = self.gelf_chunker
+        sampled = metrics.sampled
+        if sampled:
+            start = clock()
+        overflow = chunker._message_chunk_number(s) > GELF_MAX_CHUNK_NUMBER
+        if gelf_dict is None:
+            datagrams = list(chunker.chunk_message(s))
+        else:
+            datagrams = list(chunker.chunk_message(s, gelf_dict))
+        if sampled:
+            metrics.timed("chunk", start)
+        if overflow:
+            metrics.count("chunk_overflows")
+            if datagrams:
+                metrics.count("truncated")
+        return datagrams
+
+    def _send_datagrams(self, datagrams):
+        """Send several datagrams over the same socket in a tight loop
+
+        The socket is only (re)created once for the whole batch, instead of
+        once per datagram through :meth:`logging.handlers.DatagramHandler.send`,
+        and the datagrams are sent to the cached address of the GELF UDP
+        input rather than to its host name, resolved by every ``sendto``.
+
+        With ``connect`` set the datagrams are sent over the connected
+        socket, which is connected again if the address of the GELF UDP
+        input changed.
+
+        :param datagrams: Datagrams to send, in order.
+        :type datagrams: Iterable[bytes]
+
+        :return: :obj:`False` if the socket could not be created or the
+            GELF UDP input refused the datagrams.
+        :rtype: bool
+        """
+        address = self._resolve()
+        if self.connect and self.sock is not None:
+            if address != self._connected_address:
+                self.sock.close()
+                self.sock = None
+        if self.sock is None:
+            self.createSocket()
+            if self.sock is None:
+                return False
+        if self.connect:
+            return self._send_connected(datagrams)
+        sendto = self.sock.sendto
+        for datagram in datagrams:
+            sendto(datagram, address)
+        return True
+
+    def _send_connected(self, datagrams):
+        send = self.sock.send
+        for datagram in datagrams:
+            try:
+                send(datagram)
+            except socket.error as exc:
+                if exc.errno != errno.ECONNREFUSED:
+                    raise
+                # a connected UDP socket reports that a previous datagram
+                # was refused (ICMP port unreachable) instead of sending the
+                # next one, which is sent again once
+                try:
+                    send(datagram)
+                except socket.error as exc:
+                    if exc.errno != errno.ECONNREFUSED:
+                        raise
+                    return False
+        return True
+
+
+class GELFTCPHandler(BaseGELFHandler, ReconnectingSocketHandler):
     """GELF TCP handler"""
 
-    def __init__(self, host, port=12201, **kwargs):
+    def __init__(
+        self,
+        host,
+        port=12201,
+        coalesce_bytes=None,
+        coalesce_interval=0.05,
+        backoff=None,
+        outage_policy=OUTAGE_DROP,
+        outage_buffer_size=1000,
+        resolver=None,
+        **kwargs
+    ):
         """Initialize the GELFTCPHandler
 
         :param host: GELF TCP input host.
@@ -626,6 +1572,33 @@ class GELFTCPHandler(BaseGELFHandler, SocketHandler):
         :param port: GELF TCP input port.
         :type port: int
 
+        :param coalesce_bytes: If specified, enable write coalescing: GELF
+            logs are buffered and written to the socket at once when they
+            add up to this many bytes.
+        :type coalesce_bytes: int or None
+
+        :param coalesce_interval: Maximum number of seconds a GELF log is
+            buffered when write coalescing is enabled.
+        :type coalesce_interval: float
+
+        :param backoff: If specified, reconnect in the background with this
+            :class:`.reconnect.Backoff` policy instead of from the logging
+            caller's thread.
+        :type backoff: Backoff or None
+
+        :param outage_policy: What to do with GELF logs while reconnecting
+            in the background. ``"drop"`` or ``"buffer"``.
+        :type outage_policy: str
+
+        :param outage_buffer_size: Maximum number of GELF logs buffered while
+            reconnecting in the background.
+        :type outage_buffer_size: int
+
+        :param resolver: :class:`.resolver.CachedResolver` of the address of
+            the GELF TCP input. Defaults to the resolver shared by the GELF
+            handlers.
+        :type resolver: CachedResolver or None
+
         .. attention::
             GELF TCP does not support compression due to the use of the null
             byte (``\\0``) as frame delimiter.
@@ -634,7 +1607,23 @@ class GELFTCPHandler(BaseGELFHandler, SocketHandler):
             ``compress`` to :obj:`True` and is locked to :obj:`False`.
         """
         BaseGELFHandler.__init__(self, compress=False, **kwargs)
-        SocketHandler.__init__(self, host, port)
+        ReconnectingSocketHandler.__init__(
+            self,
+            host,
+            port,
+            backoff=backoff,
+            outage_policy=outage_policy,
+            outage_buffer_size=outage_buffer_size,
+        )
+        self.resolver = DEFAULT_RESOLVER if resolver is None else resolver
+        self.coalescer = None
+        if coalesce_bytes is not None:
+            self.coalescer = BatchBuffer(
+                self._send_frames,
+                batch_size=None,
+                batch_interval=coalesce_interval,
+                batch_bytes=coalesce_bytes,
+            )
 
     def makePickle(self, record):
         """Add a null terminator to generated pickles as TCP frame objects
@@ -649,6 +1638,105 @@ class GELFTCPHandler(BaseGELFHandler, SocketHandler):
         """
         return super(GELFTCPHandler, self).makePickle(record) + b"\x00"
 
+    def makeSocket(self, timeout=1):
+        """Connect to the cached address of the GELF TCP input"""
+        return create_connection(self.resolver, self.host, self.port, timeout)
+
+    def send(self, s):
+        """Send a null terminated GELF log, or buffer it if write coalescing
+        is enabled"""
+        if self.coalescer is not None:
+            self.coalescer.add(s)
+            return
+        metrics = self.metrics
+        sampled = metrics.sampled
+        if sampled:
+            start = clock()
+        if not ReconnectingSocketHandler.send(self, s):
+            metrics.count("unsent")
+            return
+        if sampled:
+            metrics.timed("send", start)
+        metrics.count("sent")
+        metrics.count("bytes", len(s))
+
+    def _send_frames(self, frames):
+        """Write coalesced null terminated GELF logs to the socket at once
+
+        Like :meth:`.reconnect.ReconnectingSocketHandler.send` the GELF logs
+        are dropped, or buffered during an outage, if the socket cannot be
+        (re)created or written to.
+
+        :param frames: Null terminated GELF logs.
+        :type frames: list[bytes]
+        """
+        if self._spooling():
+            self._unsent(frames)
+            return
+        start = clock()
+        if self.sock is None:
+            self.createSocket()
+        sock = self.sock
+        if not sock:
+            self._unsent(frames)
+            return
+        try:
+            if len(frames) > 1 and self._supports_sendmsg(sock):
+                for offset in range(0, len(frames), _IOV_MAX):
+                    self._sendmsg_all(sock, frames[offset : offset + _IOV_MAX])
+            else:
+                sock.sendall(b"".join(frames))
+        except socket.error:
+            sock.close()
+            self.sock = None
+            self._unsent(frames)
+            return
+        metrics = self.metrics
+        # writes of coalesced GELF logs are always timed
+        metrics.timed("send", start)
+        metrics.count("sent", len(frames))
+        metrics.count("bytes", sum(len(frame) for frame in frames))
+
+    def _unsent(self, frames):
+        self.metrics.count("unsent", len(frames))
+        self._handle_outage(frames)
+
+    @staticmethod
+    def _supports_sendmsg(sock):
+        # TLS sockets do not support scatter/gather writes
+        return hasattr(sock, "sendmsg") and not isinstance(sock, ssl.SSLSocket)
+
+    @staticmethod
+    def _sendmsg_all(sock, buffers):
+        """Write buffers with a single scatter/gather (writev) call,
+        finishing partial writes with :meth:`socket.socket.sendall`"""
+        sent = sock.sendmsg(buffers)
+        if sent < sum(len(buffer) for buffer in buffers):
+            sock.sendall(b"".join(buffers)[sent:])
+
+    def flush(self, timeout=None):
+        """Send the queued log records and the coalesced GELF logs
+
+        :param timeout: Maximum number of seconds to wait for the queue of
+            the asynchronous mode. If :obj:`None` wait for
+            ``shutdown_timeout`` at most.
+        :type timeout: float or None
+
+        :return: :obj:`False` if queued log records remain unsent after
+            ``timeout``, otherwise :obj:`True`.
+        :rtype: bool
+        """
+        flushed = BaseGELFHandler.flush(self, timeout)
+        if self.coalescer is not None:
+            self.coalescer.flush()
+        return flushed
+
+    def close(self):
+        """Send the coalesced GELF logs and close the socket"""
+        if self.coalescer is not None:
+            self.coalescer.close()
+        BaseGELFHandler.close(self)
+
 
 class GELFTLSHandler(GELFTCPHandler):
     """GELF TCP handler with TLS support"""
@@ -661,6 +1749,7 @@ class GELFTLSHandler(GELFTCPHandler):
         ca_certs=None,
         certfile=None,
         keyfile=None,
+        ssl_context=None,
         **kwargs
     ):
         """Initialize the GELFTLSHandler
@@ -685,6 +1774,12 @@ class GELFTLSHandler(GELFTCPHandler):
         :param keyfile: Path to the client private key. If the private key is
             stored with the certificate, this parameter can be ignored.
         :type keyfile: str
+
+        :param ssl_context: TLS configuration of the connections, e.g. for
+            custom ciphers or a CA loaded from memory. If specified,
+            ``validate``, ``ca_certs``, ``certfile`` and ``keyfile`` are
+            ignored.
+        :type ssl_context: ssl.SSLContext or None
         """
         if validate and ca_certs is None:
             raise ValueError("CA bundle file path must be specified")
@@ -698,32 +1793,369 @@ class GELFTLSHandler(GELFTCPHandler):
         self.reqs = ssl.CERT_REQUIRED if validate else ssl.CERT_NONE
         self.certfile = certfile
         self.keyfile = keyfile if keyfile else certfile
+        self._ssl_context = ssl_context
+        #: TLS session of the last connection, resumed by the next one
+        self.tls_session = None
+        self._tls_ticket_polls = 0
+
+    @property
+    def ssl_context(self):
+        """TLS configuration shared by every connection
+
+        Unless given to the constructor it is built on the first connection
+        from ``validate``, ``ca_certs``, ``certfile`` and ``keyfile`` and
+        then reused, so reconnecting does not load the CA bundle and the
+        client certificate again.
+        """
+        if self._ssl_context is None:
+            self._ssl_context = self._make_ssl_context()
+        return self._ssl_context
+
+    @ssl_context.setter
+    def ssl_context(self, ssl_context):
+        self._ssl_context = ssl_context
+        # sessions cannot be resumed with another context
+        self.tls_session = None
+
+    def _make_ssl_context(self):
+        context = ssl.SSLContext(
+            getattr(ssl, "PROTOCOL_TLS_CLIENT", ssl.PROTOCOL_SSLv23)
+        )
+        context.check_hostname = False
+        context.verify_mode = self.reqs
+        if self.ca_certs is not None:
+            context.load_verify_locations(self.ca_certs)
+        if self.certfile is not None:
+            context.load_cert_chain(self.certfile, self.keyfile)
+        return context
 
     def makeSocket(self, timeout=1):
-        """Create a TLS wrapped socket"""
-        plain_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        if hasattr(plain_socket, "settimeout"):
-            plain_socket.settimeout(timeout)
-
-        wrapped_socket = ssl.wrap_socket(
-            plain_socket,
-            ca_certs=self.ca_certs,
-            cert_reqs=self.reqs,
-            keyfile=self.keyfile,
-            certfile=self.certfile,
+        """Create a TLS wrapped socket, resuming the TLS session of the
+        previous connection if the server allows it"""
+        kwargs = {"server_hostname": self.host}
+        if self.tls_session is not None:
+            kwargs["session"] = self.tls_session
+        wrapped_socket = create_connection(
+            self.resolver,
+            self.host,
+            self.port,
+            timeout,
+            wrap=lambda plain_socket: self.ssl_context.wrap_socket(
+                plain_socket, **kwargs
+            ),
         )
-        wrapped_socket.connect((self.host, self.port))
+        self._tls_ticket_polls = 0
+        self._save_tls_session(wrapped_socket)
 
         return wrapped_socket
 
+    def send(self, s):
+        GELFTCPHandler.send(self, s)
+        if self.coalescer is None and self.sock is not None:
+            self._save_tls_session(self.sock)
+
+    def _send_frames(self, frames):
+        GELFTCPHandler._send_frames(self, frames)
+        if self.sock is not None:
+            self._save_tls_session(self.sock)
+
+    def _save_tls_session(self, sock):
+        """Keep the TLS session of the connection to resume it on the next
+        one
+
+        TLS 1.3 session tickets are sent after the handshake and only
+        processed when reading from the socket, they are polled for after
+        the first writes of every connection.
+        """
+        if self._tls_ticket_polls >= _TLS_TICKET_POLLS:
+            return
+        self._tls_ticket_polls += 1
+        self._read_pending(sock)
+        session = getattr(sock, "session", None)  # python 3.6+
+        if session is None:
+            self._tls_ticket_polls = _TLS_TICKET_POLLS
+        elif session.has_ticket or sock.version() != "TLSv1.3":
+            self.tls_session = session
+            self._tls_ticket_polls = _TLS_TICKET_POLLS
+
+    @staticmethod
+    def _read_pending(sock):
+        """Read what the server sent without blocking
+
+        GELF inputs only send TLS records such as session tickets, which
+        must be read: closing a socket with unread data resets the
+        connection and the server may discard the last GELF logs.
+        """
+        timeout = sock.gettimeout()
+        try:
+            sock.setblocking(False)
+            while sock.recv(4096):
+                pass
+        except socket.error:
+            pass
+        finally:
+            sock.settimeout(timeout)
+
+    def close(self):
+        """Send the queued and coalesced GELF logs and close the socket"""
+        # stop everything that may still write to the socket first
+        if self.coalescer is not None:
+            self.coalescer.close()
+        if self.sender is not None:
+            self.sender.close(self.shutdown_timeout)
+        self.acquire()
+        try:
+            if self.sock is not None:
+                self._read_pending(self.sock)
+        finally:
+            self.release()
+        GELFTCPHandler.close(self)
+
+
+class GELFHTTPError(httplib.HTTPException):
+    """GELF HTTP input rejecting a request with a non 2xx response
+
+    :ivar status: Status code of the response.
+    """
+
+    def __init__(self, status, reason):
+        httplib.HTTPException.__init__(
+            self, "GELF HTTP input responded {} {}".format(status, reason)
+        )
+        self.status = status
+
+
+def _check_response(response):
+    """Raise a :class:`GELFHTTPError` if a HTTP response is not a 2xx one
+
+    :return: The response.
+    :rtype: httplib.HTTPResponse
+    """
+    if not 200 <= response.status < 300:
+        raise GELFHTTPError(response.status, response.reason)
+    return response
+
+
+class CachedHTTPConnection(httplib.HTTPConnection):
+    """:class:`httplib.HTTPConnection` connecting to the cached address of
+    its host, which the ``Host`` header still names"""
+
+    def __init__(self, host, port=None, timeout=5, resolver=None):
+        httplib.HTTPConnection.__init__(self, host=host, port=port, timeout=timeout)
+        self.resolver = DEFAULT_RESOLVER if resolver is None else resolver
+        # python 3 opens its connections through _create_connection
+        self._create_connection = self._create_cached_connection
+
+    def _create_cached_connection(self, address, timeout=None, source_address=None):
+        return create_connection(self.resolver, address[0], address[1], timeout)
+
+
+# errors of a reused keep-alive connection closed by the server while idle
+_STALE_CONNECTION_ERRNOS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+
+def _stale_connection_error(exc):
+    """Check if a reused connection failed before the server responded
+    anything, e.g. because the server closed it while idle, in which case
+    the request can be sent again over a new connection
+
+    Timeouts are never such errors, the server may still be processing the
+    request.
+
+    :rtype: bool
+    """
+    if isinstance(exc, socket.timeout):
+        return False
+    if isinstance(exc, httplib.BadStatusLine):
+        # RemoteDisconnected in python 3, an empty status line in python 2
+        return isinstance(
+            exc, getattr(httplib, "RemoteDisconnected", ())
+        ) or exc.line in ("", "''")
+    return isinstance(exc, socket.error) and exc.errno in _STALE_CONNECTION_ERRNOS
+
+
+class HTTPConnectionPool(object):
+    """Thread-safe pool of persistent (keep-alive) HTTP connections
+
+    Connections are reused across requests instead of being opened and torn
+    down for every request. At most ``pool_size`` requests are in flight at
+    once, further callers block until a connection is released.
+    """
+
+    def __init__(
+        self, host, port, timeout=5, pool_size=1, idle_timeout=30, resolver=None
+    ):
+        """Initialize the HTTPConnectionPool
+
+        :param host: HTTP server host.
+        :type host: str
+
+        :param port: HTTP server port.
+        :type port: int
+
+        :param timeout: Socket timeout in seconds of each pooled connection.
+        :type timeout: int
+
+        :param pool_size: Maximum number of connections kept by the pool.
+        :type pool_size: int
+
+        :param idle_timeout: Number of seconds a connection may sit unused
+            in the pool before it is closed and replaced by a new one.
+            If :obj:`None` idle connections are never expired.
+        :type idle_timeout: float or None
+
+        :param resolver: :class:`.resolver.CachedResolver` of the address of
+            the HTTP server. Defaults to the resolver shared by the GELF
+            handlers.
+        :type resolver: CachedResolver or None
+        """
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.resolver = resolver
+        self._idle = collections.deque()
+        self._idle_lock = threading.Lock()
+        self._slots = threading.Semaphore(pool_size)
+
+    def _new_connection(self):
+        return CachedHTTPConnection(
+            self.host, self.port, timeout=self.timeout, resolver=self.resolver
+        )
+
+    def _acquire(self):
+        """Take a connection out of the pool, creating it if necessary
+
+        :return: Tuple of a connection and a flag noting whether it was
+            reused from the pool.
+        :rtype: tuple(httplib.HTTPConnection, bool)
+        """
+        self._slots.acquire()
+        now = time.time()
+        with self._idle_lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if self.idle_timeout is None or now - last_used < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self._new_connection(), False
+
+    def _release(self, connection):
+        with self._idle_lock:
+            self._idle.append((connection, time.time()))
+        self._slots.release()
+
+    @staticmethod
+    def _request(connection, method, path, body, headers, reused=False):
+        """Send a HTTP request and read its response
+
+        If a ``reused`` connection fails before the server responded
+        anything (see :func:`_stale_connection_error`) the request is sent
+        again once over a fresh connection.
+        """
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        except (socket.error, httplib.HTTPException) as exc:
+            if not (reused and _stale_connection_error(exc)):
+                raise
+            # a closed connection is transparently reopened on request
+            connection.close()
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        # the response must be fully read before the connection can be reused
+        response.read()
+        if response.will_close:
+            connection.close()
+        return response
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a HTTP request over a pooled connection
+
+        If a reused connection turns out to be broken before the server
+        responded anything (e.g. it was closed by the server while idle) the
+        request is retried once over a fresh connection. Requests timing out
+        are never retried.
+
+        :return: The (already read) HTTP response.
+        :rtype: httplib.HTTPResponse
+        """
+        headers = headers or {}
+        connection, reused = self._acquire()
+        try:
+            response = self._request(connection, method, path, body, headers, reused)
+        except Exception:
+            connection.close()
+            self._slots.release()
+            raise
+        self._release(connection)
+        return response
+
+    def request_many(self, method, path, requests):
+        """Send HTTP requests one after the other over a single pooled
+        connection
+
+        :param requests: ``(body, headers)`` of the requests to send.
+        :type requests: Iterable[tuple[bytes, dict]]
+
+        :return: The (already read) HTTP responses.
+        :rtype: list[httplib.HTTPResponse]
+        """
+        responses = []
+        connection, reused = self._acquire()
+        try:
+            for body, headers in requests:
+                response = self._request(
+                    connection, method, path, body, headers, reused
+                )
+                responses.append(response)
+                # the connection is known to work from now on
+                reused = False
+        except Exception:
+            connection.close()
+            self._slots.release()
+            raise
+        self._release(connection)
+        return responses
+
+    def close(self):
+        """Close all the idle connections of the pool"""
+        with self._idle_lock:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                connection.close()
+
+
+#: Send every batch as a single request of newline delimited GELF logs
+BATCH_NDJSON = "ndjson"
+#: Send every GELF log of a batch in its own request over one connection
+BATCH_SEQUENTIAL = "sequential"
+
+BATCH_MODES = (BATCH_NDJSON, BATCH_SEQUENTIAL)
+
 
 # TODO: add https?
 class GELFHTTPHandler(BaseGELFHandler):
     """GELF HTTP handler"""
 
     def __init__(
-        self, host, port=12203, compress=True, path="/gelf", timeout=5, **kwargs
+        self,
+        host,
+        port=12203,
+        compress=True,
+        path="/gelf",
+        timeout=5,
+        pool_size=1,
+        idle_timeout=30,
+        batch_size=None,
+        batch_interval=1.0,
+        batch_mode=BATCH_NDJSON,
+        batch_path=None,
+        resolver=None,
+        **kwargs
     ):
         """Initialize the GELFHTTPHandler
 
@@ -734,8 +2166,10 @@ class GELFHTTPHandler(BaseGELFHandler):
         :type port: int
 
         :param compress: If :obj:`True` compress the GELF message before
-            sending it to the Graylog server.
-        :type compress: bool
+            sending it to the Graylog server. A
+            :class:`.compression.CompressionPolicy` can be given to tune
+            the compression, e.g. to use gzip framing.
+        :type compress: bool or CompressionPolicy
 
         :param path: Path of the HTTP input.
             (see http://docs.graylog.org/en/latest/pages/sending_data.html#gelf-via-http)
@@ -744,7 +2178,44 @@ class GELFHTTPHandler(BaseGELFHandler):
         :param timeout: Number of seconds the HTTP client should wait before
             it discards the request if the Graylog server doesn't respond.
         :type timeout: int
+
+        :param pool_size: Maximum number of persistent HTTP connections
+            kept open to the Graylog server.
+        :type pool_size: int
+
+        :param idle_timeout: Number of seconds an unused persistent HTTP
+            connection is kept open before being replaced.
+        :type idle_timeout: float or None
+
+        :param batch_size: If specified, enable the batching mode: GELF logs
+            are sent by batches of up to this many.
+        :type batch_size: int or None
+
+        :param batch_interval: Maximum number of seconds a GELF log waits
+            for its batch to fill up in batching mode.
+        :type batch_interval: float
+
+        :param batch_mode: ``"ndjson"`` to send every batch in a single
+            request of newline delimited GELF logs, or ``"sequential"`` to
+            send every GELF log of a batch in its own request, back to back
+            over one persistent HTTP connection.
+        :type batch_mode: str
+
+        :param batch_path: Path of the HTTP input accepting newline
+            delimited GELF logs. Defaults to ``path``.
+        :type batch_path: str or None
+
+        :param resolver: :class:`.resolver.CachedResolver` of the address of
+            the GELF HTTP input. Defaults to the resolver shared by the GELF
+            handlers.
+        :type resolver: CachedResolver or None
         """
+        if batch_mode not in BATCH_MODES:
+            raise ValueError(
+                "invalid batch_mode (expected one of {}): {}".format(
+                    BATCH_MODES, batch_mode
+                )
+            )
         BaseGELFHandler.__init__(self, compress=compress, **kwargs)
 
         self.host = host
@@ -752,20 +2223,215 @@ class GELFHTTPHandler(BaseGELFHandler):
         self.path = path
         self.timeout = timeout
         self.headers = {}
+        self.pool = HTTPConnectionPool(
+            host,
+            port,
+            timeout=timeout,
+            pool_size=pool_size,
+            idle_timeout=idle_timeout,
+            resolver=resolver,
+        )
+
+        self.batch_mode = batch_mode
+        self.batch_path = path if batch_path is None else batch_path
+        self.batch = None
+        if batch_size is not None:
+            self.batch = BatchBuffer(
+                self._send_batch, batch_size=batch_size, batch_interval=batch_interval
+            )
 
-        if compress:
-            self.headers["Content-Encoding"] = "gzip,deflate"
+    def _headers(self, content_encoding):
+        if content_encoding is None:
+            return self.headers
+        headers = dict(self.headers)
+        headers["Content-Encoding"] = content_encoding
+        return headers
 
     def emit(self, record):
         """Convert a :class:`logging.LogRecord` to GELF and emit it to Graylog
         via a HTTP POST request
 
+        In batching mode the GELF log is only added to the current batch.
+
         :param record: :class:`logging.LogRecord` to convert into a GELF log
             and emit to Graylog via a HTTP POST request.
         :type record: logging.LogRecord
         """
-        pickle = self.makePickle(record)
-        connection = httplib.HTTPConnection(
-            host=self.host, port=self.port, timeout=self.timeout
-        )
-        connection.request("POST", self.path, pickle, self.headers)
+        try:
+            if self.batch is not None:
+                if self.batch_mode == BATCH_NDJSON:
+                    # the whole batch is compressed at once
+                    self.batch.add((record, self._pack_record(record), None))
+                else:
+                    self.batch.add((record,) + self._make_pickle(record))
+                return
+            pickle, content_encoding = self._make_pickle(record)
+            metrics = self.metrics
+            if self._spooling():
+                metrics.count("unsent")
+                self._spool.append(pickle)
+                return
+            sampled = metrics.sampled
+            if sampled:
+                start = clock()
+            try:
+                _check_response(
+                    self.pool.request(
+                        "POST", self.path, pickle, self._headers(content_encoding)
+                    )
+                )
+            except (socket.error, httplib.HTTPException) as exc:
+                if self._spool is None:
+                    if not (isinstance(exc, GELFHTTPError) and 400 <= exc.status < 500):
+                        # not rejected for the GELF log itself
+                        metrics.count("unsent")
+                    raise
+                metrics.count("unsent")
+                self._spool.append(pickle)
+                return
+            if sampled:
+                metrics.timed("send", start)
+            metrics.count("sent")
+            metrics.count("bytes", len(pickle))
+        except Exception:
+            self.handleError(record)
+
+    def _send_spooled(self, data):
+        """Send a spooled GELF log from the drain thread of the spool
+
+        :return: :obj:`True` if it was sent.
+        :rtype: bool
+        """
+        framing = detect_framing(data)
+        if framing is not None:
+            content_encoding = CONTENT_ENCODINGS[framing]
+        elif self.compression is not None:
+            # GELF logs of NDJSON batches are spooled uncompressed
+            data, content_encoding = self.compression.compress(data)
+        else:
+            content_encoding = None
+        try:
+            _check_response(
+                self.pool.request(
+                    "POST", self.path, data, self._headers(content_encoding)
+                )
+            )
+        except GELFHTTPError as exc:
+            if 400 <= exc.status < 500:
+                # rejected for good, retrying it would block the spool
+                self.metrics.count("errors")
+                return True
+            return False
+        except (socket.error, httplib.HTTPException):
+            return False
+        return True
+
+    def _send_batch(self, batch):
+        """Send a batch of ``(record, pickle, content_encoding)``
+
+        The GELF logs of the batch are spooled if the batch cannot be sent,
+        or rejected with a non 2xx response (e.g. by a GELF HTTP input not
+        accepting NDJSON batches, the spooled GELF logs being sent one by
+        one), otherwise the error is handled.
+
+        :param batch: Batch of GELF logs to send.
+        :type batch: list[tuple[logging.LogRecord, bytes, str or None]]
+        """
+        metrics = self.metrics
+        if self._spooling():
+            metrics.count("unsent", len(batch))
+            for _, pickle, _ in batch:
+                self._spool.append(pickle)
+            return
+        try:
+            if self.batch_mode == BATCH_NDJSON:
+                body = b"\n".join(pickle for _, pickle, _ in batch)
+                content_encoding = None
+                if self.compression is not None:
+                    start = clock()
+                    body, content_encoding = self.compression.compress(body)
+                    metrics.timed("compress", start)
+                    if content_encoding is not None:
+                        metrics.count("compressed")
+                start = clock()
+                _check_response(
+                    self.pool.request(
+                        "POST", self.batch_path, body, self._headers(content_encoding)
+                    )
+                )
+                sent_bytes = len(body)
+            else:
+                start = clock()
+                responses = self.pool.request_many(
+                    "POST",
+                    self.path,
+                    [
+                        (pickle, self._headers(content_encoding))
+                        for _, pickle, content_encoding in batch
+                    ],
+                )
+                accepted, rejected = [], []
+                for item, response in zip(batch, responses):
+                    if 200 <= response.status < 300:
+                        accepted.append(item)
+                    else:
+                        rejected.append((item, response))
+                if rejected:
+                    batch = accepted
+                    try:
+                        _check_response(rejected[0][1])
+                    except GELFHTTPError:
+                        self._unsent_batch([item for item, _ in rejected])
+                sent_bytes = sum(len(pickle) for _, pickle, _ in batch)
+        except (socket.error, httplib.HTTPException):
+            self._unsent_batch(batch)
+        except Exception:
+            metrics.count("unsent", len(batch))
+            self._handle_batch_error(batch)
+        else:
+            # batches are always timed
+            metrics.timed("send", start)
+            metrics.count("sent", len(batch))
+            metrics.count("bytes", sent_bytes)
+
+    def _unsent_batch(self, batch):
+        """Spool the GELF logs of a batch that could not be sent, or handle
+        the error being raised if no spool is set"""
+        self.metrics.count("unsent", len(batch))
+        if self._spool is None:
+            self._handle_batch_error(batch)
+            return
+        for _, pickle, _ in batch:
+            self._spool.append(pickle)
+
+    def flush(self, timeout=None):
+        """Send the queued log records and the current batch
+
+        :param timeout: Maximum number of seconds to wait for the queue of
+            the asynchronous mode. If :obj:`None` wait for
+            ``shutdown_timeout`` at most.
+        :type timeout: float or None
+
+        :return: :obj:`False` if queued log records remain unsent after
+            ``timeout``, otherwise :obj:`True`.
+        :rtype: bool
+        """
+        flushed = BaseGELFHandler.flush(self, timeout)
+        if self.batch is not None:
+            self.batch.flush()
+        return flushed
+
+    def close(self):
+        """Send the current batch and close the persistent HTTP connections
+        to the Graylog server"""
+        # the sender thread may still add to the batch, which may be spooled
+        if self.sender is not None:
+            self.sender.close(self.shutdown_timeout)
+        if self.batch is not None:
+            self.batch.close()
+        BaseGELFHandler.close(self)
+        self.acquire()
+        try:
+            self.pool.close()
+        finally:
+            self.release()
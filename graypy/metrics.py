@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Counters and latency histograms of the stages GELF handlers convert and
+send log records through"""
+
+import random
+import threading
+import time
+
+#: Stages timed by the GELF handlers:
+#:
+#: * ``"format"`` - formatting the message of a log record, and building
+#:   its GELF dictionary if the compiled GELF log template cannot be used
+#: * ``"serialize"`` - serializing a GELF log to JSON
+#: * ``"compress"`` - compressing a GELF log (or a batch of GELF logs)
+#: * ``"chunk"`` - splitting a GELF log into GELF UDP chunks
+#: * ``"send"`` - writing to the transport, once per GELF log or per batch
+#:   when batching or write coalescing is enabled
+STAGES = ("format", "serialize", "compress", "chunk", "send")
+
+#: Counters of the GELF handlers, see :class:`Metrics`
+COUNTERS = (
+    "records",
+    "compressed",
+    "chunk_overflows",
+    "truncated",
+    "sent",
+    "bytes",
+    "unsent",
+    "errors",
+)
+
+if hasattr(time, "perf_counter"):  # python 3.3+
+    clock = time.perf_counter
+else:
+    clock = time.time
+
+# durations under 8 microseconds get a bucket per microsecond, longer ones
+# 4 buckets per power of two, the last bucket holding durations over
+# 2 ** _MAX_BITS microseconds (about 36 minutes)
+_MAX_BITS = 31
+_BUCKETS = (_MAX_BITS - 1) * 4 + 1
+
+
+def _bucket(microseconds):
+    if microseconds < 8:
+        return microseconds
+    bits = microseconds.bit_length()
+    if bits > _MAX_BITS:
+        return _BUCKETS - 1
+    return (bits - 2) * 4 + ((microseconds >> (bits - 3)) & 3)
+
+
+def _bucket_upper_bound(index):
+    """Upper bound in seconds of the durations of a bucket"""
+    if index < 8:
+        return (index + 1) / 1e6
+    shift = index // 4 - 1
+    return ((4 + index % 4 + 1) << shift) / 1e6
+
+
+class LatencyHistogram(object):
+    """Histogram of durations, with buckets about 20% wide
+
+    :ivar count: Number of durations observed.
+    :ivar total: Sum in seconds of the durations observed.
+    :ivar max: Longest duration observed, in seconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets = [0] * _BUCKETS
+
+    def add(self, seconds):
+        """Add a duration
+
+        :param seconds: Duration in seconds.
+        :type seconds: float
+        """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._buckets[_bucket(max(int(seconds * 1e6), 0))] += 1
+
+    def percentile(self, percent):
+        """Estimate a percentile of the durations
+
+        :param percent: Percentile, from ``0`` to ``100``.
+        :type percent: float
+
+        :return: Upper bound in seconds of the bucket holding the
+            percentile, :obj:`None` if no duration was observed.
+        :rtype: float or None
+        """
+        if not self.count:
+            return None
+        rank = max(percent / 100.0 * self.count, 1)
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if seen >= rank:
+                if index == _BUCKETS - 1:
+                    break
+                return min(_bucket_upper_bound(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        """Summarize the durations observed
+
+        :rtype: dict
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class Metrics(object):
+    """Counters and latency histograms of a GELF handler
+
+    Every GELF handler records its counters and a :class:`LatencyHistogram`
+    for each stage of :data:`STAGES` into its ``metrics``. They can be read
+    with :meth:`snapshot`, or pushed to a ``callback`` every ``interval``
+    seconds, e.g. to export them to a monitoring system.
+
+    Timing every stage of every log record would noticeably slow the
+    handler down, so only the stages of a random ``sample_rate`` of the log
+    records are timed. The counters count every log record.
+
+    The metrics are updated from every thread the handler converts or sends
+    log records from (e.g. the thread logging, the background sender, the
+    batch flusher or the spool draining), under a lock: the counters must be
+    updated with :meth:`count`. A Metrics instance must not be shared by
+    several handlers.
+
+    :ivar records: Number of log records converted into GELF logs.
+    :ivar compressed: Number of GELF logs (or batches) compressed.
+    :ivar chunk_overflows: Number of GELF logs requiring more than 128 GELF
+        UDP chunks.
+    :ivar truncated: Number of chunk overflowing GELF logs sent truncated.
+    :ivar sent: Number of GELF logs written to the transport, not counting
+        the ones sent later from a spool or an outage buffer.
+    :ivar bytes: Number of bytes of the sent GELF logs, as written to the
+        transport.
+    :ivar unsent: Number of GELF logs which could not be written to the
+        transport, then dropped, spooled or buffered.
+    :ivar errors: Number of log records which could not be handled.
+    """
+
+    def __init__(self, callback=None, interval=60.0, sample_rate=0.05):
+        """Initialize the Metrics
+
+        :param callback: If specified, callable invoked with a
+            :meth:`snapshot` every ``interval`` seconds at most, as long as
+            GELF logs are handled, from the thread handling them.
+        :type callback: Callable[dict] or None
+
+        :param interval: Minimum number of seconds between two invocations
+            of ``callback``.
+        :type interval: float
+
+        :param sample_rate: Fraction of the log records, from ``0`` to
+            ``1``, whose stages are timed.
+        :type sample_rate: float
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.callback = callback
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        # whether the stages of the log record being handled are timed, and
+        # whether it could not be sent, per thread since several threads can handle log
+        # records at once
+        self._local = threading.local()
+        self._report_lock = threading.Lock()
+        self._next_report = clock() + interval
+        self.reset()
+
+    def reset(self):
+        """Reset the counters and histograms"""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self._stages = dict((stage, LatencyHistogram()) for stage in STAGES)
+
+    @property
+    def sampled(self):
+        """:obj:`True` if the stages of the log record being handled by the
+        current thread are timed"""
+        return getattr(self._local, "sampled", False)
+
+    @property
+    def failed(self):
+        """:obj:`True` if the current thread counted a GELF log as unsent
+        since :meth:`clear_failed`, e.g. to tell whether the log record it
+        just handled could be written to the transport
+
+        Errors of the log records themselves, e.g. a message failing to be
+        formatted, are not failures of the transport and are not counted.
+        """
+        return getattr(self._local, "failed", False)
+
+    def clear_failed(self):
+        """Reset :attr:`failed` for the current thread"""
+        self._local.failed = False
+
+    def count(self, counter, n=1):
+        """Increment a counter
+
+        :param counter: Name of the counter, one of :data:`COUNTERS`.
+        :type counter: str
+
+        :param n: Increment.
+        :type n: int
+        """
+        if counter == "unsent":
+            self._local.failed = True
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def sample(self):
+        """Count a log record about to be converted into a GELF log and
+        decide whether its stages are timed by the current thread
+
+        :return: :attr:`sampled`
+        :rtype: bool
+        """
+        sampled = random.random() < self.sample_rate
+        self._local.sampled = sampled
+        with self._lock:
+            self.records += 1
+        return sampled
+
+    def timed(self, stage, start):
+        """Record the duration of a stage ending now
+
+        :param stage: Name of the stage, one of :data:`STAGES`.
+        :type stage: str
+
+        :param start: Time the stage started at, from :func:`clock`.
+        :type start: float
+
+        :return: The current time from :func:`clock`, the start time of
+            the next stage.
+        :rtype: float
+        """
+        now = clock()
+        with self._lock:
+            self._stages[stage].add(now - start)
+        if self.callback is not None and now >= self._next_report:
+            self._report(now)
+        return now
+
+    def _report(self, now):
+        with self._report_lock:
+            if now < self._next_report:
+                # reported by another thread meanwhile
+                return
+            self._next_report = now + self.interval
+        self.callback(self.snapshot())
+
+    def snapshot(self, reset=False):
+        """Get the current counters and latency histogram summaries
+
+        :param reset: If :obj:`True` reset the counters and histograms,
+            e.g. to report the metrics of every interval on their own.
+        :type reset: bool
+
+        :return: ``{"counters": {counter: value}, "stages": {stage:
+            {"count", "total", "mean", "max", "p50", "p90", "p99"}}}``,
+            the durations in seconds.
+        :rtype: dict
+        """
+        with self._lock:
+            snapshot = {
+                "counters": dict(
+                    (counter, getattr(self, counter)) for counter in COUNTERS
+                ),
+                "stages": dict(
+                    (stage, histogram.snapshot())
+                    for stage, histogram in self._stages.items()
+                ),
+            }
+            if reset:
+                self._reset()
+        return snapshot
+
+    def __repr__(self):
+        return "<{}({})>".format(
+            self.__class__.__name__,
+            ", ".join(
+                "{}={}".format(counter, getattr(self, counter)) for counter in COUNTERS
+            ),
+        )
@@ -4,13 +4,17 @@
 """Logging Handler integrating RabbitMQ and
 Graylog Extended Log Format (GELF)"""
 
-import json
+import socket
+from collections import OrderedDict
 from logging import Filter
-from logging.handlers import SocketHandler
 
-from amqplib import client_0_8 as amqp  # pylint: disable=import-error
+import amqp  # pylint: disable=import-error
 
+from graypy.compression import CONTENT_ENCODINGS, detect_framing
 from graypy.handler import BaseGELFHandler
+from graypy.metrics import clock
+from graypy.reconnect import OUTAGE_DROP, ReconnectingSocketHandler
+from graypy.sender import BatchBuffer
 
 try:
     from urllib.parse import urlparse, unquote
@@ -22,12 +26,17 @@ except ImportError:
 _ifnone = lambda v, x: x if v is None else v
 
 
-class GELFRabbitHandler(BaseGELFHandler, SocketHandler):
+class GELFRabbitHandler(BaseGELFHandler, ReconnectingSocketHandler):
     """RabbitMQ / GELF handler
 
+    GELF logs are compressed like by the other GELF handlers, according to
+    the ``compress`` argument. The ``content_encoding`` property of the
+    published messages is ``"deflate"`` or ``"gzip"`` for compressed GELF
+    logs.
+
     .. note::
 
-        This handler ignores all messages logged by amqplib.
+        This handler ignores all messages logged by the amqp package.
     """
 
     def __init__(
@@ -37,6 +46,14 @@ class GELFRabbitHandler(BaseGELFHandler, SocketHandler):
         exchange_type="fanout",
         virtual_host="/",
         routing_key="",
+        persistent=True,
+        confirm=False,
+        confirm_timeout=5,
+        batch_size=None,
+        batch_interval=0.05,
+        backoff=None,
+        outage_policy=OUTAGE_DROP,
+        outage_buffer_size=1000,
         **kwargs
     ):
         """Initialize the GELFRabbitHandler
@@ -56,6 +73,42 @@ class GELFRabbitHandler(BaseGELFHandler, SocketHandler):
 
         :param routing_key:
         :type routing_key: str
+
+        :param persistent: If :obj:`True` publish persistent messages,
+            written to disk by RabbitMQ, otherwise transient ones.
+        :type persistent: bool
+
+        :param confirm: If :obj:`True` enable publisher confirms: every
+            publish (or batch of publishes) waits for RabbitMQ to
+            acknowledge the messages, which are handled as unsent if it
+            does not.
+        :type confirm: bool
+
+        :param confirm_timeout: Maximum number of seconds to wait for
+            publisher confirms.
+        :type confirm_timeout: float
+
+        :param batch_size: If specified, enable batching: GELF logs are
+            buffered and published together, with a single wait for their
+            publisher confirms, when ``batch_size`` of them are buffered.
+        :type batch_size: int or None
+
+        :param batch_interval: Maximum number of seconds a GELF log is
+            buffered when batching is enabled.
+        :type batch_interval: float
+
+        :param backoff: If specified, reconnect in the background with this
+            :class:`.reconnect.Backoff` policy instead of from the logging
+            caller's thread.
+        :type backoff: Backoff or None
+
+        :param outage_policy: What to do with GELF logs while reconnecting
+            in the background. ``"drop"`` or ``"buffer"``.
+        :type outage_policy: str
+
+        :param outage_buffer_size: Maximum number of GELF logs buffered while
+            reconnecting in the background.
+        :type outage_buffer_size: int
         """
         self.url = url
         parsed = urlparse(url)
@@ -71,46 +124,267 @@ class GELFRabbitHandler(BaseGELFHandler, SocketHandler):
             "userid": _ifnone(parsed.username, "guest"),
             "password": _ifnone(parsed.password, "guest"),
             "virtual_host": self.virtual_host,
-            "insist": False,
         }
         self.exchange = exchange
         self.exchange_type = exchange_type
         self.routing_key = routing_key
+        self.persistent = persistent
+        self.confirm = confirm
+        self.confirm_timeout = confirm_timeout
         BaseGELFHandler.__init__(self, **kwargs)
-        SocketHandler.__init__(self, host, port)
-        self.addFilter(ExcludeFilter("amqplib"))
+        ReconnectingSocketHandler.__init__(
+            self,
+            host,
+            port,
+            backoff=backoff,
+            outage_policy=outage_policy,
+            outage_buffer_size=outage_buffer_size,
+        )
+        self.addFilter(ExcludeFilter("amqp"))
+        self.batch = None
+        if batch_size is not None:
+            self.batch = BatchBuffer(
+                self._publish_batch,
+                batch_size=batch_size,
+                batch_interval=batch_interval,
+            )
 
     def makeSocket(self, timeout=1):
         return RabbitSocket(
-            self.cn_args, timeout, self.exchange, self.exchange_type, self.routing_key
+            self.cn_args,
+            timeout,
+            self.exchange,
+            self.exchange_type,
+            self.routing_key,
+            persistent=self.persistent,
+            confirm=self.confirm,
+            confirm_timeout=self.confirm_timeout,
+        )
+
+    def send(self, s):
+        """Publish a GELF log, or buffer it if batching is enabled"""
+        if self.batch is not None:
+            self.batch.add(s)
+            return
+        metrics = self.metrics
+        sampled = metrics.sampled
+        if sampled:
+            start = clock()
+        if not ReconnectingSocketHandler.send(self, s):
+            metrics.count("unsent")
+            return
+        if sampled:
+            metrics.timed("send", start)
+        metrics.count("sent")
+        metrics.count("bytes", len(s))
+
+    def _publish_batch(self, batch):
+        """Publish a batch of GELF logs, waiting once for their publisher
+        confirms
+
+        Like :meth:`.reconnect.ReconnectingSocketHandler.send` the GELF logs
+        are dropped, spooled or buffered during an outage if they cannot be
+        published.
+
+        :param batch: GELF logs.
+        :type batch: list[bytes]
+        """
+        if self._spooling():
+            self._unsent(batch)
+            return
+        start = clock()
+        if self.sock is None:
+            self.createSocket()
+        sock = self.sock
+        if not sock:
+            self._unsent(batch)
+            return
+        unsent = []
+        try:
+            sock.sendall_many(batch)
+        except RabbitNackError as exc:
+            # the acknowledged GELF logs were delivered, only the rejected
+            # ones are published again
+            sock.close()
+            self.sock = None
+            unsent = exc.items
+            self._unsent(unsent)
+        except socket.error:
+            sock.close()
+            self.sock = None
+            self._unsent(batch)
+            return
+        metrics = self.metrics
+        # batches are always timed
+        metrics.timed("send", start)
+        metrics.count("sent", len(batch) - len(unsent))
+        metrics.count(
+            "bytes",
+            sum(len(data) for data in batch) - sum(len(data) for data in unsent),
         )
 
-    def makePickle(self, record):
-        message_dict = self._make_gelf_dict(record)
-        return json.dumps(message_dict)
+    def _unsent(self, batch):
+        self.metrics.count("unsent", len(batch))
+        self._handle_outage(batch)
+
+    def flush(self, timeout=None):
+        """Publish the queued log records and the current batch
+
+        :param timeout: Maximum number of seconds to wait for the queue of
+            the asynchronous mode. If :obj:`None` wait for
+            ``shutdown_timeout`` at most.
+        :type timeout: float or None
+
+        :return: :obj:`False` if queued log records remain unsent after
+            ``timeout``, otherwise :obj:`True`.
+        :rtype: bool
+        """
+        flushed = BaseGELFHandler.flush(self, timeout)
+        if self.batch is not None:
+            self.batch.flush()
+        return flushed
+
+    def close(self):
+        """Publish the current batch and close the connection"""
+        if self.sender is not None:
+            self.sender.close(self.shutdown_timeout)
+        if self.batch is not None:
+            self.batch.close()
+        BaseGELFHandler.close(self)
+
+
+class RabbitNackError(socket.error):
+    """RabbitMQ rejecting some of the published GELF logs
+
+    :ivar items: The rejected GELF logs.
+    """
+
+    def __init__(self, items):
+        socket.error.__init__(self, "RabbitMQ rejected {} GELF logs".format(len(items)))
+        self.items = items
 
 
 class RabbitSocket(object):
-    def __init__(self, cn_args, timeout, exchange, exchange_type, routing_key):
+    """Socket like publisher of GELF logs to a RabbitMQ exchange over a
+    single AMQP connection and channel
+
+    AMQP errors are raised as :class:`socket.error` for
+    :class:`.reconnect.ReconnectingSocketHandler` to reconnect.
+    """
+
+    def __init__(
+        self,
+        cn_args,
+        timeout,
+        exchange,
+        exchange_type,
+        routing_key,
+        persistent=True,
+        confirm=False,
+        confirm_timeout=5,
+    ):
         self.cn_args = cn_args
         self.timeout = timeout
         self.exchange = exchange
         self.exchange_type = exchange_type
         self.routing_key = routing_key
-        self.connection = amqp.Connection(connection_timeout=timeout, **self.cn_args)
-        self.channel = self.connection.channel()
-        self.channel.exchange_declare(
-            exchange=self.exchange,
-            type=self.exchange_type,
-            durable=True,
-            auto_delete=False,
+        self.delivery_mode = 2 if persistent else 1
+        self.confirm = confirm
+        self.confirm_timeout = confirm_timeout
+        # delivery tags of the last published and last confirmed messages
+        self.published = 0
+        self.confirmed = 0
+        # GELF logs waiting for their publisher confirm, by delivery tag
+        self._unconfirmed = OrderedDict()
+        self._nacked = []
+        self.connection = amqp.Connection(
+            connect_timeout=timeout, read_timeout=timeout, **self.cn_args
         )
+        try:
+            self.connection.connect()
+            self.channel = self.connection.channel()
+            self.channel.exchange_declare(
+                exchange=self.exchange,
+                type=self.exchange_type,
+                durable=True,
+                auto_delete=False,
+            )
+            if confirm:
+                self.channel.events["basic_ack"].add(self._on_ack)
+                self.channel.events["basic_nack"].add(self._on_nack)
+                self.channel.confirm_select()
+        except amqp.AMQPError as exc:
+            self.close()
+            raise socket.error(str(exc))
+        except Exception:
+            # e.g. the connection being refused, raised as is
+            self.close()
+            raise
+
+    def _confirm(self, delivery_tag, multiple):
+        """Forget the GELF logs confirmed by a ``Basic.Ack`` or
+        ``Basic.Nack``
+
+        :return: The confirmed GELF logs.
+        :rtype: list[bytes]
+        """
+        self.confirmed = max(self.confirmed, delivery_tag)
+        if not multiple:
+            data = self._unconfirmed.pop(delivery_tag, None)
+            return [] if data is None else [data]
+        confirmed = []
+        while self._unconfirmed:
+            tag = next(iter(self._unconfirmed))
+            if tag > delivery_tag:
+                break
+            confirmed.append(self._unconfirmed.pop(tag))
+        return confirmed
+
+    def _on_ack(self, delivery_tag, multiple):
+        self._confirm(delivery_tag, multiple)
+
+    def _on_nack(self, delivery_tag, multiple):
+        self._nacked.extend(self._confirm(delivery_tag, multiple))
 
     def sendall(self, data):
-        msg = amqp.Message(data, delivery_mode=2)
-        self.channel.basic_publish(
-            msg, exchange=self.exchange, routing_key=self.routing_key
-        )
+        """Publish a GELF log"""
+        self.sendall_many([data])
+
+    def sendall_many(self, items):
+        """Publish GELF logs, then wait for their publisher confirms if
+        enabled
+
+        :param items: GELF logs.
+        :type items: list[bytes]
+
+        :raises RabbitNackError: If RabbitMQ rejected some of them.
+        """
+        try:
+            for data in items:
+                self.channel.basic_publish(
+                    amqp.Message(
+                        data,
+                        content_type="application/json",
+                        content_encoding=CONTENT_ENCODINGS.get(detect_framing(data)),
+                        delivery_mode=self.delivery_mode,
+                    ),
+                    exchange=self.exchange,
+                    routing_key=self.routing_key,
+                )
+                self.published += 1
+                if self.confirm:
+                    self._unconfirmed[self.published] = data
+            if self.confirm:
+                self._wait_for_confirms()
+        except amqp.AMQPError as exc:
+            raise socket.error(str(exc))
+
+    def _wait_for_confirms(self):
+        while self._unconfirmed:
+            self.connection.drain_events(timeout=self.confirm_timeout)
+        if self._nacked:
+            nacked, self._nacked = self._nacked, []
+            raise RabbitNackError(nacked)
 
     def close(self):
         """Close the connection to the RabbitMQ socket"""
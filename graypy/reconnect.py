@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Reconnection with exponential backoff for the stream based GELF
+handlers"""
+
+import collections
+import random
+import socket
+import threading
+from logging.handlers import SocketHandler
+
+#: Drop the GELF logs sent while the connection is down
+OUTAGE_DROP = "drop"
+#: Buffer the GELF logs sent while the connection is down and send them once
+#: reconnected
+OUTAGE_BUFFER = "buffer"
+
+OUTAGE_POLICIES = (OUTAGE_DROP, OUTAGE_BUFFER)
+
+
+class Backoff(object):
+    """Exponential backoff policy with jitter
+
+    The delay before the ``n``-th reconnection attempt (starting at ``0``)
+    is ``initial * multiplier ** n`` seconds, capped at ``cap`` seconds and
+    randomly shortened by up to ``jitter`` of itself, so that the clients of
+    a restarted Graylog server do not all reconnect at the same time.
+    """
+
+    def __init__(self, initial=0.5, multiplier=2.0, cap=30.0, jitter=0.5):
+        """Initialize the Backoff
+
+        :param initial: Delay in seconds before the first reconnection
+            attempt.
+        :type initial: float
+
+        :param multiplier: Factor applied to the delay after every failed
+            attempt.
+        :type multiplier: float
+
+        :param cap: Maximum delay in seconds.
+        :type cap: float
+
+        :param jitter: Fraction of the delay, from ``0`` to ``1``, it is
+            randomly shortened by.
+        :type jitter: float
+        """
+        if initial < 0 or cap < 0:
+            raise ValueError("initial and cap must be positive")
+        if multiplier < 1:
+            raise ValueError("multiplier must be at least 1")
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.initial = initial
+        self.multiplier = multiplier
+        self.cap = cap
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """Return the delay in seconds before a reconnection attempt
+
+        :param attempt: Number of failed attempts since the connection was
+            lost.
+        :type attempt: int
+
+        :rtype: float
+        """
+        try:
+            delay = min(self.cap, self.initial * self.multiplier**attempt)
+        except OverflowError:
+            delay = self.cap
+        return delay * (1 - self.jitter * random.random())
+
+    def __repr__(self):
+        return "<{}(initial={}, multiplier={}, cap={}, jitter={})>".format(
+            self.__class__.__name__,
+            self.initial,
+            self.multiplier,
+            self.cap,
+            self.jitter,
+        )
+
+
+class ReconnectingSocketHandler(SocketHandler):
+    """:class:`logging.handlers.SocketHandler` reconnecting in the
+    background
+
+    Without a ``backoff`` it behaves like its base class: the connection is
+    retried from the logging caller's thread, blocking it for up to the
+    connection timeout, and the GELF logs are dropped until it succeeds.
+
+    With a ``backoff`` a lost connection is retried once right away. If that
+    fails, an outage starts: a reconnection thread retries with the delays
+    of the backoff policy while the GELF logs are handled by the
+    ``outage_policy``, without blocking the logging callers:
+
+    * ``"drop"`` - the GELF logs are dropped
+    * ``"buffer"`` - up to ``outage_buffer_size`` GELF logs are buffered,
+      dropping the oldest ones, and sent in order once reconnected
+
+    A spool, if set by the subclass, takes precedence over the
+    ``outage_policy``.
+
+    :ivar dropped: Number of GELF logs dropped during outages.
+    """
+
+    #: :class:`.spool.DiskSpool` of the GELF logs which could not be sent
+    spool = None
+
+    def __init__(
+        self,
+        host,
+        port,
+        backoff=None,
+        outage_policy=OUTAGE_DROP,
+        outage_buffer_size=1000,
+    ):
+        """Initialize the ReconnectingSocketHandler
+
+        :param host: Host to connect to.
+        :type host: str
+
+        :param port: Port to connect to.
+        :type port: int
+
+        :param backoff: If specified, reconnect in the background with this
+            backoff policy.
+        :type backoff: Backoff or None
+
+        :param outage_policy: ``"drop"`` or ``"buffer"``.
+        :type outage_policy: str
+
+        :param outage_buffer_size: Maximum number of GELF logs buffered
+            during an outage.
+        :type outage_buffer_size: int
+        """
+        if outage_policy not in OUTAGE_POLICIES:
+            raise ValueError(
+                "invalid outage_policy (expected one of {}): {}".format(
+                    OUTAGE_POLICIES, outage_policy
+                )
+            )
+        if outage_buffer_size < 1:
+            raise ValueError("outage_buffer_size must be at least 1")
+        SocketHandler.__init__(self, host, port)
+        self.backoff = backoff
+        self.outage_policy = outage_policy
+        self.outage_buffer_size = outage_buffer_size
+        self.dropped = 0
+
+        self._outage_buffer = collections.deque()
+        # guards the outage state, the buffer and installing reconnected
+        # sockets
+        self._outage_lock = threading.Lock()
+        self._reconnect_thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def in_outage(self):
+        """:obj:`True` while the reconnection thread is running"""
+        return self._reconnect_thread is not None
+
+    def createSocket(self):
+        """Connect, unless an outage is ongoing
+
+        Without a ``backoff`` the base class' reconnection logic applies.
+        Otherwise a failed connection starts an outage.
+        """
+        if self.backoff is None:
+            SocketHandler.createSocket(self)
+            return
+        if self.in_outage or self._stopped.is_set():
+            return
+        try:
+            self.sock = self.makeSocket()
+        except Exception:
+            self._start_outage()
+
+    def _spooling(self):
+        return False
+
+    def send(self, s):
+        """Send a GELF log, spooling it or handling it with the
+        ``outage_policy`` if the connection is down
+
+        :return: :obj:`True` if it was written to the socket.
+        :rtype: bool
+        """
+        if self._spooling():
+            self.spool.append(s)
+            return False
+        if self.sock is None:
+            self.createSocket()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.sendall(s)
+                return True
+            except socket.error:
+                sock.close()
+                self.sock = None
+                if self.backoff is not None:
+                    self._start_outage()
+        self._handle_outage([s])
+        return False
+
+    def _send_spooled(self, data):
+        """Send a GELF log from the drain thread of the spool
+
+        :return: :obj:`True` if it was sent.
+        :rtype: bool
+        """
+        if self.sock is None:
+            self.createSocket()
+        sock = self.sock
+        if sock is None:
+            return False
+        try:
+            sock.sendall(data)
+        except socket.error:
+            sock.close()
+            self.sock = None
+            if self.backoff is not None:
+                self._start_outage()
+            return False
+        return True
+
+    def _handle_outage(self, items):
+        """Spool, drop or buffer GELF logs which could not be sent
+
+        Without a spool or a ``backoff`` they are dropped, as by the base
+        class.
+
+        :param items: GELF logs.
+        :type items: list[bytes]
+        """
+        if self.spool is not None:
+            for item in items:
+                self.spool.append(item)
+            return
+        if self.backoff is None:
+            return
+        with self._outage_lock:
+            sock = self.sock
+            if sock is not None:
+                # reconnected meanwhile
+                try:
+                    sock.sendall(b"".join(items))
+                    return
+                except socket.error:
+                    sock.close()
+                    self.sock = None
+            if self.outage_policy == OUTAGE_DROP:
+                self.dropped += len(items)
+                return
+            self._outage_buffer.extend(items)
+            overflow = len(self._outage_buffer) - self.outage_buffer_size
+            for _ in range(overflow):
+                self._outage_buffer.popleft()
+            self.dropped += max(overflow, 0)
+        if self.sock is None:
+            self._start_outage()
+
+    def _start_outage(self):
+        with self._outage_lock:
+            if self._reconnect_thread is not None or self._stopped.is_set():
+                return
+            self._reconnect_thread = threading.Thread(
+                target=self._reconnect, name="graypy-reconnect"
+            )
+            self._reconnect_thread.daemon = True
+            self._reconnect_thread.start()
+
+    def _reconnect(self):
+        attempt = 0
+        while not self._stopped.wait(self.backoff.delay(attempt)):
+            attempt += 1
+            try:
+                sock = self.makeSocket()
+            except Exception:
+                continue
+            with self._outage_lock:
+                try:
+                    while self._outage_buffer:
+                        sock.sendall(self._outage_buffer[0])
+                        self._outage_buffer.popleft()
+                except socket.error:
+                    sock.close()
+                    continue
+                self.sock = sock
+                self._reconnect_thread = None
+                return
+        with self._outage_lock:
+            self._reconnect_thread = None
+
+    def close(self):
+        """Stop the reconnection thread and close the socket
+
+        GELF logs still buffered are dropped.
+        """
+        self._stopped.set()
+        thread = self._reconnect_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._outage_lock:
+            self.dropped += len(self._outage_buffer)
+            self._outage_buffer.clear()
+        SocketHandler.close(self)
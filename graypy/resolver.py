@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Cached resolution of the addresses of the Graylog inputs"""
+
+import socket
+import threading
+import time
+
+
+class CachedResolver(object):
+    """Resolver caching the socket address of the Graylog inputs
+
+    The addresses of every ``(host, port, socket type, address family)``
+    are resolved once and cached for ``ttl`` seconds. An expired address is
+    still returned while it is resolved again from a background thread, so
+    only the first resolution of an address blocks the caller and a slow
+    DNS server does not slow the GELF handlers down. If resolving it again fails the
+    expired address is kept, and resolved again ``ttl`` seconds later.
+
+    The GELF handlers share :data:`DEFAULT_RESOLVER` unless given their own.
+
+    :ivar hits: Number of addresses returned from the cache.
+    :ivar misses: Number of addresses resolved by the caller.
+    :ivar refreshes: Number of addresses resolved again in the background.
+    :ivar failures: Number of failed background resolutions.
+    """
+
+    def __init__(self, ttl=300.0):
+        """Initialize the CachedResolver
+
+        :param ttl: Number of seconds an address is cached before being
+            resolved again. If :obj:`None` the addresses are never resolved
+            again, if ``0`` they are resolved by every caller.
+        :type ttl: float or None
+        """
+        if ttl is not None and ttl < 0:
+            raise ValueError("ttl must be positive")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        # (host, port, socktype, family) -> (addresses, expiry time), the
+        # addresses being (family, sockaddr) tuples
+        self._cache = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _expiry(self):
+        if self.ttl is None:
+            return float("inf")
+        return time.time() + self.ttl
+
+    @staticmethod
+    def _getaddrinfo(host, port, socktype, family):
+        return [
+            (info[0], info[4])
+            for info in socket.getaddrinfo(host, port, family, socktype)
+        ]
+
+    def resolve(self, host, port, socktype=socket.SOCK_STREAM, family=0):
+        """Get the preferred address of a Graylog input
+
+        :return: The address family and the socket address to connect or
+            send to.
+        :rtype: tuple(int, tuple)
+
+        :raises socket.gaierror: If the address is not cached and cannot be
+            resolved.
+        """
+        return self.resolve_all(host, port, socktype, family)[0]
+
+    def resolve_all(self, host, port, socktype=socket.SOCK_STREAM, family=0):
+        """Get the addresses of a Graylog input
+
+        :param host: Host of the Graylog input.
+        :type host: str
+
+        :param port: Port of the Graylog input.
+        :type port: int
+
+        :param socktype: :data:`socket.SOCK_STREAM` or
+            :data:`socket.SOCK_DGRAM`.
+        :type socktype: int
+
+        :param family: Address family to resolve the host into, any if
+            ``0``.
+        :type family: int
+
+        :return: The address family and the socket address of every
+            address, in the order of preference of :func:`socket.getaddrinfo`.
+        :rtype: list[tuple(int, tuple)]
+
+        :raises socket.gaierror: If the addresses are not cached and cannot
+            be resolved.
+        """
+        key = (host, port, socktype, family)
+        entry = self._cache.get(key)
+        if entry is not None:
+            addresses, expiry = entry
+            if time.time() >= expiry:
+                self._refresh(key)
+            self.hits += 1
+            return addresses
+        self.misses += 1
+        addresses = self._getaddrinfo(*key)
+        if self.ttl != 0:
+            self._cache[key] = (addresses, self._expiry())
+        return addresses
+
+    def expire(self, host, port, socktype=socket.SOCK_STREAM, family=0):
+        """Resolve the addresses of a Graylog input again on their next use,
+        e.g. after failing to connect to them as it may have moved
+
+        The expired addresses are still returned until they are resolved
+        again.
+        """
+        key = (host, port, socktype, family)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache[key] = (entry[0], 0)
+
+    def _refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        thread = threading.Thread(
+            target=self._run_refresh, args=(key,), name="graypy-resolver"
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _run_refresh(self, key):
+        try:
+            try:
+                addresses = self._getaddrinfo(*key)
+            except socket.error:
+                self.failures += 1
+                entry = self._cache.get(key)
+                if entry is None:
+                    return  # cleared meanwhile
+                addresses = entry[0]
+            else:
+                self.refreshes += 1
+            self._cache[key] = (addresses, self._expiry())
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        """Forget every cached address"""
+        self._cache.clear()
+
+    def __repr__(self):
+        return "<{}(ttl={}, hits={}, misses={})>".format(
+            self.__class__.__name__, self.ttl, self.hits, self.misses
+        )
+
+
+#: Resolver shared by the GELF handlers
+DEFAULT_RESOLVER = CachedResolver()
+
+
+def create_connection(resolver, host, port, timeout, wrap=None):
+    """Connect a TCP socket to the cached addresses of a Graylog input
+
+    Like :func:`socket.create_connection` every address is tried in turn.
+    If none can be connected to they are resolved again in the background.
+
+    :param resolver: Resolver of the addresses.
+    :type resolver: CachedResolver
+
+    :param timeout: Timeout in seconds of the socket.
+    :type timeout: float or None
+
+    :param wrap: If specified, callable wrapping the socket before it is
+        connected, e.g. to connect with TLS.
+    :type wrap: Callable[socket.socket] or None
+
+    :rtype: socket.socket
+    """
+    error = None
+    for family, sockaddr in resolver.resolve_all(host, port, socket.SOCK_STREAM):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            if wrap is not None:
+                sock = wrap(sock)
+            sock.connect(sockaddr)
+            return sock
+        except socket.error as exc:
+            sock.close()
+            error = exc
+    resolver.expire(host, port, socket.SOCK_STREAM)
+    if error is None:
+        raise socket.error("getaddrinfo returned an empty list")
+    raise error
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Background sending of GELF logs off the logging caller's thread"""
+
+import collections
+import threading
+import time
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class BackgroundSender(object):
+    """Bounded in-memory queue drained by a dedicated sender thread
+
+    Items put into the queue are handed one by one to ``target`` from the
+    sender thread. When the queue is full the ``overflow_policy`` decides
+    what happens to new items:
+
+    * ``"block"`` - the caller waits until the sender thread frees a slot
+    * ``"drop_oldest"`` - the oldest queued item is discarded
+    * ``"drop_newest"`` - the new item is discarded
+    """
+
+    def __init__(self, target, queue_size=1000, overflow_policy=OVERFLOW_BLOCK):
+        """Initialize the BackgroundSender and start its sender thread
+
+        :param target: Callable invoked from the sender thread with every
+            queued item. Exceptions raised by it are not caught.
+        :type target: Callable[object]
+
+        :param queue_size: Maximum number of items waiting to be sent.
+        :type queue_size: int
+
+        :param overflow_policy: One of ``"block"``, ``"drop_oldest"`` or
+            ``"drop_newest"``.
+        :type overflow_policy: str
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "invalid overflow_policy (expected one of {}): {}".format(
+                    OVERFLOW_POLICIES, overflow_policy
+                )
+            )
+        self.target = target
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition(threading.Lock())
+        # number of items queued or currently being sent
+        self._pending = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="graypy-sender")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def queued(self):
+        """Number of items waiting to be sent"""
+        return len(self._queue)
+
+    def put(self, item):
+        """Queue an item for sending
+
+        :return: :obj:`True` if the item was queued, :obj:`False` if it was
+            dropped.
+        :rtype: bool
+        """
+        with self._condition:
+            if self._closed:
+                self.dropped += 1
+                return False
+            while len(self._queue) >= self.queue_size:
+                if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._pending -= 1
+                    self.dropped += 1
+                    break
+                self._condition.wait()
+                if self._closed:
+                    self.dropped += 1
+                    return False
+            self._queue.append(item)
+            self._pending += 1
+            self._condition.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                # wake up producers blocked on a full queue
+                self._condition.notify_all()
+            try:
+                self.target(item)
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    if not self._pending:
+                        self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every queued item has been sent
+
+        :param timeout: Maximum number of seconds to wait. If :obj:`None`
+            wait indefinitely.
+        :type timeout: float or None
+
+        :return: :obj:`True` if the queue was drained, :obj:`False` if the
+            timeout expired first.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Stop accepting items and stop the sender thread once the queue
+        is drained
+
+        :param timeout: Maximum number of seconds to wait for the queue to
+            drain and the sender thread to stop. Items still queued after it
+            expires are discarded.
+        :type timeout: float or None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self.dropped += len(self._queue)
+            self._pending -= len(self._queue)
+            self._queue.clear()
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            # the item being sent may still block the thread, wait for it
+            # within the same timeout rather than for another one
+            if deadline is None:
+                self._thread.join()
+            else:
+                self._thread.join(max(deadline - time.time(), 0))
+
+
+class BatchBuffer(object):
+    """Buffer grouping items into batches
+
+    A batch is handed to ``target`` as soon as it holds ``batch_size``
+    items (or ``batch_bytes`` bytes), from the thread adding the last item,
+    or ``batch_interval`` seconds after its first item was added, from a
+    dedicated flusher thread. Batches are handed to ``target`` one at a
+    time and in order.
+    """
+
+    def __init__(self, target, batch_size=100, batch_interval=1.0, batch_bytes=None):
+        """Initialize the BatchBuffer and start its flusher thread
+
+        :param target: Callable invoked with every batch, a non empty list
+            of items. It must handle its own exceptions when called from
+            the flusher thread.
+        :type target: Callable[list]
+
+        :param batch_size: Maximum number of items in a batch.
+        :type batch_size: int or None
+
+        :param batch_interval: Maximum number of seconds an item waits in
+            the buffer.
+        :type batch_interval: float
+
+        :param batch_bytes: If specified, the items must be bytes and a
+            batch is handed to ``target`` once their total length reaches
+            ``batch_bytes``.
+        :type batch_bytes: int or None
+        """
+        if batch_size is None and batch_bytes is None:
+            raise ValueError("batch_size or batch_bytes must be specified")
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if batch_bytes is not None and batch_bytes < 1:
+            raise ValueError("batch_bytes must be at least 1")
+        self.target = target
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batch_bytes = batch_bytes
+
+        self._items = []
+        self._bytes = 0
+        self._deadline = None
+        self._condition = threading.Condition(threading.Lock())
+        # held while taking a batch and handing it to target, to keep the
+        # batches in order
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="graypy-batcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _full(self):
+        if self.batch_size is not None and len(self._items) >= self.batch_size:
+            return True
+        return self.batch_bytes is not None and self._bytes >= self.batch_bytes
+
+    def _send(self):
+        """Hand the current batch, if any, to ``target``"""
+        with self._send_lock:
+            with self._condition:
+                items, self._items = self._items, []
+                self._bytes = 0
+                self._deadline = None
+            if items:
+                self.target(items)
+
+    def add(self, item):
+        """Add an item to the current batch, handing the batch to
+        ``target`` if it is full"""
+        with self._condition:
+            self._items.append(item)
+            if self.batch_bytes is not None:
+                self._bytes += len(item)
+            if not self._full() and not self._closed:
+                if self._deadline is None:
+                    self._deadline = time.time() + self.batch_interval
+                    self._condition.notify_all()
+                return
+        self._send()
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if self._deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.time()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self._condition.release()
+                try:
+                    self._send()
+                finally:
+                    self._condition.acquire()
+
+    def flush(self):
+        """Hand the current batch to ``target`` right away"""
+        self._send()
+
+    def close(self):
+        """Stop the flusher thread and flush the current batch"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""On-disk spool keeping the GELF logs that could not be sent until the
+Graylog server is reachable again"""
+
+import collections
+import os
+import struct
+import threading
+import time
+
+# length prefix of every spooled GELF log
+_RECORD_HEADER = struct.Struct(">I")
+
+_SEGMENT_SUFFIX = ".spool"
+
+
+class DiskSpool(object):
+    """Append-only on-disk spool of GELF logs
+
+    GELF logs are appended, length prefixed, to segment files of at most
+    ``segment_bytes`` bytes in ``directory``. When the segments add up to
+    more than ``max_bytes`` bytes the oldest one is deleted, along with the
+    GELF logs it still holds.
+
+    Once started with a ``target`` a drain thread hands the spooled GELF
+    logs to it, oldest first. A GELF log is removed from the spool once
+    ``target`` returned :obj:`True`; if it returned :obj:`False` or raised,
+    draining is retried ``retry_interval`` seconds later, however many GELF
+    logs are appended meanwhile. Fully drained segments are deleted.
+
+    The segments left in ``directory`` by a previous process are drained
+    too, GELF logs that process had already drained from a partly drained
+    segment are sent again. A directory must only be used by one spool at
+    once.
+
+    :ivar spooled: Number of GELF logs appended.
+    :ivar drained: Number of GELF logs handed to ``target``.
+    :ivar dropped: Number of GELF logs deleted by the size cap.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=64 * 1024 * 1024,
+        segment_bytes=4 * 1024 * 1024,
+        retry_interval=1.0,
+        fsync=False,
+    ):
+        """Initialize the DiskSpool, loading the segments already in
+        ``directory``
+
+        :param directory: Directory of the segment files, created if
+            missing.
+        :type directory: str
+
+        :param max_bytes: Maximum total size in bytes of the segments.
+        :type max_bytes: int
+
+        :param segment_bytes: Size in bytes above which a new segment is
+            started.
+        :type segment_bytes: int
+
+        :param retry_interval: Number of seconds to wait before draining
+            again after ``target`` failed.
+        :type retry_interval: float
+
+        :param fsync: If :obj:`True` every spooled GELF log is synced to
+            disk before :meth:`append` returns, surviving a system crash
+            rather than only a process crash.
+        :type fsync: bool
+        """
+        if segment_bytes < 1 or max_bytes < segment_bytes:
+            raise ValueError("max_bytes must be at least segment_bytes")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.retry_interval = retry_interval
+        self.fsync = fsync
+        self.target = None
+
+        self.spooled = 0
+        self.drained = 0
+        self.dropped = 0
+
+        # [number, bytes, records] of every segment, oldest first
+        self._segments = collections.deque()
+        self._bytes = 0
+        self._pending = 0
+        self._writer = None
+        self._reader = None
+        # position of the next GELF log to drain in the oldest segment
+        self._read_offset = 0
+        self._read_records = 0
+        self._condition = threading.Condition(threading.Lock())
+        self._closed = False
+        self._thread = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._load()
+
+    @property
+    def pending(self):
+        """Number of GELF logs waiting in the spool"""
+        return self._pending
+
+    def _path(self, number):
+        return os.path.join(self.directory, "%016d%s" % (number, _SEGMENT_SUFFIX))
+
+    def _load(self):
+        numbers = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+            and name[: -len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        for number in numbers:
+            size, records = self._scan(self._path(number))
+            if not records:
+                os.remove(self._path(number))
+                continue
+            self._segments.append([number, size, records])
+            self._bytes += size
+            self._pending += records
+
+    @staticmethod
+    def _scan(path):
+        """Count the complete GELF logs of a segment, truncating the
+        incomplete one a crash may have left at its end
+
+        :return: Size in bytes and number of GELF logs of the segment.
+        :rtype: tuple[int, int]
+        """
+        size = 0
+        records = 0
+        with open(path, "r+b") as segment:
+            while True:
+                header = segment.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length = _RECORD_HEADER.unpack(header)[0]
+                if len(segment.read(length)) < length:
+                    break
+                size += _RECORD_HEADER.size + length
+                records += 1
+            segment.truncate(size)
+        return size, records
+
+    def start(self, target):
+        """Start draining the spool to ``target`` from a dedicated thread
+
+        :param target: Callable sending a spooled GELF log, returning
+            :obj:`True` on success.
+        :type target: Callable[bytes]
+        """
+        with self._condition:
+            if self._thread is not None:
+                raise ValueError("the spool is already started")
+            self.target = target
+            self._thread = threading.Thread(target=self._run, name="graypy-spool")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def append(self, data):
+        """Append a GELF log to the spool
+
+        :param data: GELF log.
+        :type data: bytes
+        """
+        record_bytes = _RECORD_HEADER.size + len(data)
+        with self._condition:
+            if self._writer is None or (
+                self._segments[-1][1] + record_bytes > self.segment_bytes
+                and self._segments[-1][1]
+            ):
+                self._roll()
+            self._writer.write(_RECORD_HEADER.pack(len(data)))
+            self._writer.write(data)
+            # readable by the drain thread and kept if the process crashes
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._segments[-1][1] += record_bytes
+            self._segments[-1][2] += 1
+            self._bytes += record_bytes
+            self._pending += 1
+            self.spooled += 1
+            while self._bytes > self.max_bytes and len(self._segments) > 1:
+                self._evict()
+            self._condition.notify_all()
+
+    def _roll(self):
+        """Start a new segment"""
+        if self._writer is not None:
+            self._writer.close()
+        number = self._segments[-1][0] + 1 if self._segments else 0
+        self._segments.append([number, 0, 0])
+        self._writer = open(self._path(number), "ab")
+
+    def _evict(self):
+        """Delete the oldest segment with its remaining GELF logs"""
+        number, size, records = self._segments.popleft()
+        self._close_reader()
+        os.remove(self._path(number))
+        remaining = records - self._read_records
+        self._bytes -= size
+        self._pending -= remaining
+        self.dropped += remaining
+        self._read_offset = 0
+        self._read_records = 0
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _next(self):
+        """Read the oldest spooled GELF log
+
+        :return: The number of its segment and the GELF log, or :obj:`None`
+            if the spool is empty.
+        :rtype: tuple[int, bytes] or None
+        """
+        if not self._pending:
+            return None
+        number = self._segments[0][0]
+        if self._reader is None:
+            self._reader = open(self._path(number), "rb")
+        self._reader.seek(self._read_offset)
+        length = _RECORD_HEADER.unpack(self._reader.read(_RECORD_HEADER.size))[0]
+        return number, self._reader.read(length)
+
+    def _done(self, number, data):
+        """Remove a drained GELF log from the spool"""
+        if not self._segments or self._segments[0][0] != number:
+            # its segment was evicted while it was being sent
+            return
+        self._read_offset += _RECORD_HEADER.size + len(data)
+        self._read_records += 1
+        self._pending -= 1
+        self.drained += 1
+        _, size, records = self._segments[0]
+        if self._read_records < records:
+            return
+        if len(self._segments) == 1 and self._writer is not None:
+            # the spool is empty, start over with a new segment
+            self._writer.close()
+            self._writer = None
+        self._close_reader()
+        os.remove(self._path(number))
+        self._segments.popleft()
+        self._bytes -= size
+        self._read_offset = 0
+        self._read_records = 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                item = None
+                while not self._closed:
+                    item = self._next()
+                    if item is not None:
+                        break
+                    self._condition.wait()
+                if self._closed:
+                    return
+            number, data = item
+            try:
+                sent = self.target(data)
+            except Exception:
+                sent = False
+            with self._condition:
+                if sent:
+                    self._done(number, data)
+                    continue
+                # the appends notify the condition too, wait until the retry
+                # is due rather than until the next append
+                next_retry = time.time() + self.retry_interval
+                while not self._closed:
+                    remaining = next_retry - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+    def close(self):
+        """Stop the drain thread
+
+        The GELF logs still spooled stay on disk for the next spool of the
+        same directory.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._condition:
+            self._close_reader()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
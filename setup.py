@@ -71,7 +71,7 @@ setup(
     author_email="banesiu.sever@gmail.com",
     url="https://github.com/severb/graypy",
     license="BSD License",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     zip_safe=False,
     tests_require=[
@@ -80,10 +80,10 @@ setup(
         "pylint>=1.9.3,<2.0.0",
         "mock>=2.0.0,<3.0.0",
         "requests>=2.20.1,<3.0.0",
-        "amqplib>=1.0.2,<2.0.0",
+        "amqp>=2.0.0,<6.0.0",
     ],
     extras_require={
-        "amqp": ["amqplib==1.0.2"],
+        "amqp": ["amqp>=2.0.0,<6.0.0"],
         "docs": [
             "sphinx>=2.1.2,<3.0.0",
             "sphinx_rtd_theme>=0.4.3,<1.0.0",
@@ -4,7 +4,25 @@
 """helper functions for testing graypy with mocks of python logging and
 Graylog services"""
 
+import copy
+import json
 import logging
+import socket
+import struct
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import StreamRequestHandler, TCPServer, ThreadingMixIn
+
+try:
+    from amqp.serialization import decode_properties_basic, dumps
+except ImportError:
+    decode_properties_basic = dumps = None  # the amqp package is not installed
 
 MOCK_LOG_RECORD_NAME = "MOCK_LOG_RECORD"
 MOCK_LOG_RECORD = logging.LogRecord(
@@ -16,3 +34,284 @@ MOCK_LOG_RECORD = logging.LogRecord(
     args=(),
     exc_info=None,
 )
+
+
+def make_log_record(message):
+    """Copy the mock log record with another message"""
+    record = copy.copy(MOCK_LOG_RECORD)
+    record.msg = str(message)
+    return record
+
+
+def free_port():
+    """Get a local TCP port nothing listens on"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(condition, timeout=5):
+    """Wait for a condition set from another thread
+
+    :return: The condition once true or after ``timeout`` seconds.
+    """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    pass
+
+
+class MockGELFHTTPServer(object):
+    """Local HTTP server that records the GELF logs POSTed to it
+
+    The server speaks HTTP/1.1 and keeps connections alive unless
+    ``close_connections`` is set, in which case it drops the connection
+    after each response without notifying the client. The requests to
+    ``reject_paths`` are answered with a 400 response and not recorded.
+    The responses are delayed by ``response_delay`` seconds.
+    """
+
+    def __init__(self, close_connections=False, port=0, reject_paths=()):
+        self.rejected = 0
+        self.bodies = []
+        self.paths = []
+        self.content_encodings = []
+        self.connections = set()
+        self.close_connections = close_connections
+        self.response_delay = 0
+
+        mock_server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if self.path in reject_paths:
+                    mock_server.rejected += 1
+                    self.send_response(400)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                mock_server.bodies.append(body)
+                mock_server.paths.append(self.path)
+                mock_server.content_encodings.append(
+                    self.headers.get("Content-Encoding")
+                )
+                mock_server.connections.add(self.client_address)
+                time.sleep(mock_server.response_delay)
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                self.wfile.flush()
+                if mock_server.close_connections:
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), RequestHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MockGELFTCPServer(object):
+    """Local TCP server that records the bytes sent to it"""
+
+    def __init__(self, port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.data = b""
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        connection, _ = self.sock.accept()
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            self.data += data
+        connection.close()
+
+    def frames(self, count=0, timeout=5):
+        """Wait for at least ``count`` GELF logs to be received"""
+        deadline = time.time() + timeout
+        while self.data.count(b"\x00") < count and time.time() < deadline:
+            time.sleep(0.01)
+        return [
+            json.loads(frame.decode("utf-8")) for frame in self.data.split(b"\x00")[:-1]
+        ]
+
+    def close(self):
+        self.thread.join(5)
+        self.sock.close()
+
+
+_AMQP_FRAME = struct.Struct(">BHI")
+_AMQP_FRAME_END = b"\xce"
+_AMQP_METHOD_FRAME = 1
+_AMQP_HEADER_FRAME = 2
+_AMQP_BODY_FRAME = 3
+
+
+class ThreadingTCPServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockAMQPServer(object):
+    """Local AMQP 0-9-1 broker that records the messages published to it
+
+    It speaks just enough of the protocol for a publisher: the connection
+    handshake, channels, exchange declarations, publisher confirms and
+    publishes. The messages of a confirmed channel whose delivery tag is in
+    ``nacked_tags``, or all of them if ``nack`` is set, are rejected with a
+    ``Basic.Nack``, the others accepted with a ``Basic.Ack``, consecutive
+    ones being confirmed at once with ``multiple`` set.
+    """
+
+    def __init__(self):
+        if dumps is None:
+            raise RuntimeError("MockAMQPServer requires the amqp package")
+        self.published = []
+        self.nack = False
+        self.nacked_tags = set()
+        self.connections = 0
+        mock_server = self
+
+        class RequestHandler(StreamRequestHandler):
+            def send_method(self, channel, method, argsig="", args=()):
+                payload = struct.pack(">HH", *method) + dumps(argsig, args)
+                self.connection.sendall(
+                    _AMQP_FRAME.pack(_AMQP_METHOD_FRAME, channel, len(payload))
+                    + payload
+                    + _AMQP_FRAME_END
+                )
+
+            def confirm(self, channel, tags):
+                """Confirm the delivery tags of a channel, as few frames as
+                possible"""
+                nacks = [
+                    mock_server.nack or tag in mock_server.nacked_tags for tag in tags
+                ]
+                for index, tag in enumerate(tags):
+                    nack = nacks[index]
+                    if index + 1 < len(tags) and nacks[index + 1] == nack:
+                        continue
+                    method = (60, 120) if nack else (60, 80)
+                    self.send_method(channel, method, "Lb", (tag, True))
+
+            def handle(self):
+                mock_server.connections += 1
+                # like RabbitMQ, do not delay the small confirm frames
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if self.rfile.read(8) != b"AMQP\x00\x00\x09\x01":
+                    return
+                self.send_method(
+                    0, (10, 10), "ooFSS", (0, 9, {}, "PLAIN AMQPLAIN", "en_US")
+                )
+                buffer = b""
+                # last delivery tag of the confirmed channels
+                confirmed = {}
+                # header and body parts of the message being published
+                content = {}
+                while True:
+                    data = self.connection.recv(65536)
+                    if not data:
+                        return
+                    buffer += data
+                    offset = 0
+                    tags = {}
+                    while len(buffer) - offset >= _AMQP_FRAME.size:
+                        kind, channel, size = _AMQP_FRAME.unpack_from(buffer, offset)
+                        end = offset + _AMQP_FRAME.size + size
+                        if len(buffer) <= end:
+                            break
+                        payload = buffer[offset + _AMQP_FRAME.size : end]
+                        offset = end + 1
+                        if kind == _AMQP_METHOD_FRAME:
+                            method = struct.unpack(">HH", payload[:4])
+                            if not self.on_method(channel, method, confirmed):
+                                return
+                            if method == (60, 40):  # Basic.Publish
+                                content[channel] = [None, 0, []]
+                        elif kind == _AMQP_HEADER_FRAME:
+                            size = struct.unpack(">Q", payload[4:12])[0]
+                            properties = decode_properties_basic(payload, 12)[0]
+                            content[channel][:2] = [properties, size]
+                        elif kind == _AMQP_BODY_FRAME:
+                            content[channel][2].append(payload)
+                        message = content.get(channel)
+                        if message is None or message[0] is None:
+                            continue
+                        body = b"".join(message[2])
+                        if len(body) < message[1]:
+                            continue
+                        del content[channel]
+                        mock_server.published.append((body, message[0]))
+                        if channel in confirmed:
+                            confirmed[channel] += 1
+                            tags.setdefault(channel, []).append(confirmed[channel])
+                    buffer = buffer[offset:]
+                    for channel, channel_tags in tags.items():
+                        self.confirm(channel, channel_tags)
+
+            def on_method(self, channel, method, confirmed):
+                """Answer a method, return :obj:`False` to close the
+                connection"""
+                if method == (10, 11):  # Connection.StartOk
+                    self.send_method(0, (10, 30), "BlB", (0, 131072, 0))
+                elif method == (10, 40):  # Connection.Open
+                    self.send_method(0, (10, 41), "s", ("",))
+                elif method == (10, 50):  # Connection.Close
+                    self.send_method(0, (10, 51))
+                    return False
+                elif method == (20, 10):  # Channel.Open
+                    self.send_method(channel, (20, 11), "S", ("",))
+                elif method == (20, 40):  # Channel.Close
+                    self.send_method(channel, (20, 41))
+                elif method == (40, 10):  # Exchange.Declare
+                    self.send_method(channel, (40, 11))
+                elif method == (85, 10):  # Confirm.Select
+                    confirmed[channel] = 0
+                    self.send_method(channel, (85, 11))
+                return True
+
+        self.server = ThreadingTCPServer(("127.0.0.1", 0), RequestHandler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def messages(self):
+        return len(self.published)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.handler.GELFHTTPHandler`"""
+
+import json
+import logging
+import socket
+import time
+
+import mock
+import pytest
+
+from graypy.compression import decompress
+from graypy.handler import GELFHTTPHandler, HTTPConnectionPool
+from graypy.spool import DiskSpool
+
+from tests.unit.helper import MOCK_LOG_RECORD, MockGELFHTTPServer, wait_for
+
+
+def test_invalid_pool_size():
+    """Test constructing :class:`graypy.handler.HTTPConnectionPool` with
+    an invalid ``pool_size``"""
+    with pytest.raises(ValueError):
+        HTTPConnectionPool("127.0.0.1", 12203, pool_size=0)
+
+
+def test_connection_reuse():
+    """Test that consecutive GELF logs are sent over one persistent
+    HTTP connection"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler("127.0.0.1", server.port, compress=False)
+        for _ in range(10):
+            handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 10 == len(server.bodies)
+    assert 1 == len(server.connections)
+    gelf_dict = json.loads(server.bodies[0].decode("utf-8"))
+    assert "Log message" == gelf_dict["short_message"]
+
+
+def test_reconnect_on_server_close():
+    """Test that a connection closed by the server is transparently
+    replaced by a new one"""
+    with MockGELFHTTPServer(close_connections=True) as server:
+        handler = GELFHTTPHandler("127.0.0.1", server.port, compress=False)
+        for _ in range(5):
+            handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 5 == len(server.bodies)
+    assert 5 == len(server.connections)
+
+
+def test_idle_timeout():
+    """Test that connections idle for longer than ``idle_timeout`` are
+    not reused"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1", server.port, compress=False, idle_timeout=0
+        )
+        for _ in range(3):
+            handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 3 == len(server.bodies)
+    assert 3 == len(server.connections)
+
+
+def test_timeout_not_retried():
+    """Test that a request timing out over a reused connection is not sent
+    again"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler("127.0.0.1", server.port, compress=False, timeout=0.5)
+        handler.handle(MOCK_LOG_RECORD)
+        server.response_delay = 1
+        start = time.time()
+        with mock.patch.object(logging.Handler, "handleError") as handle_error:
+            handler.handle(MOCK_LOG_RECORD)
+        assert time.time() - start < 1
+        assert handle_error.called
+        time.sleep(1)
+        handler.close()
+    assert 2 == len(server.bodies)
+
+
+def test_batch_timeout_not_retried():
+    """Test that a batch timing out over a reused connection is not sent
+    again"""
+    with MockGELFHTTPServer() as server:
+        pool = HTTPConnectionPool("127.0.0.1", server.port, timeout=0.5)
+        pool.request("POST", "/gelf", b"{}")
+        server.response_delay = 1
+        with pytest.raises(socket.timeout):
+            pool.request_many("POST", "/gelf", [(b"{}", {}), (b"{}", {})])
+        time.sleep(1)
+        pool.close()
+    assert 2 == len(server.bodies)
+
+
+def test_emit_error_handled():
+    """Test that failing to reach the Graylog server is handled by
+    :meth:`logging.Handler.handleError` instead of raising"""
+    handler = GELFHTTPHandler("127.0.0.1", 1, timeout=1)
+    raise_exceptions = logging.raiseExceptions
+    logging.raiseExceptions = False
+    try:
+        handler.handle(MOCK_LOG_RECORD)
+    finally:
+        logging.raiseExceptions = raise_exceptions
+
+
+def test_invalid_batch_mode():
+    with pytest.raises(ValueError):
+        GELFHTTPHandler("127.0.0.1", 12203, batch_size=10, batch_mode="foobar")
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_batch_ndjson(compress):
+    """Test that batches are sent as newline delimited GELF logs"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1",
+            server.port,
+            compress=compress,
+            batch_size=4,
+            batch_interval=60,
+            batch_path="/gelf/bulk",
+        )
+        for _ in range(10):
+            handler.handle(MOCK_LOG_RECORD)
+        assert 2 == len(server.bodies)
+        handler.close()
+
+    assert ["/gelf/bulk"] * 3 == server.paths
+    assert [4, 4, 2] == [len(decompress(body).split(b"\n")) for body in server.bodies]
+    for body in server.bodies:
+        for line in decompress(body).split(b"\n"):
+            assert MOCK_LOG_RECORD.getMessage() == json.loads(line)["short_message"]
+    expected_encoding = "deflate" if compress else None
+    assert [expected_encoding] * 3 == server.content_encodings
+
+
+def test_batch_sequential():
+    """Test that the GELF logs of a batch are sent back to back over one
+    persistent HTTP connection"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1",
+            server.port,
+            pool_size=4,
+            batch_size=5,
+            batch_interval=60,
+            batch_mode="sequential",
+        )
+        for _ in range(10):
+            handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+
+    assert 10 == len(server.bodies)
+    assert ["/gelf"] * 10 == server.paths
+    assert 1 == len(server.connections)
+
+
+def test_batch_rejected():
+    """Test that a batch rejected with a non 2xx response is handled as an
+    error rather than counted as sent"""
+    with MockGELFHTTPServer(reject_paths=["/gelf/bulk"]) as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1",
+            server.port,
+            batch_size=2,
+            batch_interval=60,
+            batch_path="/gelf/bulk",
+        )
+        with mock.patch.object(logging.Handler, "handleError") as handle_error:
+            for _ in range(2):
+                handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 1 == server.rejected
+    assert 1 == handle_error.call_count
+    record = handle_error.call_args[0][-1]
+    assert record.getMessage().startswith("2 GELF logs of a batch dropped")
+    assert 0 == handler.metrics.sent
+    assert 2 == handler.metrics.unsent
+    assert 1 == handler.metrics.errors
+
+
+def test_batch_rejected_spooled(tmpdir):
+    """Test that the GELF logs of a rejected NDJSON batch are spooled, then
+    sent one by one"""
+    with MockGELFHTTPServer(reject_paths=["/gelf/bulk"]) as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1",
+            server.port,
+            batch_size=3,
+            batch_interval=60,
+            batch_path="/gelf/bulk",
+        )
+        handler.spool = DiskSpool(str(tmpdir), retry_interval=0.05)
+        for _ in range(3):
+            handler.handle(MOCK_LOG_RECORD)
+        assert 3 == handler.metrics.unsent
+        assert wait_for(lambda: 3 == len(server.bodies))
+        handler.close()
+    assert ["/gelf"] * 3 == server.paths
+
+
+def test_batch_sequential_rejected():
+    """Test that only the GELF logs of a sequential batch rejected with a
+    non 2xx response are handled as errors"""
+    with MockGELFHTTPServer(reject_paths=["/gelf"]) as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1",
+            server.port,
+            batch_size=2,
+            batch_interval=60,
+            batch_mode="sequential",
+        )
+        with mock.patch.object(logging.Handler, "handleError") as handle_error:
+            for _ in range(2):
+                handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 2 == server.rejected
+    assert 1 == handle_error.call_count
+    assert 0 == handler.metrics.sent
+    assert 2 == handler.metrics.unsent
+
+
+def test_emit_rejected():
+    """Test that a GELF log rejected with a non 2xx response is handled as
+    an error"""
+    with MockGELFHTTPServer(reject_paths=["/gelf"]) as server:
+        handler = GELFHTTPHandler("127.0.0.1", server.port)
+        with mock.patch.object(logging.Handler, "handleError") as handle_error:
+            handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert 1 == handle_error.call_count
+    assert 0 == handler.metrics.sent
+
+
+def test_batch_interval():
+    """Test that an incomplete batch is sent after ``batch_interval``"""
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1", server.port, batch_size=100, batch_interval=0.05
+        )
+        handler.handle(MOCK_LOG_RECORD)
+        handler.handle(MOCK_LOG_RECORD)
+        deadline = time.time() + 5
+        while not server.bodies and time.time() < deadline:
+            time.sleep(0.01)
+        assert 1 == len(server.bodies)
+        assert 2 == len(decompress(server.bodies[0]).split(b"\n"))
+        handler.close()
+    assert 1 == len(server.bodies)
+
+
+def test_batch_flush():
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler(
+            "127.0.0.1", server.port, batch_size=100, batch_interval=60
+        )
+        handler.handle(MOCK_LOG_RECORD)
+        handler.flush()
+        assert 1 == len(server.bodies)
+        handler.close()
+    assert 1 == len(server.bodies)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.handler.GELFTCPHandler` write coalescing"""
+
+import socket
+import ssl
+import time
+
+import mock
+import pytest
+
+from graypy.handler import GELFTCPHandler
+
+from tests.unit.helper import MOCK_LOG_RECORD, MockGELFTCPServer
+
+
+@pytest.fixture
+def server():
+    server = MockGELFTCPServer()
+    yield server
+    server.close()
+
+
+def test_coalesce_flush(server):
+    """Test that coalesced GELF logs are written at once on flush"""
+    handler = GELFTCPHandler(
+        "127.0.0.1", server.port, coalesce_bytes=1 << 20, coalesce_interval=60
+    )
+    with mock.patch.object(
+        GELFTCPHandler, "_sendmsg_all", wraps=GELFTCPHandler._sendmsg_all
+    ) as sendmsg_all:
+        for _ in range(10):
+            handler.handle(MOCK_LOG_RECORD)
+        time.sleep(0.05)
+        assert [] == server.frames()
+        handler.flush()
+        assert 10 == len(server.frames(10))
+    assert 1 == sendmsg_all.call_count
+    handler.close()
+
+
+def test_coalesce_bytes(server):
+    """Test that the coalesced GELF logs are written once they add up to
+    ``coalesce_bytes``"""
+    frame_size = len(GELFTCPHandler("127.0.0.1", 0).makePickle(MOCK_LOG_RECORD))
+    handler = GELFTCPHandler(
+        "127.0.0.1",
+        server.port,
+        coalesce_bytes=frame_size * 3,
+        coalesce_interval=60,
+    )
+    for _ in range(4):
+        handler.handle(MOCK_LOG_RECORD)
+    assert 3 == len(server.frames(3))
+    handler.close()
+    assert 4 == len(server.frames(4))
+
+
+def test_coalesce_interval(server):
+    handler = GELFTCPHandler(
+        "127.0.0.1", server.port, coalesce_bytes=1 << 20, coalesce_interval=0.01
+    )
+    handler.handle(MOCK_LOG_RECORD)
+    frames = server.frames(1)
+    assert MOCK_LOG_RECORD.getMessage() == frames[0]["short_message"]
+    handler.close()
+
+
+def test_tls_socket_does_not_sendmsg():
+    assert not GELFTCPHandler._supports_sendmsg(mock.Mock(spec=ssl.SSLSocket))
+    assert GELFTCPHandler._supports_sendmsg(mock.Mock(spec=socket.socket))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for the :class:`ssl.SSLContext` reuse and TLS session
+resumption of :class:`graypy.handler.GELFTLSHandler`"""
+
+import ssl
+
+import mock
+import pytest
+
+from graypy.handler import GELFTLSHandler
+
+from tests.unit.helper import MOCK_LOG_RECORD
+
+
+@pytest.fixture
+def ssl_context():
+    context = mock.Mock(spec=ssl.SSLContext)
+    wrapped_socket = context.wrap_socket.return_value
+    wrapped_socket.session = mock.Mock(has_ticket=True)
+    wrapped_socket.recv.return_value = b""
+    return context
+
+
+def test_ssl_context_reused(ssl_context):
+    handler = GELFTLSHandler("127.0.0.1", ssl_context=ssl_context)
+    with mock.patch("socket.socket"):
+        handler.makeSocket()
+        handler.makeSocket()
+    assert ssl_context is handler.ssl_context
+    assert 2 == ssl_context.wrap_socket.call_count
+    wrapped_socket = ssl_context.wrap_socket.return_value
+    wrapped_socket.connect.assert_called_with(("127.0.0.1", 12204))
+
+
+def test_tls_session_resumed(ssl_context):
+    handler = GELFTLSHandler("127.0.0.1", ssl_context=ssl_context)
+    with mock.patch("socket.socket"):
+        handler.makeSocket()
+        assert "session" not in ssl_context.wrap_socket.call_args[1]
+        handler.makeSocket()
+    session = ssl_context.wrap_socket.return_value.session
+    assert session is ssl_context.wrap_socket.call_args[1]["session"]
+    assert "127.0.0.1" == ssl_context.wrap_socket.call_args[1]["server_hostname"]
+
+
+def test_tls_session_reset_with_new_ssl_context(ssl_context):
+    handler = GELFTLSHandler("127.0.0.1", ssl_context=ssl_context)
+    with mock.patch("socket.socket"):
+        handler.makeSocket()
+    handler.ssl_context = mock.Mock(spec=ssl.SSLContext)
+    assert handler.tls_session is None
+
+
+def test_tls13_session_ticket_polled(ssl_context):
+    wrapped_socket = ssl_context.wrap_socket.return_value
+    wrapped_socket.version.return_value = "TLSv1.3"
+    wrapped_socket.session = mock.Mock(has_ticket=False)
+    handler = GELFTLSHandler("127.0.0.1", ssl_context=ssl_context)
+    with mock.patch("socket.socket"):
+        handler.handle(MOCK_LOG_RECORD)
+        assert handler.tls_session is None
+        wrapped_socket.session = mock.Mock(has_ticket=True)
+        handler.handle(MOCK_LOG_RECORD)
+        assert wrapped_socket.session is handler.tls_session
+        recv_calls = wrapped_socket.recv.call_count
+        handler.handle(MOCK_LOG_RECORD)
+    # the ticket is no longer polled for once received
+    assert recv_calls == wrapped_socket.recv.call_count
+
+
+def test_close_reads_pending_records(ssl_context):
+    wrapped_socket = ssl_context.wrap_socket.return_value
+    wrapped_socket.recv.side_effect = [b"ticket", b"ticket", ssl.SSLWantReadError()]
+    handler = GELFTLSHandler("127.0.0.1", ssl_context=ssl_context)
+    with mock.patch("socket.socket"):
+        handler.sock = handler.makeSocket()
+        wrapped_socket.recv.reset_mock(side_effect=True)
+        wrapped_socket.recv.side_effect = [b"ticket", ssl.SSLWantReadError()]
+        handler.close()
+    assert 2 == wrapped_socket.recv.call_count
+    wrapped_socket.close.assert_called_once_with()
+
+
+def test_ssl_context_built_once():
+    handler = GELFTLSHandler("127.0.0.1")
+    context = handler.ssl_context
+    assert context is handler.ssl_context
+    assert ssl.CERT_NONE == context.verify_mode
+    assert not context.check_hostname
+
+
+def test_ssl_context_validate():
+    handler = GELFTLSHandler("127.0.0.1", validate=True, ca_certs="/ca.pem")
+    with mock.patch.object(ssl.SSLContext, "load_verify_locations") as load:
+        assert ssl.CERT_REQUIRED == handler.ssl_context.verify_mode
+    load.assert_called_once_with("/ca.pem")
+
+
+def test_ssl_context_client_certificate():
+    handler = GELFTLSHandler("127.0.0.1", certfile="/cert.pem", keyfile="/key.pem")
+    with mock.patch.object(ssl.SSLContext, "load_cert_chain") as load:
+        handler.ssl_context
+    load.assert_called_once_with("/cert.pem", "/key.pem")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.handler.GELFUDPHandler`"""
+
+import errno
+import json
+import logging
+import socket
+import zlib
+
+import mock
+import pytest
+
+from graypy.handler import (
+    GELFUDPHandler,
+    BaseGELFChunker,
+    GELFChunkOverflowWarning,
+    GELFTruncatingChunker,
+)
+
+from tests.unit.helper import MOCK_LOG_RECORD
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+
+def test_send_chunked_message(receiver):
+    """Test that all the chunks of a chunked GELF log are sent over one
+    socket and can be reassembled"""
+    handler = GELFUDPHandler(
+        "127.0.0.1",
+        receiver.getsockname()[1],
+        gelf_chunker=BaseGELFChunker(chunk_size=20),
+        extra_fields=False,
+    )
+    message = handler.makePickle(MOCK_LOG_RECORD)
+    with mock.patch.object(
+        handler, "createSocket", wraps=handler.createSocket
+    ) as create_socket:
+        handler.send(message)
+    assert create_socket.call_count == 1
+
+    chunks = [receiver.recv(1024) for _ in range((len(message) + 19) // 20)]
+    assert len(chunks) > 1
+    for index, chunk in enumerate(chunks):
+        assert chunk[:2] == b"\x1e\x0f"
+        assert chunk[2:10] == chunks[0][2:10]
+        assert chunk[10:12] == bytearray([index, len(chunks)])
+    reassembled = b"".join(chunk[12:] for chunk in chunks)
+    assert reassembled == message
+    assert json.loads(zlib.decompress(reassembled).decode("utf-8"))
+    handler.close()
+
+
+def test_send_datagrams_socket_failure():
+    """Test that nothing is sent when the socket cannot be created"""
+    handler = GELFUDPHandler("127.0.0.1", 12202)
+    with mock.patch.object(handler, "createSocket") as create_socket:
+        handler._send_datagrams([b"a", b"b"])
+    create_socket.assert_called_once_with()
+    assert handler.sock is None
+
+
+def test_truncate_chunk_overflow(receiver):
+    """Test that a chunk overflowing GELF log is truncated from its GELF
+    dictionary without decompressing and parsing its GELF message"""
+    handler = GELFUDPHandler(
+        "127.0.0.1",
+        receiver.getsockname()[1],
+        gelf_chunker=GELFTruncatingChunker(chunk_size=100),
+    )
+    record = logging.LogRecord(
+        "test_truncate_chunk_overflow",
+        logging.INFO,
+        None,
+        None,
+        " ".join(str(i) for i in range(100000)),
+        None,
+        None,
+    )
+    with mock.patch("zlib.decompress") as decompress:
+        with pytest.warns(GELFChunkOverflowWarning):
+            handler.handle(record)
+    decompress.assert_not_called()
+
+    chunks = [receiver.recv(1024)]
+    chunks.extend(receiver.recv(1024) for _ in range(chunks[0][11] - 1))
+    assert len(chunks) <= 128
+    gelf_json = json.loads(
+        zlib.decompress(b"".join(chunk[12:] for chunk in chunks)).decode("utf-8")
+    )
+    assert gelf_json["_chunk_overflow"] is True
+    assert record.getMessage().startswith(gelf_json["short_message"])
+    handler.close()
+
+
+def test_connected_socket(receiver):
+    """Test that a connected socket sends the GELF logs with send()"""
+    handler = GELFUDPHandler(
+        "127.0.0.1", receiver.getsockname()[1], connect=True, send_buffer_size=65536
+    )
+    for _ in range(2):
+        handler.handle(MOCK_LOG_RECORD)
+    for _ in range(2):
+        assert json.loads(zlib.decompress(receiver.recv(65536)).decode("utf-8"))
+    assert receiver.getsockname() == handler.sock.getpeername()
+    assert handler.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536
+    assert 2 == handler.metrics.sent
+    handler.close()
+
+
+def test_connected_socket_address_change(receiver):
+    """Test that the socket is connected again when the address of the GELF
+    UDP input is resolved into another one"""
+    handler = GELFUDPHandler("127.0.0.1", receiver.getsockname()[1], connect=True)
+    handler.handle(MOCK_LOG_RECORD)
+    sock = handler.sock
+    with mock.patch.object(handler, "_resolve", return_value=("127.0.0.1", 1)):
+        handler._send_datagrams([b"a"])
+    assert ("127.0.0.1", 1) == handler.sock.getpeername()
+    assert sock.fileno() == -1
+    handler.close()
+
+
+def test_connected_socket_refused():
+    """Test that a datagram is sent again once when a previous datagram was
+    refused, and counted as unsent if refused again"""
+    handler = GELFUDPHandler("127.0.0.1", 12202, connect=True)
+    sock = mock.Mock()
+    refused = socket.error(errno.ECONNREFUSED, "Connection refused")
+    sock.send.side_effect = [refused, 1]
+    handler.sock = sock
+    handler._connected_address = ("127.0.0.1", 12202)
+    assert handler._send_datagrams([b"a"])
+    assert 2 == sock.send.call_count
+
+    sock.send.side_effect = refused
+    handler.handle(MOCK_LOG_RECORD)
+    assert 1 == handler.metrics.unsent
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for the asyncio GELF handlers of :mod:`graypy.aio`"""
+
+import json
+import logging
+import socket
+import sys
+import threading
+import zlib
+
+import mock
+import pytest
+
+from graypy.handler import BATCH_NDJSON, BATCH_SEQUENTIAL
+
+from tests.unit.helper import MOCK_LOG_RECORD, MockGELFHTTPServer, MockGELFTCPServer
+
+if sys.version_info < (3, 7):
+    pytest.skip("graypy.aio requires python 3.7+", allow_module_level=True)
+
+import asyncio
+
+from graypy.aio import (
+    AsyncGELFHTTPHandler,
+    AsyncGELFTCPHandler,
+    AsyncGELFTLSHandler,
+    AsyncGELFUDPHandler,
+)
+from graypy.reconnect import Backoff
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        AsyncGELFTCPHandler("127.0.0.1", overflow_policy="block")
+
+
+def test_udp(receiver):
+    handler = AsyncGELFUDPHandler("127.0.0.1", receiver.getsockname()[1])
+
+    async def main():
+        for _ in range(3):
+            handler.handle(MOCK_LOG_RECORD)
+        await handler.aclose()
+
+    asyncio.run(main())
+    for _ in range(3):
+        gelf_dict = json.loads(zlib.decompress(receiver.recv(65536)).decode("utf-8"))
+        assert "Log message" == gelf_dict["short_message"]
+    assert 3 == handler.metrics.sent
+
+
+def test_tcp_batches():
+    server = MockGELFTCPServer()
+    handler = AsyncGELFTCPHandler("127.0.0.1", server.port, batch_size=10)
+
+    async def main():
+        for _ in range(25):
+            handler.handle(MOCK_LOG_RECORD)
+        await handler.aflush()
+        assert 25 == handler.metrics.sent
+        await handler.aclose()
+
+    asyncio.run(main())
+    assert 25 == len(server.frames(25))
+    server.close()
+    # batches are always timed
+    assert 3 == handler.metrics.snapshot()["stages"]["send"]["count"]
+
+
+def test_emit_does_not_write():
+    """Test that logging from the event loop only queues the GELF logs"""
+    server = MockGELFTCPServer()
+    handler = AsyncGELFTCPHandler("127.0.0.1", server.port)
+
+    async def main():
+        handler.handle(MOCK_LOG_RECORD)
+        assert 1 == len(handler._queue)
+        assert 0 == handler.metrics.sent
+        await handler.aclose()
+
+    asyncio.run(main())
+    assert 1 == len(server.frames(1))
+    server.close()
+
+
+def test_emit_from_thread():
+    server = MockGELFTCPServer()
+    handler = AsyncGELFTCPHandler("127.0.0.1", server.port)
+
+    async def main():
+        handler.start()
+        thread = threading.Thread(target=handler.handle, args=(MOCK_LOG_RECORD,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        await handler.aclose()
+
+    asyncio.run(main())
+    assert 1 == len(server.frames(1))
+    server.close()
+
+
+@pytest.mark.parametrize(
+    "overflow_policy,kept", [("drop_newest", [0, 1]), ("drop_oldest", [3, 4])]
+)
+def test_overflow(overflow_policy, kept):
+    handler = AsyncGELFTCPHandler(
+        "127.0.0.1", 12201, queue_size=2, overflow_policy=overflow_policy
+    )
+    # no event loop is running, the GELF logs wait in the queue
+    for number in range(5):
+        handler._put(number)
+    assert kept == list(handler._queue)
+    assert 3 == handler.dropped
+    handler.close()
+    assert 5 == handler.dropped
+
+
+def test_reconnect():
+    handler = AsyncGELFTCPHandler(
+        "127.0.0.1", 12201, backoff=Backoff(initial=0, jitter=0)
+    )
+    server = MockGELFTCPServer()
+    attempts = []
+    open_connection = asyncio.open_connection
+
+    def flaky_open_connection(host, port):
+        attempts.append(port)
+        if len(attempts) < 3:
+            raise ConnectionRefusedError()
+        return open_connection(host, server.port)
+
+    async def main():
+        with mock.patch("asyncio.open_connection", flaky_open_connection):
+            handler.handle(MOCK_LOG_RECORD)
+            await handler.aclose()
+
+    asyncio.run(main())
+    assert 3 == len(attempts)
+    assert 1 == len(server.frames(1))
+    server.close()
+
+
+def test_aclose_timeout():
+    handler = AsyncGELFTCPHandler("127.0.0.1", 12201, backoff=Backoff(initial=60))
+
+    async def main():
+        with mock.patch("asyncio.open_connection", side_effect=ConnectionRefusedError):
+            handler.handle(MOCK_LOG_RECORD)
+            handler.handle(MOCK_LOG_RECORD)
+            await handler.aclose(timeout=0.1)
+
+    asyncio.run(main())
+    assert 2 == handler.dropped
+    assert 2 == handler.metrics.unsent
+
+
+def test_tls_connection():
+    ssl_context = mock.Mock()
+    handler = AsyncGELFTLSHandler("localhost", ssl_context=ssl_context)
+    with mock.patch("asyncio.open_connection", mock.Mock()) as open_connection:
+        handler._open_connection()
+    open_connection.assert_called_once_with(
+        "localhost", 12204, ssl=ssl_context, server_hostname="localhost"
+    )
+
+
+@pytest.mark.parametrize("close_connections", [False, True])
+def test_http_sequential(close_connections):
+    with MockGELFHTTPServer(close_connections=close_connections) as server:
+        handler = AsyncGELFHTTPHandler("127.0.0.1", server.port)
+
+        async def main():
+            for _ in range(5):
+                handler.handle(MOCK_LOG_RECORD)
+            await handler.aclose()
+
+        asyncio.run(main())
+    assert 5 == len(server.bodies)
+    assert ["deflate"] * 5 == server.content_encodings
+    assert (5 if close_connections else 1) == len(server.connections)
+    assert 5 == handler.metrics.sent
+
+
+def test_http_ndjson():
+    with MockGELFHTTPServer() as server:
+        handler = AsyncGELFHTTPHandler(
+            "127.0.0.1", server.port, batch_mode=BATCH_NDJSON, batch_path="/bulk"
+        )
+
+        async def main():
+            for _ in range(5):
+                handler.handle(MOCK_LOG_RECORD)
+            await handler.aclose()
+
+        asyncio.run(main())
+    assert ["/bulk"] == server.paths
+    lines = zlib.decompress(server.bodies[0]).split(b"\n")
+    assert 5 == len(lines)
+    assert all(
+        "Log message" == json.loads(line.decode("utf-8"))["short_message"]
+        for line in lines
+    )
+
+
+@pytest.mark.parametrize(
+    "batch_mode, path, errors",
+    [(BATCH_SEQUENTIAL, "/gelf", 5), (BATCH_NDJSON, "/bulk", 1)],
+)
+def test_http_rejected(batch_mode, path, errors):
+    with MockGELFHTTPServer(reject_paths=(path,)) as server:
+        handler = AsyncGELFHTTPHandler(
+            "127.0.0.1", server.port, batch_mode=batch_mode, batch_path="/bulk"
+        )
+
+        async def main():
+            for _ in range(5):
+                handler.handle(MOCK_LOG_RECORD)
+            await handler.aflush()
+            assert not handler._task.done()
+            await handler.aclose()
+
+        with mock.patch.object(logging.Handler, "handleError") as handle_error:
+            asyncio.run(main())
+    assert errors == handle_error.call_count
+    # the errors are reported with the log records of the GELF logs dropped
+    record = handle_error.call_args[0][-1]
+    if batch_mode == BATCH_NDJSON:
+        assert record.getMessage().startswith("5 GELF logs of a batch dropped")
+    else:
+        assert MOCK_LOG_RECORD is record
+    assert 0 == handler.metrics.sent
+    assert 5 == handler.metrics.unsent
+
+
+def test_http_malformed_response():
+    requests = []
+
+    async def respond(reader, writer):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            requests.append(await reader.readexactly(length))
+            if len(requests) == 1:
+                writer.write(b"HTTP/1.1 202 Accepted\r\nContent-Length: x\r\n\r\n")
+            else:
+                writer.write(b"HTTP/1.1 202 Accepted\r\nContent-Length: 0\r\n\r\n")
+
+    async def main():
+        server = await asyncio.start_server(respond, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        handler = AsyncGELFHTTPHandler("127.0.0.1", port)
+        handler.handle(MOCK_LOG_RECORD)
+        await handler.aflush()
+        # the writer task survives the malformed response
+        handler.handle(MOCK_LOG_RECORD)
+        await handler.aclose()
+        server.close()
+        return handler
+
+    with mock.patch.object(logging.Handler, "handleError") as handle_error:
+        handler = asyncio.run(main())
+    assert 1 == handle_error.call_count
+    record = handle_error.call_args[0][-1]
+    assert record.getMessage().startswith("1 GELF logs of a batch dropped")
+    assert 2 == len(requests)
+    assert 1 == handler.metrics.sent
+    assert 1 == handler.metrics.unsent
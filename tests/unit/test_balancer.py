@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.balancer.GELFBalancingHandler`"""
+
+import logging
+import socket
+import threading
+import time
+
+import mock
+import pytest
+
+from graypy.balancer import GELFBalancingHandler, probe_endpoint
+from graypy.handler import GELFTCPHandler, GELFUDPHandler
+
+from tests.unit.helper import MOCK_LOG_RECORD
+
+
+def make_record(name):
+    return logging.LogRecord(name, logging.INFO, None, None, "message", None, None)
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def handlers():
+    handlers = [GELFUDPHandler("127.0.0.1", 12202 + port) for port in range(3)]
+    for handler in handlers:
+        handler.handle = mock.Mock()
+    return handlers
+
+
+def test_invalid_strategy(handlers):
+    with pytest.raises(ValueError):
+        GELFBalancingHandler(handlers, strategy="random")
+    with pytest.raises(ValueError):
+        GELFBalancingHandler([])
+
+
+def test_round_robin(handlers):
+    balancer = GELFBalancingHandler(handlers)
+    for _ in range(6):
+        balancer.handle(MOCK_LOG_RECORD)
+    assert [2, 2, 2] == [handler.handle.call_count for handler in handlers]
+
+
+def test_least_outstanding(handlers):
+    balancer = GELFBalancingHandler(handlers, strategy="least_outstanding")
+    balancer.endpoints[0].outstanding = 2
+    balancer.endpoints[1].outstanding = 1
+    balancer.handle(MOCK_LOG_RECORD)
+    assert handlers[2].handle.called
+    assert 0 == balancer.endpoints[2].outstanding
+
+
+def test_consistent_hash(handlers):
+    balancer = GELFBalancingHandler(handlers, strategy="consistent_hash")
+    names = ["facility{}".format(number) for number in range(30)]
+    for name in names:
+        balancer.handle(make_record(name))
+    first = [
+        [call[0][0].name for call in handler.handle.call_args_list]
+        for handler in handlers
+    ]
+    # every handler gets some facilities
+    assert all(first)
+
+    # the facilities of an unhealthy handler move, the others stay
+    balancer.endpoints[0].healthy = False
+    for handler in handlers:
+        handler.handle.reset_mock()
+    for name in names:
+        balancer.handle(make_record(name))
+    for before, handler in zip(first[1:], handlers[1:]):
+        after = [call[0][0].name for call in handler.handle.call_args_list]
+        assert set(before) <= set(after)
+    assert not handlers[0].handle.called
+
+
+def test_failover_and_probe():
+    handlers = [GELFTCPHandler("127.0.0.1", 12201) for _ in range(2)]
+    probe = mock.Mock(return_value=True)
+    balancer = GELFBalancingHandler(handlers, probe=probe, probe_interval=0.01)
+    with mock.patch.object(handlers[0], "makeSocket", side_effect=socket.error):
+        with mock.patch.object(handlers[1], "send") as send:
+            balancer.handle(MOCK_LOG_RECORD)
+    assert 1 == handlers[0].metrics.unsent
+    assert send.called
+    assert 1 == balancer.endpoints[0].failures
+
+    deadline = time.time() + 5
+    while not balancer.endpoints[0].healthy and time.time() < deadline:
+        time.sleep(0.01)
+    assert balancer.endpoints[0].healthy
+    probe.assert_called_with(handlers[0], 1.0)
+    balancer.close()
+
+
+def test_failures_of_other_threads(handlers):
+    balancer = GELFBalancingHandler(
+        handlers, probe=mock.Mock(return_value=False), probe_interval=60
+    )
+
+    def fail_from_another_thread(record):
+        thread = threading.Thread(target=handlers[0].metrics.count, args=("unsent",))
+        thread.start()
+        thread.join()
+
+    handlers[0].handle.side_effect = fail_from_another_thread
+    balancer.handle(MOCK_LOG_RECORD)
+    assert 1 == handlers[0].metrics.unsent
+    assert balancer.endpoints[0].healthy
+    assert not handlers[1].handle.called
+    balancer.close()
+
+
+def test_record_errors_do_not_fail_over(receiver):
+    handlers = [
+        GELFUDPHandler("127.0.0.1", receiver.getsockname()[1]) for _ in range(3)
+    ]
+    balancer = GELFBalancingHandler(
+        handlers, probe=mock.Mock(return_value=False), probe_interval=60
+    )
+    record = logging.LogRecord(
+        "name", logging.ERROR, None, None, "%d", ("not a number",), None
+    )
+    with mock.patch.object(logging.Handler, "handleError") as handle_error:
+        balancer.handle(record)
+    assert 1 == handle_error.call_count
+    assert [1, 0, 0] == [handler.metrics.errors for handler in handlers]
+    assert all(endpoint.healthy for endpoint in balancer.endpoints)
+    balancer.close()
+
+
+def test_all_unhealthy(handlers):
+    balancer = GELFBalancingHandler(
+        handlers, probe=mock.Mock(return_value=False), probe_interval=60
+    )
+    for endpoint in balancer.endpoints:
+        endpoint.healthy = False
+    balancer.handle(MOCK_LOG_RECORD)
+    assert 1 == sum(handler.handle.call_count for handler in handlers)
+    balancer.close()
+
+
+def test_from_endpoints():
+    balancer = GELFBalancingHandler.from_endpoints(
+        GELFTCPHandler,
+        [("127.0.0.1", 12201), ("127.0.0.2", 12201)],
+        balancer_kwargs={"strategy": "least_outstanding"},
+        facility="app",
+    )
+    assert ["127.0.0.1", "127.0.0.2"] == [handler.host for handler in balancer.handlers]
+    assert "least_outstanding" == balancer.strategy
+    assert all("app" == handler.facility for handler in balancer.handlers)
+    balancer.close()
+
+
+def test_probe_endpoint():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    assert probe_endpoint(GELFTCPHandler("127.0.0.1", port), 1)
+    server.close()
+    assert not probe_endpoint(GELFTCPHandler("127.0.0.1", port), 1)
+    assert probe_endpoint(GELFUDPHandler("127.0.0.1", port), 1)
+    assert not probe_endpoint(GELFUDPHandler("graylog.invalid", port), 1)
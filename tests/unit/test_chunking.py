@@ -5,9 +5,11 @@
 
 import json
 import logging
+import os
 import struct
 import zlib
 
+import mock
 import pytest
 
 from graypy.handler import (
@@ -15,9 +17,12 @@ from graypy.handler import (
     GELFWarningChunker,
     BaseGELFChunker,
     BaseGELFHandler,
+    GELF_CHUNK_HEADER,
+    GELF_CHUNK_MAGIC,
     SYSLOG_LEVELS,
     GELFChunkOverflowWarning,
     GELFTruncationFailureWarning,
+    GELFMessageIdGenerator,
 )
 
 
@@ -45,6 +50,19 @@ def test_gelf_chunking(gelf_chunker):
         assert expected_chunk == chunk[12:]
 
 
+def test_gelf_chunk_parts():
+    """Test that the chunk payloads are views of the chunked message"""
+    message = bytearray(b"12345")
+    parts = list(BaseGELFChunker(chunk_size=2)._gen_gelf_chunk_parts(message))
+    assert [b"12", b"34", b"5"] == [bytes(payload) for _, payload in parts]
+
+    message[0:1] = b"x"
+    assert b"x2" == bytes(parts[0][1])
+    for sequence, (header, _) in enumerate(parts):
+        magic, _, chunk_seq, total_chunks = GELF_CHUNK_HEADER.unpack(header)
+        assert (GELF_CHUNK_MAGIC, sequence, 3) == (magic, chunk_seq, total_chunks)
+
+
 def rebuild_gelf_bytes_from_udp_chunks(chunks):
     gelf_bytes = b""
     bsize = len(chunks[0])
@@ -170,3 +188,97 @@ def test_chunk_overflow_truncate_fail_large_inherited_field():
     )
     with pytest.warns(GELFTruncationFailureWarning):
         list(GELFTruncatingChunker(2).chunk_message(message))
+
+
+@pytest.mark.parametrize(
+    "compress, short_message, attempts",
+    [
+        (True, " ".join(str(i) for i in range(100000)), 3),
+        (False, " ".join(str(i) for i in range(100000)), 1),
+        # the packed bytes per character vary along the message
+        (True, "\u20ac" * 20000 + " ".join(str(i) for i in range(100000)), 5),
+        (False, "\u20ac" * 20000 + " ".join(str(i) for i in range(100000)), 2),
+    ],
+)
+def test_truncate_gelf_dict(compress, short_message, attempts):
+    """Test that a chunk overflowing GELF dictionary is truncated to nearly
+    the longest short_message that fits, in a few packing attempts"""
+    packed = []
+
+    def gelf_packer(gelf_dict):
+        packed.append(gelf_dict["short_message"])
+        return BaseGELFHandler._pack_gelf_dict(gelf_dict)
+
+    gelf_chunker = GELFTruncatingChunker(
+        chunk_size=100, compress=compress, gelf_packer=gelf_packer
+    )
+    gelf_dict = BaseGELFHandler()._make_gelf_dict(
+        logging.LogRecord(
+            "test_truncate_gelf_dict",
+            logging.INFO,
+            None,
+            None,
+            short_message,
+            None,
+            None,
+        )
+    )
+    message = gelf_chunker.truncate_gelf_dict(gelf_dict)
+
+    # the simplified GELF message without short_message is packed first
+    assert len(packed) <= 1 + attempts
+    assert len(message) <= gelf_chunker.chunk_size * 128
+    # within a chunk of the size limit, compressed messages are not cut to
+    # their uncompressed size limit
+    assert len(message) > gelf_chunker.chunk_size * 127
+    if compress:
+        message = zlib.decompress(message)
+    gelf_json = json.loads(message.decode("UTF-8"))
+    assert gelf_json["_chunk_overflow"] is True
+    assert short_message.startswith(gelf_json["short_message"])
+
+
+def test_message_ids():
+    """Test that the message ids of a process are counted from a random
+    value and wrap around 64 bits"""
+    with mock.patch("os.urandom", return_value=b"\xff" * 8):
+        generator = GELFMessageIdGenerator()
+    assert [0xFFFFFFFFFFFFFFFF, 0, 1] == [generator() for _ in range(3)]
+    assert GELFMessageIdGenerator()() != generator()
+
+
+def test_message_ids_chunks():
+    """Test that the chunks of every GELF message share a new message id"""
+    chunker = BaseGELFChunker(chunk_size=2)
+    message_ids = [
+        set(chunk[2:10] for chunk in chunker.chunk_message(b"12345")) for _ in range(2)
+    ]
+    assert 1 == len(message_ids[0]) == len(message_ids[1])
+    assert message_ids[0] != message_ids[1]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_message_ids_fork():
+    """Test that a forked process does not reuse the message ids of its
+    parent"""
+    generator = GELFMessageIdGenerator()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, struct.pack("=Q", generator()))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    child_id = struct.unpack("=Q", os.read(read_fd, 8))[0]
+    os.close(read_fd)
+    os.close(write_fd)
+    assert child_id not in (generator(), generator() - 1)
+
+
+def test_message_ids_pid_changed():
+    """Test that a fork is detected from the process id without
+    os.register_at_fork"""
+    with mock.patch("graypy.handler._REGISTER_AT_FORK", None):
+        generator = GELFMessageIdGenerator()
+    first = generator()
+    with mock.patch("os.getpid", return_value=generator._pid + 1):
+        assert first + 1 != generator()
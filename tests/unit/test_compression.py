@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :mod:`graypy.compression`"""
+
+import json
+import os
+import zlib
+
+import pytest
+
+from graypy.compression import CompressionPolicy, decompress
+from graypy.handler import BaseGELFHandler, GELFHTTPHandler
+
+from tests.unit.helper import MOCK_LOG_RECORD, MockGELFHTTPServer
+
+DATA = b'{"short_message":"' + b"compressible " * 100 + b'"}'
+
+
+@pytest.mark.parametrize("kwargs", [{"framing": "lz4"}, {"level": 10}, {"level": -2}])
+def test_invalid_policy(kwargs):
+    with pytest.raises(ValueError):
+        CompressionPolicy(**kwargs)
+
+
+@pytest.mark.parametrize(
+    "framing,content_encoding,magic",
+    [("zlib", "deflate", b"\x78"), ("gzip", "gzip", b"\x1f\x8b")],
+)
+def test_framing(framing, content_encoding, magic):
+    policy = CompressionPolicy(framing=framing)
+    compressed, encoding = policy.compress(DATA)
+    assert content_encoding == encoding
+    assert compressed.startswith(magic)
+    assert DATA == decompress(compressed)
+
+
+def test_decompress_uncompressed():
+    assert DATA == decompress(DATA)
+
+
+def test_min_size():
+    policy = CompressionPolicy(min_size=len(DATA) + 1)
+    assert (DATA, None) == policy.compress(DATA)
+    assert (1, 0) == (policy.uncompressed, policy.compressed)
+
+    policy.min_size = len(DATA)
+    compressed, _ = policy.compress(DATA)
+    assert (1, 1) == (policy.uncompressed, policy.compressed)
+    assert len(DATA) == policy.bytes_in
+    assert len(compressed) == policy.bytes_out
+    assert len(DATA) - len(compressed) == policy.bytes_saved > 0
+    assert policy.cpu_time >= 0
+
+
+def test_adaptive():
+    """Test that adaptive compression skips poorly compressible GELF logs
+    but keeps probing them"""
+    policy = CompressionPolicy(adaptive=True, probe_interval=3)
+    data = os.urandom(1024)
+    assert policy.compress(data)[1] == "deflate"
+    assert policy.ratio > policy.max_ratio
+    encodings = [policy.compress(data)[1] for _ in range(6)]
+    assert [None, None, "deflate", None, None, "deflate"] == encodings
+    assert policy.bytes_saved < 0
+
+    # compressible GELF logs bring the moving average back down
+    while policy.ratio > policy.max_ratio:
+        policy.compress(DATA)
+    assert policy.compress(DATA)[1] == "deflate"
+
+
+@pytest.mark.parametrize("compress", [True, False, CompressionPolicy(level=9)])
+def test_handler_compress(compress):
+    handler = BaseGELFHandler(compress=compress)
+    assert compress is handler.compress
+    pickle = handler.makePickle(MOCK_LOG_RECORD)
+    if compress:
+        assert isinstance(handler.compression, CompressionPolicy)
+        assert handler.compression.compressed == 1
+        pickle = zlib.decompress(pickle)
+    else:
+        assert handler.compression is None
+    assert json.loads(pickle.decode("utf-8"))
+
+
+def test_http_content_encoding():
+    """Test that the HTTP content encoding follows how each GELF log
+    was compressed"""
+    policy = CompressionPolicy(min_size=1000, framing="gzip")
+    with MockGELFHTTPServer() as server:
+        handler = GELFHTTPHandler("127.0.0.1", server.port, compress=policy)
+        handler.handle(MOCK_LOG_RECORD)
+        policy.min_size = 0
+        handler.handle(MOCK_LOG_RECORD)
+        handler.close()
+    assert [None, "gzip"] == server.content_encodings
+    bodies = [json.loads(decompress(body).decode("utf-8")) for body in server.bodies]
+    assert bodies[0]["short_message"] == bodies[1]["short_message"]
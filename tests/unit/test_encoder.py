@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for the GELF JSON encoders of :mod:`graypy.encoder`"""
+
+import datetime
+import enum
+import json
+import uuid
+
+import pytest
+
+from graypy.encoder import JSON_ENCODERS, JSONEncoder, get_json_encoder
+from graypy.handler import BaseGELFHandler
+
+from tests.unit.helper import MOCK_LOG_RECORD
+
+GELF_DICT = {
+    "version": "1.0",
+    "host": "localhost",
+    "short_message": 'Mensaje de registro espa\xf1ol € "quoted" / \\',
+    "timestamp": 1568234872.5425665,
+    "level": 6,
+    "facility": "test",
+    "_list": ["a", 1, 2.5, None, True],
+    "_nested": {"key": ["value"]},
+}
+
+
+@pytest.fixture(params=sorted(JSON_ENCODERS))
+def json_encoder(request):
+    return get_json_encoder(request.param)
+
+
+def test_encode(json_encoder):
+    """Test that every GELF JSON encoder produces the same GELF log as the
+    python standard library :mod:`json` module"""
+    packed = json_encoder.encode(GELF_DICT, default=BaseGELFHandler._object_to_json)
+    assert isinstance(packed, bytes)
+    assert GELF_DICT == json.loads(packed.decode("utf-8"))
+
+
+def test_encode_default(json_encoder):
+    timestamp = datetime.datetime(2001, 2, 3, 4, 5, 6, 7)
+    packed = json_encoder.encode(
+        {"_ts": timestamp, "_obj": object}, default=BaseGELFHandler._object_to_json
+    )
+    assert {"_ts": timestamp.isoformat(), "_obj": repr(object)} == json.loads(
+        packed.decode("utf-8")
+    )
+
+
+def test_encode_dataclass(json_encoder):
+    """Test that dataclass instances are serialized by ``default`` like by
+    the python standard library :mod:`json` module"""
+    dataclasses = pytest.importorskip("dataclasses")
+    Point = dataclasses.make_dataclass("Point", ["x"])
+    obj = {"_point": Point(1)}
+    default = BaseGELFHandler._object_to_json
+    assert JSONEncoder().encode(obj, default=default) == json_encoder.encode(
+        obj, default=default
+    )
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+@pytest.mark.parametrize(
+    "value, orjson_value",
+    [
+        (uuid.UUID(int=1), "00000000-0000-0000-0000-000000000001"),
+        (Color.RED, "red"),
+        (float("nan"), None),
+    ],
+)
+def test_encode_orjson_differences(json_encoder, value, orjson_value):
+    """Test the documented differences of the orjson encoder with the python
+    standard library :mod:`json` module"""
+    obj = {"_value": value}
+    default = BaseGELFHandler._object_to_json
+    packed = json_encoder.encode(obj, default=default)
+    if json_encoder.name == "orjson":
+        assert {"_value": orjson_value} == json.loads(packed.decode("utf-8"))
+    else:
+        assert JSONEncoder().encode(obj, default=default) == packed
+
+
+def test_encode_string(json_encoder):
+    string = GELF_DICT["short_message"]
+    assert string == json.loads(json_encoder.encode_string(string).decode("utf-8"))
+
+
+@pytest.mark.parametrize("obj", [{1: "int key"}, {"_big": 2**70}])
+def test_encode_fallback(json_encoder, obj):
+    """Test that objects rejected by third party JSON libraries are still
+    serialized"""
+    expected = json.loads(json.dumps(obj))
+    assert expected == json.loads(json_encoder.encode(obj).decode("utf-8"))
+
+
+def test_get_json_encoder():
+    assert get_json_encoder().name in JSON_ENCODERS
+    json_encoder = JSONEncoder()
+    assert json_encoder is get_json_encoder(json_encoder)
+
+
+def test_get_invalid_json_encoder():
+    with pytest.raises(ValueError):
+        get_json_encoder("foobar")
+
+
+def test_handler_json_encoder(json_encoder):
+    handler = BaseGELFHandler(compress=False, json_encoder=json_encoder)
+    assert json_encoder is handler.json_encoder
+    gelf_dict = json.loads(handler.makePickle(MOCK_LOG_RECORD).decode("utf-8"))
+    assert "Log message" == gelf_dict["short_message"]
@@ -15,6 +15,7 @@ import json
 import logging
 import socket
 import sys
+import threading
 import zlib
 
 import mock
@@ -23,7 +24,7 @@ import pytest
 from graypy.handler import BaseGELFHandler, GELFHTTPHandler, GELFTLSHandler
 
 from tests.helper import handler, logger, formatted_logger
-from tests.unit.helper import MOCK_LOG_RECORD, MOCK_LOG_RECORD_NAME
+from tests.unit.helper import MOCK_LOG_RECORD, MOCK_LOG_RECORD_NAME, wait_for
 
 UNICODE_REPLACEMENT = u"\ufffd"
 
@@ -68,6 +69,10 @@ def get_mock_send_arg(mock_send):
         (u"\u20AC".encode("utf-8"), u"\u20AC"),
         (b"\xc3", UNICODE_REPLACEMENT),
         (["a", b"\xc3"], ["a", UNICODE_REPLACEMENT]),
+        (
+            {b"\xc3": b"\xc3", "a": ("b",)},
+            {UNICODE_REPLACEMENT: UNICODE_REPLACEMENT, "a": ["b"]},
+        ),
     ],
 )
 def test_pack(message, expected):
@@ -76,6 +81,22 @@ def test_pack(message, expected):
     )
 
 
+def test_sanitize_to_unicode_no_copy():
+    """Test that objects without strings to convert are not copied"""
+    gelf_dict = {"a": ["b", ("c", 1)], "d": {"e": None}}
+    assert gelf_dict is BaseGELFHandler._sanitize_to_unicode(gelf_dict)
+
+
+def test_sanitize_to_unicode_copy():
+    """Test that only the containers holding strings to convert are copied"""
+    unchanged = ["b"]
+    gelf_dict = {"a": unchanged, "c": (b"d",)}
+    sanitized = BaseGELFHandler._sanitize_to_unicode(gelf_dict)
+    assert {"a": ["b"], "c": (u"d",)} == sanitized
+    assert (b"d",) == gelf_dict["c"]
+    assert unchanged is sanitized["a"]
+
+
 def test_manual_exc_info_handler(logger, mock_send):
     """Check that a the ``full_message`` traceback info is passed when
     the ``exc_info=1`` flag is given within a log message"""
@@ -188,6 +209,212 @@ def test_resolve_host():
     assert "" == BaseGELFHandler._resolve_host(False, "")
 
 
+def test_host_cache():
+    """Test that the ``host`` GELF field is resolved once and cached"""
+    with mock.patch.object(
+        BaseGELFHandler, "_resolve_host", return_value="foobar"
+    ) as mock_resolve_host:
+        handler = BaseGELFHandler(fqdn=True)
+        for _ in range(3):
+            assert "foobar" == handler._make_gelf_dict(MOCK_LOG_RECORD)["host"]
+    assert 1 == mock_resolve_host.call_count
+    assert 1 == handler.host_cache_misses
+    assert 3 == handler.host_cache_hits
+
+
+def test_host_cache_refresh():
+    """Test refreshing the cached ``host`` GELF field explicitly and on
+    ``host_refresh_interval``"""
+    handler = BaseGELFHandler(localname="foo", host_refresh_interval=0)
+    handler.localname = "bar"
+    # resolved again in the background
+    handler._make_gelf_dict(MOCK_LOG_RECORD)
+    assert wait_for(lambda: 2 == handler.host_cache_misses)
+    handler.host_refresh_interval = None
+    assert wait_for(lambda: not handler._host_refreshing)
+    assert "bar" == handler._make_gelf_dict(MOCK_LOG_RECORD)["host"]
+    handler.localname = "baz"
+    assert "bar" == handler._make_gelf_dict(MOCK_LOG_RECORD)["host"]
+    assert "baz" == handler.refresh_host()
+    assert "baz" == handler._make_gelf_dict(MOCK_LOG_RECORD)["host"]
+    assert 3 == handler.host_cache_misses
+
+
+def test_host_cache_refresh_does_not_block():
+    """Test that a slow resolution of the ``host`` GELF field does not stall
+    the logging calls"""
+    handler = BaseGELFHandler(localname="foo", host_refresh_interval=0)
+    resolving = threading.Event()
+    resolved = threading.Event()
+
+    def resolve_host(fqdn, localname):
+        resolving.set()
+        resolved.wait(5)
+        return "bar"
+
+    with mock.patch.object(handler, "_resolve_host", side_effect=resolve_host):
+        for _ in range(3):
+            assert "foo" == handler._make_gelf_dict(MOCK_LOG_RECORD)["host"]
+        assert resolving.wait(5)
+        resolved.set()
+        assert wait_for(lambda: not handler._host_refreshing)
+    # resolved once by a single background thread
+    assert 2 == handler.host_cache_misses
+
+
+@pytest.mark.parametrize(
+    "handler_kwargs",
+    [
+        {},
+        {"debugging_fields": False, "extra_fields": False},
+        {"debugging_fields": False, "extra_fields": False, "level_names": True},
+        {"facility": "foobar_facility", "level_names": True},
+        {"facility": "", "debugging_fields": False, "extra_fields": False},
+        {"json_encoder": "json"},
+        {"level_names": True, "extra_fields_rename": {"foo": "file"}},
+        {"extra_fields_allowlist": ["foo"], "debugging_fields": False},
+    ],
+)
+@pytest.mark.parametrize(
+    "extra",
+    [
+        {},
+        {"foo": "bar", "logger": "baz", "ts": datetime.datetime.now()},
+        {"function": "overridden", "big": 2 ** 70, "raw": b"\xff"},
+    ],
+)
+def test_gelf_template(handler_kwargs, extra):
+    """Test that log records serialized by the compiled GELF log template
+    match the dictionary representing their GELF log"""
+    handler = BaseGELFHandler(compress=False, **handler_kwargs)
+    record = logging.LogRecord(
+        "test_gelf_template", logging.INFO, None, None, u"\u20AC \"%s\"", ("a",), None
+    )
+    record.__dict__.update(extra)
+    expected = handler._pack_gelf_dict(handler._make_gelf_dict(record))
+    assert json.loads(expected.decode("utf-8")) == json.loads(
+        handler.makePickle(record).decode("utf-8")
+    )
+
+
+@pytest.mark.parametrize("level_names", [True, False])
+def test_gelf_template_without_bytes_formatting(level_names):
+    """Test the compiled GELF log template of the python versions unable to
+    %-format bytes"""
+    handler_kwargs = dict(
+        compress=False,
+        debugging_fields=False,
+        extra_fields=False,
+        level_names=level_names,
+    )
+    expected = BaseGELFHandler(**handler_kwargs).makePickle(MOCK_LOG_RECORD)
+    with mock.patch("graypy.handler._BYTES_FORMATTING", False):
+        handler = BaseGELFHandler(**handler_kwargs)
+    assert json.loads(expected.decode("utf-8")) == json.loads(
+        handler.makePickle(MOCK_LOG_RECORD).decode("utf-8")
+    )
+
+
+def test_gelf_template_skips_gelf_dict():
+    """Test that log records without exception information are serialized
+    without building a dictionary representing their GELF log"""
+    handler = BaseGELFHandler(compress=False)
+    with mock.patch.object(handler, "_make_gelf_dict") as mock_make_gelf_dict:
+        handler.makePickle(MOCK_LOG_RECORD)
+    assert not mock_make_gelf_dict.called
+
+
+def test_gelf_template_make_gelf_dict_overridden():
+    """Test that a subclass overriding how the GELF dictionary is built is
+    not bypassed by the compiled GELF log template"""
+
+    class CustomGELFHandler(BaseGELFHandler):
+        def _make_gelf_dict(self, record):
+            gelf_dict = super(CustomGELFHandler, self)._make_gelf_dict(record)
+            gelf_dict["_custom"] = "custom"
+            return gelf_dict
+
+    handler = CustomGELFHandler(compress=False)
+    decoded = json.loads(handler.makePickle(MOCK_LOG_RECORD).decode("utf-8"))
+    assert "custom" == decoded["_custom"]
+    assert handler._gelf_template_packer is None
+    # the base class still compiles its GELF log template
+    assert BaseGELFHandler(compress=False)._gelf_template_packer is not None
+
+
+def test_set_custom_facility_overridden():
+    """Test that a subclass overriding how the custom facility is set is
+    not bypassed by the compiled GELF log template"""
+
+    class CustomGELFHandler(BaseGELFHandler):
+        @staticmethod
+        def _set_custom_facility(gelf_dict, facility_value, record):
+            gelf_dict.update({"facility": facility_value, "_source": record.name})
+
+    handler = CustomGELFHandler(compress=False, facility="custom")
+    decoded = json.loads(handler.makePickle(MOCK_LOG_RECORD).decode("utf-8"))
+    assert "custom" == decoded["facility"]
+    assert MOCK_LOG_RECORD_NAME == decoded["_source"]
+    assert "_logger" not in decoded
+    assert handler._gelf_template_packer is None
+
+
+def test_gelf_template_recompiled():
+    """Test that changing handler options after construction is taken into
+    account by the compiled GELF log template"""
+    handler = BaseGELFHandler(compress=False)
+    handler.facility = "foobar_facility"
+    handler.debugging_fields = False
+    handler.level_names = True
+    decoded = json.loads(handler.makePickle(MOCK_LOG_RECORD).decode("utf-8"))
+    assert "foobar_facility" == decoded["facility"]
+    assert MOCK_LOG_RECORD_NAME == decoded["_logger"]
+    assert "INFO" == decoded["level_name"]
+    assert "file" not in decoded
+
+
+def test_extra_fields_skipped():
+    """Test that standard log record attributes and private attributes are
+    not added as extra fields"""
+    gelf_dict = dict()
+    BaseGELFHandler._add_extra_fields(gelf_dict, MOCK_LOG_RECORD)
+    assert "_msg" not in gelf_dict
+    assert "_name" not in gelf_dict
+    assert not any(key.startswith("__") for key in gelf_dict)
+
+
+@pytest.mark.parametrize(
+    "handler_kwargs,expected",
+    [
+        ({}, {"_foo": 1, "_bar": 2, "_baz": 3}),
+        ({"extra_fields_allowlist": ["foo", "bar", "msg"]}, {"_foo": 1, "_bar": 2}),
+        ({"extra_fields_denylist": ["foo"]}, {"_bar": 2, "_baz": 3}),
+        (
+            {
+                "extra_fields_allowlist": ["foo", "bar"],
+                "extra_fields_denylist": ["bar"],
+            },
+            {"_foo": 1},
+        ),
+        ({"extra_fields_rename": {"foo": "qux"}}, {"_qux": 1, "_bar": 2, "_baz": 3}),
+    ],
+)
+def test_extra_fields_filtering(handler_kwargs, expected):
+    handler = BaseGELFHandler(debugging_fields=False, **handler_kwargs)
+    record = logging.LogRecord(
+        "test_extra_fields_filtering", logging.INFO, None, None, "msg", (), None
+    )
+    record.__dict__.update({"foo": 1, "bar": 2, "baz": 3})
+    gelf_dict = handler._make_gelf_dict(record)
+    assert expected == dict(
+        (key, value)
+        for key, value in gelf_dict.items()
+        if key in ("_foo", "_bar", "_baz", "_qux")
+    )
+    decoded = json.loads(zlib.decompress(handler.makePickle(record)).decode("utf-8"))
+    assert gelf_dict == decoded
+
+
 def test_set_custom_facility():
     gelf_dict = dict()
     facility = "test facility"
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :mod:`graypy.metrics`"""
+
+import logging
+import socket
+import threading
+import warnings
+
+import mock
+import pytest
+
+from graypy.handler import (
+    BaseGELFChunker,
+    GELFTCPHandler,
+    GELFTruncatingChunker,
+    GELFUDPHandler,
+)
+from graypy.metrics import COUNTERS, STAGES, LatencyHistogram, Metrics, clock
+
+from tests.unit.helper import MOCK_LOG_RECORD, MockGELFTCPServer
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    yield sock
+    sock.close()
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for microseconds in range(1, 101):
+        histogram.add(microseconds / 1e6)
+    assert 100 == histogram.count
+    assert histogram.max == pytest.approx(100e-6)
+    # buckets are at most 25% wide
+    assert 50e-6 <= histogram.percentile(50) <= 50e-6 * 1.25
+    assert 99e-6 <= histogram.percentile(99) <= 100e-6
+    assert histogram.percentile(0) == pytest.approx(2e-6)
+
+
+def test_histogram_long_durations():
+    histogram = LatencyHistogram()
+    histogram.add(3600.0)
+    assert 3600.0 == histogram.percentile(50)
+
+
+def test_empty_snapshot():
+    snapshot = Metrics().snapshot()
+    assert set(COUNTERS) == set(snapshot["counters"])
+    assert set(STAGES) == set(snapshot["stages"])
+    assert None is snapshot["stages"]["send"]["p99"]
+
+
+def test_invalid_sample_rate():
+    with pytest.raises(ValueError):
+        Metrics(sample_rate=2)
+
+
+def test_concurrent_counts():
+    metrics = Metrics(sample_rate=1)
+
+    def count():
+        for _ in range(10000):
+            metrics.sample()
+            metrics.count("sent")
+            metrics.count("bytes", 2)
+            metrics.timed("send", clock())
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = metrics.snapshot()
+    assert 80000 == snapshot["counters"]["records"]
+    assert 80000 == snapshot["counters"]["sent"]
+    assert 160000 == snapshot["counters"]["bytes"]
+    assert 80000 == snapshot["stages"]["send"]["count"]
+
+
+def test_sampled_per_thread():
+    metrics = Metrics(sample_rate=1)
+    assert metrics.sample()
+    sampled = []
+    thread = threading.Thread(target=lambda: sampled.append(metrics.sampled))
+    thread.start()
+    thread.join()
+    assert [False] == sampled
+    assert metrics.sampled
+
+
+def test_udp_handler_metrics(receiver):
+    handler = GELFUDPHandler(
+        "127.0.0.1", receiver.getsockname()[1], metrics=Metrics(sample_rate=1)
+    )
+    size = len(handler.makePickle(MOCK_LOG_RECORD))
+    handler.metrics.reset()
+    for _ in range(3):
+        handler.handle(MOCK_LOG_RECORD)
+    snapshot = handler.metrics.snapshot(reset=True)
+    counters = snapshot["counters"]
+    assert 3 == counters["records"]
+    assert 3 == counters["compressed"]
+    assert 3 == counters["sent"]
+    assert 3 * size == counters["bytes"]
+    for stage in ("format", "serialize", "compress", "send"):
+        assert 3 == snapshot["stages"][stage]["count"]
+        assert snapshot["stages"][stage]["p50"] > 0
+    assert 0 == snapshot["stages"]["chunk"]["count"]
+    assert 0 == handler.metrics.snapshot()["counters"]["records"]
+    handler.close()
+
+
+def test_sampling(receiver):
+    handler = GELFUDPHandler(
+        "127.0.0.1", receiver.getsockname()[1], metrics=Metrics(sample_rate=0)
+    )
+    handler.handle(MOCK_LOG_RECORD)
+    snapshot = handler.metrics.snapshot()
+    assert 1 == snapshot["counters"]["sent"]
+    assert all(0 == stage["count"] for stage in snapshot["stages"].values())
+    handler.close()
+
+
+@pytest.mark.parametrize(
+    "chunker,truncated", [(BaseGELFChunker(100), 0), (GELFTruncatingChunker(100), 1)]
+)
+def test_chunk_overflow_metrics(receiver, chunker, truncated):
+    handler = GELFUDPHandler(
+        "127.0.0.1",
+        receiver.getsockname()[1],
+        gelf_chunker=chunker,
+        compress=False,
+        metrics=Metrics(sample_rate=1),
+    )
+    record = logging.LogRecord(
+        "test_chunk_overflow_metrics", logging.INFO, None, None, "x" * 20000, None, None
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        handler.handle(record)
+    counters = handler.metrics.snapshot()["counters"]
+    assert 1 == counters["chunk_overflows"]
+    assert truncated == counters["truncated"]
+    assert truncated == counters["sent"]
+    assert 1 == handler.metrics.snapshot()["stages"]["chunk"]["count"]
+    handler.close()
+
+
+def test_tcp_handler_metrics():
+    server = MockGELFTCPServer()
+    handler = GELFTCPHandler("127.0.0.1", server.port, coalesce_bytes=1 << 20)
+    handler.handle(MOCK_LOG_RECORD)
+    handler.handle(MOCK_LOG_RECORD)
+    handler.flush()
+    assert 2 == len(server.frames(2))
+    snapshot = handler.metrics.snapshot()
+    assert 2 == snapshot["counters"]["sent"]
+    # the coalesced write is always timed
+    assert 1 == snapshot["stages"]["send"]["count"]
+    handler.close()
+    server.close()
+
+
+def test_unsent_and_errors():
+    handler = GELFTCPHandler("127.0.0.1", 12201)
+    with mock.patch.object(handler, "makeSocket", side_effect=socket.error):
+        handler.handle(MOCK_LOG_RECORD)
+    assert 1 == handler.metrics.unsent
+    with mock.patch.object(handler, "makePickle", side_effect=ValueError):
+        with mock.patch("logging.raiseExceptions", False):
+            handler.handle(MOCK_LOG_RECORD)
+    assert 1 == handler.metrics.errors
+    handler.close()
+
+
+def test_callback(receiver):
+    callback = mock.Mock()
+    metrics = Metrics(callback=callback, interval=0, sample_rate=1)
+    handler = GELFUDPHandler("127.0.0.1", receiver.getsockname()[1], metrics=metrics)
+    handler.handle(MOCK_LOG_RECORD)
+    assert callback.called
+    snapshot = callback.call_args[0][0]
+    assert 1 == snapshot["counters"]["records"]
+    handler.close()
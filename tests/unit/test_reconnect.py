@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :mod:`graypy.reconnect`"""
+
+import socket
+
+import mock
+import pytest
+
+from graypy.handler import GELFTCPHandler
+from graypy.reconnect import Backoff, OUTAGE_BUFFER, OUTAGE_DROP
+
+from tests.unit.helper import (
+    MOCK_LOG_RECORD,
+    MockGELFTCPServer,
+    free_port,
+    make_log_record,
+    wait_for,
+)
+
+
+def test_backoff_delays():
+    backoff = Backoff(initial=1, multiplier=3, cap=20, jitter=0)
+    assert [1, 3, 9, 20, 20] == [backoff.delay(attempt) for attempt in range(5)]
+    assert 20 == backoff.delay(10000)
+
+
+def test_backoff_jitter():
+    backoff = Backoff(initial=10, cap=10, jitter=0.5)
+    delays = [backoff.delay(0) for _ in range(100)]
+    assert all(5 <= delay <= 10 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"initial": -1}, {"multiplier": 0.5}, {"jitter": 2}]
+)
+def test_backoff_invalid(kwargs):
+    with pytest.raises(ValueError):
+        Backoff(**kwargs)
+
+
+def test_invalid_outage_policy():
+    with pytest.raises(ValueError):
+        GELFTCPHandler("127.0.0.1", backoff=Backoff(), outage_policy="retry")
+
+
+def test_outage_does_not_block_callers():
+    handler = GELFTCPHandler(
+        "127.0.0.1",
+        free_port(),
+        backoff=Backoff(initial=60),
+        outage_policy=OUTAGE_DROP,
+    )
+    with mock.patch.object(
+        handler, "makeSocket", side_effect=socket.error
+    ) as make_socket:
+        for _ in range(10):
+            handler.handle(MOCK_LOG_RECORD)
+    # a single connection attempt from the caller, the others are left
+    # to the reconnection thread
+    assert 1 == make_socket.call_count
+    assert handler.in_outage
+    assert 10 == handler.dropped
+    handler.close()
+    assert not handler.in_outage
+
+
+def test_outage_buffer_sent_once_reconnected():
+    port = free_port()
+    handler = GELFTCPHandler(
+        "127.0.0.1",
+        port,
+        backoff=Backoff(initial=0.05, jitter=0),
+        outage_policy=OUTAGE_BUFFER,
+        outage_buffer_size=3,
+    )
+    for i in range(5):
+        handler.handle(make_log_record(i))
+    assert handler.in_outage
+    assert 2 == handler.dropped
+
+    server = MockGELFTCPServer(port)
+    assert wait_for(lambda: not handler.in_outage)
+    handler.handle(make_log_record(5))
+    messages = [frame["short_message"] for frame in server.frames(4)]
+    assert ["2", "3", "4", "5"] == messages
+    handler.close()
+    server.close()
+
+
+def test_coalesced_frames_buffered():
+    port = free_port()
+    handler = GELFTCPHandler(
+        "127.0.0.1",
+        port,
+        coalesce_bytes=1 << 20,
+        backoff=Backoff(initial=0.05, jitter=0),
+        outage_policy=OUTAGE_BUFFER,
+    )
+    handler.handle(make_log_record(0))
+    handler.flush()
+    assert handler.in_outage
+
+    server = MockGELFTCPServer(port)
+    assert wait_for(lambda: not handler.in_outage)
+    assert ["0"] == [frame["short_message"] for frame in server.frames(1)]
+    handler.close()
+    server.close()
+
+
+def test_lost_connection_starts_outage():
+    handler = GELFTCPHandler(
+        "127.0.0.1", backoff=Backoff(initial=60), outage_policy=OUTAGE_BUFFER
+    )
+    handler.sock = mock.Mock(spec=socket.socket)
+    handler.sock.sendall.side_effect = socket.error
+    sock = handler.sock
+    with mock.patch.object(handler, "makeSocket", side_effect=socket.error):
+        handler.handle(MOCK_LOG_RECORD)
+    sock.close.assert_called_once_with()
+    assert handler.in_outage
+    assert 1 == len(handler._outage_buffer)
+    handler.close()
+    assert 1 == handler.dropped
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.resolver.CachedResolver`"""
+
+import socket
+
+import mock
+import pytest
+
+from graypy.handler import GELFHTTPHandler, GELFTCPHandler, GELFUDPHandler
+from graypy.resolver import CachedResolver, create_connection
+
+from tests.unit.helper import (
+    MOCK_LOG_RECORD,
+    MockGELFHTTPServer,
+    MockGELFTCPServer,
+    wait_for,
+)
+
+
+def addrinfo(address, port=12201):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+
+@pytest.fixture
+def getaddrinfo():
+    with mock.patch(
+        "socket.getaddrinfo", return_value=addrinfo("10.0.0.1")
+    ) as getaddrinfo:
+        yield getaddrinfo
+
+
+def test_cached(getaddrinfo):
+    resolver = CachedResolver()
+    for _ in range(3):
+        assert (socket.AF_INET, ("10.0.0.1", 12201)) == resolver.resolve(
+            "graylog", 12201
+        )
+    assert 1 == getaddrinfo.call_count
+    assert 1 == resolver.misses
+    assert 2 == resolver.hits
+    # UDP addresses are cached on their own
+    resolver.resolve("graylog", 12201, socket.SOCK_DGRAM)
+    assert 2 == getaddrinfo.call_count
+
+
+def test_refreshed_in_background(getaddrinfo):
+    resolver = CachedResolver(ttl=60)
+    resolver.resolve("graylog", 12201)
+    resolver.expire("graylog", 12201)
+    getaddrinfo.return_value = addrinfo("10.0.0.2")
+    # the expired address is returned while being resolved again
+    assert ("10.0.0.1", 12201) == resolver.resolve("graylog", 12201)[1]
+    assert wait_for(lambda: resolver.refreshes == 1)
+    assert ("10.0.0.2", 12201) == resolver.resolve("graylog", 12201)[1]
+
+
+def test_refresh_failure_keeps_address(getaddrinfo):
+    resolver = CachedResolver(ttl=60)
+    resolver.resolve("graylog", 12201)
+    resolver.expire("graylog", 12201)
+    getaddrinfo.side_effect = socket.gaierror
+    resolver.resolve("graylog", 12201)
+    assert wait_for(lambda: resolver.failures == 1)
+    assert ("10.0.0.1", 12201) == resolver.resolve("graylog", 12201)[1]
+    # not resolved again until the ttl elapses
+    assert 2 == getaddrinfo.call_count
+
+
+def test_connect_tries_every_address():
+    server = MockGELFTCPServer()
+    resolver = CachedResolver()
+    handler = GELFTCPHandler("graylog", server.port, resolver=resolver)
+    addresses = [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 1)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", server.port)),
+    ]
+    with mock.patch("socket.getaddrinfo", return_value=addresses):
+        handler.handle(MOCK_LOG_RECORD)
+    handler.close()
+    assert 1 == len(server.frames(1))
+    server.close()
+
+
+def test_connect_no_address():
+    resolver = CachedResolver()
+    with mock.patch("socket.getaddrinfo", return_value=[]):
+        with pytest.raises(socket.error, match="empty list"):
+            create_connection(resolver, "graylog", 12201, 1)
+
+
+def test_ttl_zero(getaddrinfo):
+    resolver = CachedResolver(ttl=0)
+    resolver.resolve("graylog", 12201)
+    resolver.resolve("graylog", 12201)
+    assert 2 == getaddrinfo.call_count
+    with pytest.raises(ValueError):
+        CachedResolver(ttl=-1)
+
+
+def test_udp_handler_sends_to_cached_address():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+    resolver = CachedResolver()
+    handler = GELFUDPHandler("localhost", receiver.getsockname()[1], resolver=resolver)
+    with mock.patch("socket.getaddrinfo", wraps=socket.getaddrinfo) as getaddrinfo:
+        for _ in range(3):
+            handler.handle(MOCK_LOG_RECORD)
+    for _ in range(3):
+        assert receiver.recv(65536)
+    getaddrinfo.assert_called_once_with(
+        "localhost", receiver.getsockname()[1], socket.AF_INET, socket.SOCK_DGRAM
+    )
+    handler.close()
+    receiver.close()
+
+
+def test_tcp_connect_failure_expires_address():
+    resolver = CachedResolver()
+    server = MockGELFTCPServer()
+    handler = GELFTCPHandler("127.0.0.1", server.port, resolver=resolver)
+    handler.handle(MOCK_LOG_RECORD)
+    handler.close()
+    assert 1 == len(server.frames(1))
+    server.close()
+
+    resolver.expire = mock.Mock()
+    handler = GELFTCPHandler("127.0.0.1", server.port, resolver=resolver)
+    handler.handle(MOCK_LOG_RECORD)
+    resolver.expire.assert_called_once_with(
+        "127.0.0.1", server.port, socket.SOCK_STREAM
+    )
+    handler.close()
+
+
+def test_http_handler_shares_resolver():
+    resolver = CachedResolver()
+    with MockGELFHTTPServer() as server:
+        with mock.patch("socket.getaddrinfo", wraps=socket.getaddrinfo) as getaddrinfo:
+            for _ in range(2):
+                handler = GELFHTTPHandler(
+                    "localhost", server.port, compress=False, resolver=resolver
+                )
+                handler.handle(MOCK_LOG_RECORD)
+                handler.close()
+        assert 1 == getaddrinfo.call_count
+    assert 2 == len(server.bodies)
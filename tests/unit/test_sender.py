@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :class:`graypy.sender.BackgroundSender`, the asynchronous
+mode of the graypy handlers and :class:`graypy.sender.BatchBuffer`"""
+
+import logging
+import threading
+import time
+
+import mock
+import pytest
+
+from graypy.handler import GELFUDPHandler
+from graypy.sender import (
+    BackgroundSender,
+    BatchBuffer,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+)
+
+from tests.unit.helper import MOCK_LOG_RECORD
+
+
+class BlockingTarget(object):
+    """Sender target that blocks until released"""
+
+    def __init__(self):
+        self.items = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, item):
+        self.started.set()
+        self.released.wait(5)
+        self.items.append(item)
+
+
+@pytest.mark.parametrize("queue_size", [0, -1])
+def test_invalid_queue_size(queue_size):
+    with pytest.raises(ValueError):
+        BackgroundSender(lambda item: None, queue_size=queue_size)
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        BackgroundSender(lambda item: None, overflow_policy="foobar")
+
+
+def test_send_and_flush():
+    items = []
+    sender = BackgroundSender(items.append, queue_size=10)
+    for i in range(5):
+        assert sender.put(i)
+    assert sender.flush(5)
+    assert [0, 1, 2, 3, 4] == items
+    sender.close(5)
+
+
+@pytest.mark.parametrize(
+    "overflow_policy,expected",
+    [(OVERFLOW_DROP_OLDEST, ["busy", 2, 3]), (OVERFLOW_DROP_NEWEST, ["busy", 1, 2])],
+)
+def test_overflow_policies(overflow_policy, expected):
+    target = BlockingTarget()
+    sender = BackgroundSender(target, queue_size=2, overflow_policy=overflow_policy)
+    sender.put("busy")
+    assert target.started.wait(5)
+    sender.put(1)
+    sender.put(2)
+    sender.put(3)
+    assert 1 == sender.dropped
+    target.released.set()
+    assert sender.flush(5)
+    assert expected == target.items
+    sender.close(5)
+
+
+def test_flush_timeout():
+    target = BlockingTarget()
+    sender = BackgroundSender(target, queue_size=2, overflow_policy=OVERFLOW_BLOCK)
+    sender.put("busy")
+    assert target.started.wait(5)
+    assert not sender.flush(0.05)
+    target.released.set()
+    assert sender.flush(5)
+    sender.close(5)
+
+
+def test_queued():
+    target = BlockingTarget()
+    sender = BackgroundSender(target, queue_size=5)
+    sender.put("busy")
+    assert target.started.wait(5)
+    sender.put(1)
+    sender.put(2)
+    assert 2 == sender.queued
+    target.released.set()
+    assert sender.flush(5)
+    assert 0 == sender.queued
+    sender.close(5)
+
+
+def test_close_drops_unsent():
+    target = BlockingTarget()
+    sender = BackgroundSender(target, queue_size=5)
+    sender.put("busy")
+    assert target.started.wait(5)
+    sender.put(1)
+    sender.close(0.05)
+    target.released.set()
+    assert not sender.put(2)
+    assert 2 == sender.dropped
+
+
+def test_close_timeout_bounds_join():
+    """Test that draining the queue and stopping the sender thread share
+    the close timeout"""
+    target = BlockingTarget()
+    sender = BackgroundSender(target, queue_size=5)
+    sender.put("busy")
+    assert target.started.wait(5)
+    start = time.time()
+    sender.close(0.2)
+    assert time.time() - start < 0.35
+    target.released.set()
+
+
+def test_async_handler():
+    """Test that log records are sent from the sender thread in the
+    asynchronous mode"""
+    handler = GELFUDPHandler("127.0.0.1", queue_size=10)
+    threads = []
+    with mock.patch.object(
+        handler,
+        "send",
+        side_effect=lambda s: threads.append(threading.current_thread()),
+    ):
+        handler.handle(MOCK_LOG_RECORD)
+        assert handler.flush(5)
+    handler.close()
+    assert 1 == len(threads)
+    assert threading.current_thread() is not threads[0]
+
+
+def test_async_handler_freezes_message_args():
+    """Test that log record arguments mutated after the logging call do not
+    alter the queued log record"""
+    values = [1]
+    record = logging.LogRecord("name", logging.INFO, None, None, "%s", (values,), None)
+    queued_record = GELFUDPHandler._prepare_queued_record(record)
+    values.append(2)
+    assert "[1]" == queued_record.getMessage()
+    assert "[1, 2]" == record.getMessage()
+
+
+def test_async_handler_message_error():
+    """Test that a log record whose message cannot be formatted is handled
+    as an error rather than raised to the logging call"""
+    handler = GELFUDPHandler("127.0.0.1", queue_size=10)
+    record = logging.LogRecord(
+        "name", logging.ERROR, None, None, "%d", ("notanint",), None
+    )
+    with mock.patch.object(logging.Handler, "handleError") as handle_error:
+        handler.handle(record)
+    assert record is handle_error.call_args[0][-1]
+    assert 1 == handler.metrics.errors
+    assert 0 == len(handler.sender._queue)
+    handler.close()
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        BatchBuffer(list, batch_size=0)
+
+
+def test_batch_size():
+    batches = []
+    batch = BatchBuffer(batches.append, batch_size=3, batch_interval=60)
+    for i in range(7):
+        batch.add(i)
+    assert [[0, 1, 2], [3, 4, 5]] == batches
+    batch.close()
+    assert [[0, 1, 2], [3, 4, 5], [6]] == batches
+
+    batch.add(7)
+    assert [7] == batches[-1]
+
+
+def test_batch_interval():
+    flushed = threading.Event()
+    batches = []
+
+    def target(items):
+        batches.append((items, threading.current_thread().name))
+        flushed.set()
+
+    batch = BatchBuffer(target, batch_size=100, batch_interval=0.01)
+    batch.add(1)
+    batch.add(2)
+    assert flushed.wait(5)
+    assert [([1, 2], "graypy-batcher")] == batches
+    batch.close()
+    assert 1 == len(batches)
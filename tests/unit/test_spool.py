@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""pytests for :mod:`graypy.spool`"""
+
+import json
+import os
+import threading
+import time
+import zlib
+
+import pytest
+
+from graypy.handler import GELFHTTPHandler, GELFTCPHandler, GELFUDPHandler
+from graypy.spool import DiskSpool
+
+from tests.unit.helper import (
+    MockGELFHTTPServer,
+    MockGELFTCPServer,
+    free_port,
+    make_log_record,
+    wait_for,
+)
+
+
+class Target(object):
+    """Spool target recording the GELF logs, failing while ``up`` is unset"""
+
+    def __init__(self):
+        self.received = []
+        self.up = threading.Event()
+        self.up.set()
+
+    def __call__(self, data):
+        if not self.up.is_set():
+            return False
+        self.received.append(data)
+        return True
+
+    def wait(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.received) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return self.received
+
+
+def test_retry_interval(tmpdir):
+    """Test that appending GELF logs does not retry a failing target before
+    ``retry_interval``"""
+    spool = DiskSpool(str(tmpdir), retry_interval=60)
+    calls = []
+
+    def target(data):
+        calls.append(data)
+        return False
+
+    spool.start(target)
+    spool.append(b"log")
+    assert wait_for(lambda: calls)
+    for _ in range(50):
+        spool.append(b"log")
+    time.sleep(0.1)
+    assert 1 == len(calls)
+    spool.close()
+
+
+def test_drain_in_order(tmpdir):
+    spool = DiskSpool(str(tmpdir), retry_interval=0.01)
+    target = Target()
+    target.up.clear()
+    spool.start(target)
+    for i in range(10):
+        spool.append(b"log %d" % i)
+    assert 10 == spool.pending
+    target.up.set()
+    assert [b"log %d" % i for i in range(10)] == target.wait(10)
+    assert wait_for(lambda: not spool.pending)
+    assert 10 == spool.drained
+    spool.close()
+    # drained segments are deleted
+    assert [] == os.listdir(str(tmpdir))
+
+
+def test_segments_evicted(tmpdir):
+    # segments of 3 GELF logs of 15 bytes with their length prefix
+    spool = DiskSpool(str(tmpdir), max_bytes=96, segment_bytes=48)
+    for i in range(10):
+        spool.append(b"log %07d" % i)
+    assert 2 == len(os.listdir(str(tmpdir)))
+    assert 6 == spool.dropped
+    assert 4 == spool.pending
+    target = Target()
+    spool.start(target)
+    assert [b"log %07d" % i for i in range(6, 10)] == target.wait(4)
+    spool.close()
+
+
+def test_reload(tmpdir):
+    spool = DiskSpool(str(tmpdir), segment_bytes=32)
+    for i in range(5):
+        spool.append(b"log %d" % i)
+    spool.close()
+    # an incomplete GELF log left by a crash
+    with open(
+        os.path.join(str(tmpdir), sorted(os.listdir(str(tmpdir)))[-1]), "ab"
+    ) as f:
+        f.write(b"\x00\x00\x00\xffpartial")
+
+    spool = DiskSpool(str(tmpdir))
+    assert 5 == spool.pending
+    target = Target()
+    spool.start(target)
+    assert [b"log %d" % i for i in range(5)] == target.wait(5)
+    spool.close()
+
+
+def test_invalid_sizes(tmpdir):
+    with pytest.raises(ValueError):
+        DiskSpool(str(tmpdir), max_bytes=10, segment_bytes=100)
+
+
+def test_udp_handler_does_not_spool(tmpdir):
+    handler = GELFUDPHandler("127.0.0.1")
+    with pytest.raises(ValueError):
+        handler.spool = DiskSpool(str(tmpdir))
+
+
+def test_tcp_handler_spool(tmpdir):
+    port = free_port()
+    handler = GELFTCPHandler("127.0.0.1", port)
+    handler.spool = DiskSpool(str(tmpdir), retry_interval=0.05)
+    for i in range(3):
+        handler.handle(make_log_record(i))
+    assert handler.spool.pending
+
+    server = MockGELFTCPServer(port)
+    assert wait_for(lambda: not handler.spool.pending)
+    handler.handle(make_log_record(3))
+    messages = [frame["short_message"] for frame in server.frames(4)]
+    assert ["0", "1", "2", "3"] == messages
+    handler.close()
+    server.close()
+
+
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_http_handler_spool(tmpdir, batch_size):
+    port = free_port()
+    handler = GELFHTTPHandler("127.0.0.1", port, batch_size=batch_size)
+    handler.spool = DiskSpool(str(tmpdir), retry_interval=0.05)
+    for i in range(4):
+        handler.handle(make_log_record(i))
+    assert 4 == handler.spool.pending
+
+    with MockGELFHTTPServer(port=port) as server:
+        assert wait_for(lambda: not handler.spool.pending)
+        handler.close()
+    assert ["deflate"] * 4 == server.content_encodings
+    messages = [json.loads(zlib.decompress(body)) for body in server.bodies]
+    assert ["0", "1", "2", "3"] == [m["short_message"] for m in messages]